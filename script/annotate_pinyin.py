@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+拼音和声调标注
+为categories.json中每张卡片的word.cn预先生成拼音(word.pinyin)和声调(word.tones)，
+App直接显示，不再需要运行时转换
+
+拼音来自本地的pypinyin词典（按词组消歧多音字），
+pinyin_overrides.json中的词组优先，用于修正词典在本卡组中读错的多音字
+"""
+
+import json
+import os
+import re
+
+from pypinyin import Style, lazy_pinyin
+from pypinyin.contrib.tone_convert import to_tone
+
+from deck_model import load_deck, save_deck
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+
+DEFAULT_OVERRIDES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'pinyin_overrides.json')
+
+# 带数字声调的音节，例如 "chang2"、"lv4"
+SYLLABLE_PATTERN = re.compile(r'^([a-zü]+)([1-5])$')
+
+
+class PinyinConverter:
+    """中文字符串到拼音的转换器，每个不同的字符串只转换一次"""
+
+    def __init__(self, overrides_path=DEFAULT_OVERRIDES):
+        self.overrides = {}
+        if overrides_path and os.path.exists(overrides_path):
+            with open(overrides_path, 'r', encoding='utf-8') as f:
+                self.overrides = {phrase: reading.split() for phrase, reading in json.load(f).items()}
+        self._max_override = max((len(p) for p in self.overrides), default=0)
+        self._cache = {}
+
+    @property
+    def unique_count(self):
+        """已转换的不同字符串数量"""
+        return len(self._cache)
+
+    def _dictionary_syllables(self, chunk):
+        """整段交给词典转换，保留词组上下文"""
+        syllables = []
+        for token in lazy_pinyin(chunk, style=Style.TONE3, neutral_tone_with_five=True):
+            token = token.strip()
+            if token:
+                syllables.extend(token.split())
+        return syllables
+
+    def _syllables(self, text):
+        """覆盖表按最长匹配切分，其余片段交给词典"""
+        syllables = []
+        pending = 0
+        pos = 0
+        while pos < len(text):
+            match = None
+            for length in range(min(self._max_override, len(text) - pos), 0, -1):
+                if text[pos:pos + length] in self.overrides:
+                    match = text[pos:pos + length]
+                    break
+            if match is None:
+                pos += 1
+                continue
+            if pending < pos:
+                syllables.extend(self._dictionary_syllables(text[pending:pos]))
+            syllables.extend(self.overrides[match])
+            pos += len(match)
+            pending = pos
+        if pending < len(text):
+            syllables.extend(self._dictionary_syllables(text[pending:]))
+        return syllables
+
+    def convert(self, text):
+        """
+        返回 (拼音, 声调列表)
+        例如: "长颈鹿" -> ("cháng jǐng lù", [2, 3, 4])
+        非汉字片段原样保留，声调记为0；轻声记为5
+        """
+        cached = self._cache.get(text)
+        get_metrics().cache_result('pinyin', cached is not None)
+        if cached is not None:
+            return cached
+
+        marks = []
+        tones = []
+        for syllable in self._syllables(text):
+            match = SYLLABLE_PATTERN.match(syllable)
+            if match:
+                marks.append(to_tone(syllable))
+                tones.append(int(match.group(2)))
+            else:
+                marks.append(syllable)
+                tones.append(0)
+
+        result = (' '.join(marks), tones)
+        self._cache[text] = result
+        return result
+
+
+def annotate_deck(deck, converter):
+    """一次遍历整个卡组，写入word.pinyin和word.tones，返回标注的卡片数"""
+    annotated = 0
+    for _, card in deck.cards():
+        if not card.word.cn:
+            continue
+        card.word.pinyin, card.word.tones = converter.convert(card.word.cn)
+        annotated += 1
+    return annotated
+
+
+def annotate_pinyin(deck_path, output_path=None, overrides_path=DEFAULT_OVERRIDES):
+    """读取卡组、标注拼音并原子地写回"""
+    output_path = output_path or deck_path
+    metrics = get_metrics()
+
+    with metrics.stage('load', items=1):
+        deck = load_deck(deck_path)
+
+    converter = PinyinConverter(overrides_path)
+    with metrics.stage('annotate'):
+        annotated = annotate_deck(deck, converter)
+    metrics.add_items('annotate', annotated)
+
+    with metrics.stage('write', items=1):
+        save_deck(deck, output_path)
+
+    print(f"标注了 {annotated} 张卡片 ({converter.unique_count} 个不同的中文词)")
+    print(f"结果已保存到: {output_path}")
+    return deck
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='为卡组标注拼音和声调')
+    parser.add_argument('--deck', type=str, default='categories.json', help='卡组文件 (默认: categories.json)')
+    parser.add_argument('--output', type=str, help='输出文件 (默认: 覆盖卡组文件)')
+    parser.add_argument('--overrides', type=str, default=DEFAULT_OVERRIDES, help='多音字覆盖表')
+    parser.add_argument('--text', type=str, help='只转换一段文本并打印结果')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    if args.text:
+        pinyin, tones = PinyinConverter(args.overrides).convert(args.text)
+        print(f"{args.text}: {pinyin} {tones}")
+        return
+
+    print("拼音和声调标注")
+    print("=" * 50)
+
+    with metrics_session('annotate_pinyin', args.metrics, args.profile):
+        annotate_pinyin(args.deck, args.output, args.overrides)
+
+
+if __name__ == "__main__":
+    main()
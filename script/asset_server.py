@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+本地资源开发服务器
+在开发时代替Vite提供 /images/<文件名>、/audio/<语音文件名> 以及卡组输出(categories.json、索引和干扰项分片)，
+行为与生产环境的静态服务器一致：
+- 强ETag：优先使用precache_manifest.py生成的清单中的revision，清单过期或没有收录的文件按内容sha256计算并缓存
+- If-None-Match 命中时返回304，翻卡时不再重复下载
+- Range请求(单个范围)返回206，If-Range不匹配时返回完整文件
+- 客户端接受br/gzip且存在 .br/.gz 预压缩文件时直接返回压缩版本
+- 文件内容通过socket.sendfile()发送，Linux上由内核直接拷贝
+
+启动Vite时设置 ASSET_SERVER=http://127.0.0.1:8080，/images 和 /audio 会被代理到这里(见vite.config.ts)
+"""
+
+import hashlib
+import json
+import mimetypes
+import os
+import posixpath
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+from deck_model import DECK_PATH
+from precache_manifest import AUDIO_URL_PREFIX, DEFAULT_SHARD_DIRS, ENCODINGS, IMAGE_URL_PREFIX, PRECACHE_PATH
+from verify_assets import IMAGE_ROOT
+from wav_info import LANGUAGES, VOICE_ROOT
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8080
+# 一个教室的设备同时打开App时会同时建立连接，默认的监听队列(5)会丢弃SYN，客户端要等1秒后重试
+LISTEN_BACKLOG = 128
+CACHE_CONTROL = 'no-cache'
+# 只有Vite开发服务器(vite.config.ts中的端口)的页面可以跨域读取；其他网页不能通过浏览器读取本机的资源
+DEFAULT_CORS_ORIGINS = ('http://localhost:3000', 'http://127.0.0.1:3000')
+
+mimetypes.add_type('audio/wav', '.wav')
+mimetypes.add_type('application/json', '.json')
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_range(header, size):
+    """
+    解析 "bytes=起-止" 形式的Range头，返回 (起, 止) (含两端)；
+    多个范围或无法识别的格式返回None(按规范忽略Range，返回完整文件)，范围超出文件时抛出RangeNotSatisfiable
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    first, dash, last = spec.strip().partition('-')
+    if not dash or not (first or last):
+        return None
+    try:
+        start = int(first) if first else None
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start is None:
+        # 后缀范围: 最后N个字节；空文件没有可返回的字节
+        if end <= 0 or size == 0:
+            raise RangeNotSatisfiable(header)
+        return max(0, size - end), size - 1
+    if start >= size or end < start:
+        raise RangeNotSatisfiable(header)
+    return start, min(end, size - 1)
+
+
+def accepted_encodings(header):
+    """Accept-Encoding中q>0的编码"""
+    accepted = set()
+    for item in (header or '').split(','):
+        name, _, params = item.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if name:
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def etag_matches(header, etag):
+    """If-None-Match使用弱比较：忽略W/前缀"""
+    if header.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in header.split(',')]
+    return etag in candidates or f"W/{etag}" in candidates
+
+
+class AssetResolver:
+    """
+    URL到文件的映射和ETag计算，线程安全；
+    /images/、/audio/ 之外只提供卡组输出(卡组文件、预缓存清单、分片目录)和图片/语音目录中的文件，
+    根目录下的其他内容(.git、.cache、脚本)一律404
+    """
+
+    def __init__(self, root='.', image_root=IMAGE_ROOT, voice_root=VOICE_ROOT, manifest_path=PRECACHE_PATH,
+                 output_files=(DECK_PATH, PRECACHE_PATH), output_dirs=DEFAULT_SHARD_DIRS):
+        self.root = os.path.abspath(root)
+        self.image_root = os.path.abspath(image_root)
+        self.voice_root = os.path.abspath(voice_root)
+        self.manifest_path = manifest_path
+        self.output_files = {os.path.join(self.root, path) for path in output_files} | {os.path.abspath(manifest_path)}
+        self.output_dirs = [os.path.join(self.root, path) for path in output_dirs]
+        self._manifest = {}
+        self._manifest_mtime = None
+        self._hashes = {}
+        self._lock = threading.Lock()
+
+    def _load_manifest(self):
+        """清单文件变化时重新读取，重新运行precache_manifest.py后不必重启服务器"""
+        try:
+            mtime = os.stat(self.manifest_path).st_mtime
+        except OSError:
+            self._manifest, self._manifest_mtime = {}, None
+            return
+        if mtime == self._manifest_mtime:
+            return
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            entries = json.load(f).get('entries', [])
+        self._manifest = {os.path.abspath(entry['path']): entry for entry in entries}
+        self._manifest_mtime = mtime
+
+    def resolve(self, url_path):
+        """返回URL对应的文件路径；不存在或越出目录时返回None"""
+        path = posixpath.normpath(unquote(url_path))
+        if path.startswith(IMAGE_URL_PREFIX):
+            candidates = [os.path.join(self.image_root, path[len(IMAGE_URL_PREFIX):])]
+            roots = [self.image_root]
+        elif path.startswith(AUDIO_URL_PREFIX):
+            # 语音文件名带有语言后缀，在各语言目录中查找
+            name = path[len(AUDIO_URL_PREFIX):]
+            candidates = [os.path.join(self.voice_root, language, name) for language in LANGUAGES]
+            roots = [self.voice_root]
+        else:
+            if any(part.startswith('.') for part in path.split('/')):
+                return None
+            candidate = os.path.abspath(os.path.join(self.root, path.lstrip('/')))
+            if candidate in self.output_files:
+                return candidate if os.path.isfile(candidate) else None
+            candidates = [candidate]
+            roots = self.output_dirs + [self.image_root, self.voice_root]
+
+        for candidate in candidates:
+            candidate = os.path.abspath(candidate)
+            if any(candidate.startswith(root + os.sep) for root in roots) and os.path.isfile(candidate):
+                return candidate
+        return None
+
+    def etag(self, path, stat):
+        """强ETag：清单中记录的revision仍然有效时直接使用，否则按内容计算并按 (大小, 修改时间) 缓存"""
+        with self._lock:
+            self._load_manifest()
+            entry = self._manifest.get(path)
+            if entry and entry['size'] == stat.st_size and stat.st_mtime <= self._manifest_mtime:
+                get_metrics().cache_result('etag_manifest', True)
+                return f'"{entry["revision"]}"'
+            key = (stat.st_size, stat.st_mtime_ns)
+            cached = self._hashes.get(path)
+            if cached and cached[0] == key:
+                return cached[1]
+
+        get_metrics().cache_result('etag_manifest', False)
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+        etag = f'"{digest.hexdigest()[:16]}"'
+        with self._lock:
+            self._hashes[path] = (key, etag)
+        return etag
+
+
+class AssetRequestHandler(BaseHTTPRequestHandler):
+    """静态资源处理，resolver在创建服务器时注入"""
+    resolver = None
+    cors_origins = frozenset(DEFAULT_CORS_ORIGINS)
+    protocol_version = 'HTTP/1.1'
+    # 响应头和sendfile分两次写入，开启Nagle时第二次写入要等客户端的延迟ACK(约40毫秒)
+    disable_nagle_algorithm = True
+
+    def _cors_headers(self):
+        """请求来自允许的开发服务器页面时返回CORS响应头"""
+        origin = self.headers.get('Origin')
+        headers = {'Vary': 'Accept-Encoding, Origin'}
+        if origin in self.cors_origins:
+            headers['Access-Control-Allow-Origin'] = origin
+            headers['Access-Control-Expose-Headers'] = 'ETag, Content-Range, Accept-Ranges'
+        return headers
+
+    def _send_error(self, status, message, headers=None):
+        body = message.encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/plain; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in {**self._cors_headers(), **(headers or {})}.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _choose_variant(self, path):
+        """
+        返回 (实际发送的文件, Content-Encoding或None)；
+        Range请求总是使用原文件，比原文件旧的压缩文件视为过期
+        """
+        if 'Range' in self.headers:
+            return path, None
+        accepted = accepted_encodings(self.headers.get('Accept-Encoding'))
+        mtime = os.stat(path).st_mtime
+        for encoding, suffix in ENCODINGS.items():
+            if encoding not in accepted:
+                continue
+            try:
+                if os.stat(path + suffix).st_mtime >= mtime:
+                    return path + suffix, encoding
+            except OSError:
+                pass
+        return path, None
+
+    def _serve(self):
+        metrics = get_metrics()
+        start = time.perf_counter()
+        path = self.resolver.resolve(urlparse(self.path).path)
+        if path is None:
+            self._send_error(404, 'not found')
+            return
+
+        stat = os.stat(path)
+        etag = self.resolver.etag(path, stat)
+        send_path, encoding = self._choose_variant(path)
+        if encoding:
+            # 不同编码的内容不同，ETag也必须不同
+            etag = f'{etag[:-1]}-{encoding}"'
+        headers = {
+            'ETag': etag,
+            'Cache-Control': CACHE_CONTROL,
+            'Accept-Ranges': 'bytes',
+            **self._cors_headers(),
+        }
+
+        if_none_match = self.headers.get('If-None-Match')
+        if if_none_match and etag_matches(if_none_match, etag):
+            metrics.incr('asset_not_modified')
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            return
+
+        size = os.stat(send_path).st_size if encoding else stat.st_size
+        status, offset, length = 200, 0, size
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        if range_header and (not if_range or if_range.strip() == etag):
+            try:
+                byte_range = parse_range(range_header, size)
+            except RangeNotSatisfiable:
+                self._send_error(416, 'range not satisfiable', {'Content-Range': f"bytes */{size}"})
+                return
+            if byte_range:
+                status, offset, length = 206, byte_range[0], byte_range[1] - byte_range[0] + 1
+                headers['Content-Range'] = f"bytes {byte_range[0]}-{byte_range[1]}/{size}"
+                metrics.incr('asset_partial')
+
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(length))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        if self.command != 'HEAD' and length:
+            with open(send_path, 'rb') as f:
+                # 响应头已写入socket(wfile不缓冲)，文件内容交给sendfile
+                self.connection.sendfile(f, offset, length)
+            metrics.incr('asset_bytes_sent', length)
+        metrics.observe('asset_request', time.perf_counter() - start)
+
+    def do_GET(self):
+        self._serve()
+
+    def do_HEAD(self):
+        self._serve()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(resolver, host=DEFAULT_HOST, port=DEFAULT_PORT, cors_origins=DEFAULT_CORS_ORIGINS):
+    """创建绑定到resolver的HTTP服务器"""
+    handler = type('BoundAssetRequestHandler', (AssetRequestHandler,),
+                   {'resolver': resolver, 'cors_origins': frozenset(cors_origins)})
+    server_class = type('AssetServer', (ThreadingHTTPServer,), {'request_queue_size': LISTEN_BACKLOG})
+    return server_class((host, port), handler)
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='本地资源开发服务器')
+    parser.add_argument('--host', type=str, default=DEFAULT_HOST, help=f'监听地址 (默认: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'监听端口 (默认: {DEFAULT_PORT})')
+    parser.add_argument('--root', type=str, default='.',
+                        help='卡组输出所在目录，只提供其中的卡组文件、预缓存清单和分片目录 (默认: 当前目录)')
+    parser.add_argument('--image-root', type=str, default=IMAGE_ROOT, help=f'图片目录 (默认: {IMAGE_ROOT})')
+    parser.add_argument('--voice-root', type=str, default=VOICE_ROOT, help=f'语音根目录 (默认: {VOICE_ROOT})')
+    parser.add_argument('--manifest', type=str, default=PRECACHE_PATH,
+                        help=f'precache_manifest.py生成的清单，用于ETag (默认: {PRECACHE_PATH})')
+    parser.add_argument('--cors-origin', type=str, nargs='*', default=list(DEFAULT_CORS_ORIGINS),
+                        help=f"允许跨域读取的页面来源 (默认: {' '.join(DEFAULT_CORS_ORIGINS)})")
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    with metrics_session('asset_server', args.metrics, args.profile):
+        resolver = AssetResolver(args.root, args.image_root, args.voice_root, args.manifest)
+        server = create_server(resolver, args.host, args.port, args.cors_origin)
+        print(f"资源服务器已启动: http://{args.host}:{args.port}")
+        print(f"  图片: {IMAGE_URL_PREFIX} -> {args.image_root}")
+        print(f"  语音: {AUDIO_URL_PREFIX} -> {args.voice_root}/{{{','.join(LANGUAGES)}}}")
+        if not os.path.exists(args.manifest):
+            print(f"  注意: 没有找到{args.manifest}，ETag按文件内容计算")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n正在停止服务...")
+        finally:
+            server.server_close()
+
+
+if __name__ == "__main__":
+    main()
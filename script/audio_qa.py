@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+语音包质量检查
+合成失败或被截断的语音仍然会留下一个.wav文件，生成脚本会把它算作成功。
+这里在进程池中用numpy.memmap映射 resource/voice/en 和 resource/voice/cn 下的每个WAV文件(不复制到内存)，
+计算RMS、峰值、削波比例、开头/结尾静音和相对文本长度的语速，找出需要重新生成的文件：
+- 静音或音量过低、削波
+- 开头或结尾静音过长(合成器卡住)
+- 结尾没有静音且最后一帧仍有较大能量(生成被截断)
+- 语速与同一语言的其他文件相比是离群值(漏读或重复)，用中位数和MAD计算稳健z分数
+
+生成脚本会跳过已存在的文件，用 --quarantine 把不合格的文件移走后重新运行生成脚本即可补齐
+"""
+
+import json
+import math
+import os
+import shutil
+import struct
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from deck_model import load_deck
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+from wav_info import LANGUAGES, VOICE_ROOT, WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_PCM, WavFormatError, read_wav_info
+
+REPORT_PATH = 'audio_qa.json'
+# 计算静音和能量的帧长
+FRAME_SECONDS = 0.01
+# 低于 max(绝对门限, 最响帧 - 相对门限) 的帧视为静音
+SILENCE_DB = -45.0
+SILENCE_RELATIVE_DB = 40.0
+CLIP_LEVEL = 0.999
+
+QAGate = namedtuple('QAGate', 'min_rms_db max_clipping max_leading_silence max_trailing_silence '
+                              'truncation_ratio max_rate_z')
+DEFAULT_GATE = QAGate(min_rms_db=-40.0, max_clipping=0.001, max_leading_silence=1.0, max_trailing_silence=1.5,
+                      truncation_ratio=0.3, max_rate_z=3.5)
+
+
+def to_db(value):
+    return 20 * math.log10(value) if value > 0 else -math.inf
+
+
+def map_samples(path, info):
+    """把WAV的data块映射为 (帧数, 声道) 的float32数组，返回前先按格式缩放到[-1, 1]"""
+    frames = info.data_size // info.block_align
+    shape = (frames, info.channels)
+    if frames == 0:
+        return np.zeros(shape, dtype=np.float32)
+    bits = info.bits_per_sample
+    if info.format_tag == WAVE_FORMAT_IEEE_FLOAT and bits == 32:
+        return np.memmap(path, dtype='<f4', mode='r', offset=info.data_offset, shape=shape)
+    if info.format_tag == WAVE_FORMAT_IEEE_FLOAT and bits == 64:
+        return np.memmap(path, dtype='<f8', mode='r', offset=info.data_offset, shape=shape).astype(np.float32)
+    if info.format_tag != WAVE_FORMAT_PCM:
+        raise WavFormatError(f"不支持的格式 {info.format_tag:#x}: {path}")
+    if bits == 8:
+        raw = np.memmap(path, dtype='u1', mode='r', offset=info.data_offset, shape=shape)
+        return (raw.astype(np.float32) - 128) / 128
+    if bits in (16, 32):
+        raw = np.memmap(path, dtype=f'<i{bits // 8}', mode='r', offset=info.data_offset, shape=shape)
+        return raw.astype(np.float32) / float(1 << (bits - 1))
+    if bits == 24:
+        raw = np.memmap(path, dtype='u1', mode='r', offset=info.data_offset, shape=shape + (3,)).astype(np.int32)
+        values = raw[..., 0] | (raw[..., 1] << 8) | (raw[..., 2] << 16)
+        values = np.where(values >= 1 << 23, values - (1 << 24), values)
+        return values.astype(np.float32) / float(1 << 23)
+    raise WavFormatError(f"不支持的位深 {bits}: {path}")
+
+
+def analyze_samples(samples, sample_rate):
+    """
+    单个文件的统计量：时长、RMS(dBFS)、峰值、削波比例、开头/结尾静音秒数、语音段秒数，
+    以及最后一帧相对语音段的能量(用于判断截断)
+    """
+    mono = samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+    duration = len(mono) / sample_rate
+    if len(mono) == 0:
+        return {'duration': 0.0, 'rms_db': -math.inf, 'peak': 0.0, 'clipping': 0.0,
+                'leading_silence': 0.0, 'trailing_silence': 0.0, 'speech_seconds': 0.0, 'tail_ratio': 0.0}
+
+    peak_per_sample = np.abs(samples).max(axis=1)
+    frame_length = max(1, int(sample_rate * FRAME_SECONDS))
+    count = max(1, len(mono) // frame_length)
+    frames = np.zeros(count * frame_length, dtype=np.float32)
+    frames[:min(len(mono), len(frames))] = mono[:len(frames)]
+    frame_rms = np.sqrt(np.mean(frames.reshape(count, frame_length) ** 2, axis=1))
+
+    threshold = max(10 ** (SILENCE_DB / 20), frame_rms.max() * 10 ** (-SILENCE_RELATIVE_DB / 20))
+    voiced = np.flatnonzero(frame_rms > threshold)
+    if len(voiced):
+        first, last = voiced[0], voiced[-1]
+        speech_rms = float(np.sqrt(np.mean(frame_rms[first:last + 1] ** 2)))
+        leading = first * frame_length / sample_rate
+        trailing = duration - (last + 1) * frame_length / sample_rate
+        speech_seconds = (last - first + 1) * frame_length / sample_rate
+        tail_ratio = float(frame_rms[-1] / speech_rms) if last == count - 1 else 0.0
+    else:
+        leading, trailing, speech_seconds, tail_ratio = duration, 0.0, 0.0, 0.0
+
+    return {
+        'duration': duration,
+        'rms_db': to_db(float(np.sqrt(np.mean(mono.astype(np.float64) ** 2)))),
+        'peak': float(peak_per_sample.max()),
+        'clipping': float(np.mean(peak_per_sample >= CLIP_LEVEL)),
+        'leading_silence': leading,
+        'trailing_silence': max(trailing, 0.0),
+        'speech_seconds': speech_seconds,
+        'tail_ratio': tail_ratio,
+    }
+
+
+def analyze_file(path):
+    """在工作进程中运行：返回 (路径, 统计量字典或错误信息)"""
+    try:
+        info = read_wav_info(path)
+        return path, analyze_samples(map_samples(path, info), info.sample_rate)
+    except (OSError, ValueError, struct.error) as e:
+        return path, str(e)
+
+
+def collect_voice_files(deck, voice_root=VOICE_ROOT):
+    """
+    语音目录中的全部WAV文件及其文本，返回 {路径: (语言, 文本或None, [卡片id, ...])}
+    卡组引用但不存在的文件也列出，卡组没有引用的文件文本为None
+    """
+    files = {}
+    # time_stretch.py生成的变速版本由原文件派生，语速和静音长度都不可比，不参与检查
+    variants = set()
+    for _, card in deck.cards():
+        for language in LANGUAGES:
+            path = os.path.join(voice_root, language, card.voice.get(language))
+            text = getattr(card.word, language)
+            files.setdefault(path, (language, text, []))[2].append(card.id)
+        variants.update(os.path.join(voice_root, language, name) for _, language, name in card.voice.variants())
+    for language in LANGUAGES:
+        directory = os.path.join(voice_root, language)
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if name.endswith('.wav') and path not in variants:
+                    files.setdefault(path, (language, None, []))
+    return files
+
+
+def text_length(text):
+    """用于计算语速的文本长度：英文按字母数，中文按字数"""
+    return sum(1 for char in text if char.isalnum())
+
+
+def robust_z(values):
+    """稳健z分数：0.6745 * (x - 中位数) / MAD；MAD为0时返回None"""
+    median = np.median(values)
+    mad = np.median(np.abs(values - median))
+    return None if mad == 0 else 0.6745 * (values - median) / mad
+
+
+def rate_z_scores(stats, files, max_z=DEFAULT_GATE.max_rate_z):
+    """
+    每种语言内语音时长相对文本长度的离群程度
+    合成语音有固定的开销，时长按 a + b * 文本长度 拟合(去掉离群值后再拟合一次)，
+    对 log(实际时长 / 拟合时长) 计算稳健z分数
+    """
+    scores = {}
+    for language in LANGUAGES:
+        paths = [path for path, entry in stats.items()
+                 if files[path][0] == language and files[path][1] and entry['speech_seconds'] > 0
+                 and text_length(files[path][1]) > 0]
+        if len(paths) < 10:
+            continue
+        lengths = np.array([text_length(files[path][1]) for path in paths], dtype=np.float64)
+        seconds = np.array([stats[path]['speech_seconds'] for path in paths])
+
+        # 第二次拟合无法进行(去掉离群值后文本长度不足两种，或MAD为0)时沿用第一次的结果
+        inliers = np.ones(len(paths), dtype=bool)
+        latest = None
+        for _ in range(2):
+            if len(np.unique(lengths[inliers])) < 2:
+                break
+            slope, intercept = np.polyfit(lengths[inliers], seconds[inliers], 1)
+            predicted = np.maximum(intercept + slope * lengths, 1e-3)
+            z = robust_z(np.log(seconds / predicted))
+            if z is None:
+                break
+            latest = z
+            inliers = np.abs(z) <= max_z
+        if latest is not None:
+            scores.update(zip(paths, latest.tolist()))
+    return scores
+
+
+def qa_problems(entry, z, gate):
+    """返回单个文件不合格的原因列表"""
+    problems = []
+    if entry['speech_seconds'] == 0:
+        return ["没有声音"]
+    if entry['rms_db'] < gate.min_rms_db:
+        problems.append(f"音量过低 ({entry['rms_db']:.1f} dBFS)")
+    if entry['clipping'] > gate.max_clipping:
+        problems.append(f"削波 {entry['clipping']:.2%}")
+    if entry['leading_silence'] > gate.max_leading_silence:
+        problems.append(f"开头静音 {entry['leading_silence']:.2f}s")
+    if entry['trailing_silence'] > gate.max_trailing_silence:
+        problems.append(f"结尾静音 {entry['trailing_silence']:.2f}s")
+    if entry['tail_ratio'] > gate.truncation_ratio:
+        problems.append(f"结尾被截断 (最后一帧能量 {entry['tail_ratio']:.0%})")
+    if z is not None and abs(z) > gate.max_rate_z:
+        problems.append(f"语速异常 ({'过慢' if z > 0 else '过快'}，z={z:+.1f})")
+    return problems
+
+
+def run_qa(deck, voice_root=VOICE_ROOT, gate=DEFAULT_GATE, workers=None):
+    """检查全部语音文件，返回 (全部统计量{路径: 字典}, 不合格列表[(路径, 原因列表)], 文件信息)"""
+    metrics = get_metrics()
+    files = collect_voice_files(deck, voice_root)
+    paths = sorted(files)
+
+    stats, failures = {}, []
+    with metrics.stage('analyze', items=len(paths)):
+        existing = [path for path in paths if os.path.exists(path)]
+        failures.extend((path, ["文件不存在"]) for path in sorted(set(paths) - set(existing)))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            # 每个任务只处理一个小文件，成批分发减少进程间通信
+            chunksize = max(1, len(existing) // ((workers or os.cpu_count() or 1) * 8))
+            for path, result in executor.map(analyze_file, existing, chunksize=chunksize):
+                if isinstance(result, str):
+                    failures.append((path, [result]))
+                else:
+                    stats[path] = result
+
+    z_scores = rate_z_scores(stats, files, gate.max_rate_z)
+    for path, entry in stats.items():
+        entry['rate_z'] = z_scores.get(path)
+        problems = qa_problems(entry, entry['rate_z'], gate)
+        if problems:
+            failures.append((path, problems))
+    failures.sort()
+    metrics.incr('audio_qa_flagged', len(failures))
+    return stats, failures, files
+
+
+def build_report(stats, failures, files, gate):
+    """报告：每种语言的统计量分布和不合格文件列表"""
+    summary = {}
+    for language in LANGUAGES:
+        entries = [entry for path, entry in stats.items() if files[path][0] == language]
+        if not entries:
+            continue
+        summary[language] = {'files': len(entries)}
+        for key in ('duration', 'rms_db', 'leading_silence', 'trailing_silence'):
+            # 全部是数字静音时rms_db没有有限值，记为None，键始终存在
+            values = np.array([entry[key] for entry in entries if math.isfinite(entry[key])])
+            summary[language][key] = {q: round(float(np.percentile(values, p)), 3)
+                                      for q, p in (('p5', 5), ('p50', 50), ('p95', 95))} if len(values) else None
+    flagged = []
+    for path, problems in failures:
+        language, text, cards = files[path]
+        entry = {key: (round(value, 4) if isinstance(value, float) and math.isfinite(value) else None)
+                 for key, value in stats.get(path, {}).items()}
+        flagged.append({'path': path, 'language': language, 'text': text, 'cards': cards,
+                        'problems': problems, 'stats': entry})
+    return {'gate': gate._asdict(), 'summary': summary, 'flagged': flagged}
+
+
+def write_report(report, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def quarantine(paths, voice_root, directory):
+    """把不合格的文件移到directory下(保留语言子目录)，生成脚本重新运行时会补齐；返回移动的文件数"""
+    moved = 0
+    for path in paths:
+        if not os.path.exists(path):
+            continue
+        target = os.path.join(directory, os.path.relpath(path, voice_root))
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.move(path, target)
+        moved += 1
+    return moved
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='检查语音包中的静音、削波和截断，找出需要重新生成的文件')
+    parser.add_argument('--deck', type=str, default='categories.json', help='卡组文件 (默认: categories.json)')
+    parser.add_argument('--voice-root', type=str, default=VOICE_ROOT, help=f'语音根目录 (默认: {VOICE_ROOT})')
+    parser.add_argument('--report', type=str, default=REPORT_PATH, help=f'报告输出路径 (默认: {REPORT_PATH})')
+    parser.add_argument('--quarantine', type=str, metavar='DIR',
+                        help='把不合格的文件移到该目录，之后重新运行生成脚本即可重新合成')
+    parser.add_argument('--workers', type=int, help='并行进程数')
+    parser.add_argument('--min-rms-db', type=float, default=DEFAULT_GATE.min_rms_db,
+                        help=f'最低RMS音量，dBFS (默认: {DEFAULT_GATE.min_rms_db})')
+    parser.add_argument('--max-clipping', type=float, default=DEFAULT_GATE.max_clipping,
+                        help=f'最大削波采样比例 (默认: {DEFAULT_GATE.max_clipping})')
+    parser.add_argument('--max-leading-silence', type=float, default=DEFAULT_GATE.max_leading_silence,
+                        help=f'开头静音上限，秒 (默认: {DEFAULT_GATE.max_leading_silence})')
+    parser.add_argument('--max-trailing-silence', type=float, default=DEFAULT_GATE.max_trailing_silence,
+                        help=f'结尾静音上限，秒 (默认: {DEFAULT_GATE.max_trailing_silence})')
+    parser.add_argument('--truncation-ratio', type=float, default=DEFAULT_GATE.truncation_ratio,
+                        help=f'最后一帧能量超过语音平均能量的该比例时视为截断 (默认: {DEFAULT_GATE.truncation_ratio})')
+    parser.add_argument('--max-rate-z', type=float, default=DEFAULT_GATE.max_rate_z,
+                        help=f'语速稳健z分数上限 (默认: {DEFAULT_GATE.max_rate_z})')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    gate = QAGate(args.min_rms_db, args.max_clipping, args.max_leading_silence, args.max_trailing_silence,
+                  args.truncation_ratio, args.max_rate_z)
+
+    print("语音包质量检查")
+    print("=" * 50)
+
+    with metrics_session('audio_qa', args.metrics, args.profile):
+        deck = load_deck(args.deck)
+        stats, failures, files = run_qa(deck, args.voice_root, gate, args.workers)
+        report = build_report(stats, failures, files, gate)
+        write_report(report, args.report)
+
+    for language, summary in report['summary'].items():
+        duration, rms = summary.get('duration'), summary.get('rms_db')
+        if rms is None:
+            # 合成器损坏时典型的表现：整个语言的输出都是静音
+            print(f"⚠️  {language}: {summary['files']} 个文件全部没有声音，请检查该语言的TTS后端")
+            continue
+        print(f"{language}: {summary['files']} 个文件，时长中位数 {duration['p50']:.2f}s，"
+              f"音量中位数 {rms['p50']:.1f} dBFS")
+    print(f"报告已保存到: {args.report}")
+
+    if not failures:
+        print("✓ 所有语音文件合格")
+        return
+
+    print(f"✗ {len(failures)} 个文件需要重新生成:")
+    for entry in report['flagged'][:30]:
+        print(f"  - {entry['path']} ({entry['text'] or '卡组未引用'}): {'；'.join(entry['problems'])}")
+    if len(failures) > 30:
+        print(f"  ... 还有 {len(failures) - 30} 个")
+    if args.quarantine:
+        moved = quarantine([path for path, _ in failures], args.voice_root, args.quarantine)
+        print(f"已把 {moved} 个文件移到 {args.quarantine}，重新运行生成脚本即可补齐")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
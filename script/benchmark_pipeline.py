@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+闪卡数据流水线基准测试
+生成3k/30k/300k规模的合成文件名语料和categories.json，对流水线中的纯Python阶段逐一计时，
+TTS和翻译使用桩函数，结果与基线比较，性能回退时以非零状态退出
+"""
+
+import contextlib
+import gc
+import json
+import os
+import random
+import shutil
+import statistics
+import string
+import sys
+import tempfile
+import time
+
+import generate_categories
+import transform_categories
+import vits_p273_english_tts
+from deck_model import load_deck
+from pipeline_metrics import metrics_session
+
+DEFAULT_SIZES = [3000, 30000, 300000]
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+# 每个样本至少运行这么久：短阶段循环多次取平均，与timeit.autorange一样压低计时抖动
+MIN_RUN_TIME = 0.2
+
+# 不会命中任何分类关键词的填充词，用来模拟"others"分类
+FILLER_WORDS = [
+    "zorp", "quill", "vex", "mirth", "plume", "glint", "nimbus", "tweak", "wisp", "blip",
+    "fizz", "gloam", "hush", "knack", "lilt", "murk", "nook", "quirk", "snug", "thrum",
+]
+MODIFIERS = ["big", "small", "red", "blue", "happy", "baby", "old", "tiny", "raw", "cooked"]
+
+
+def generate_filenames(count, seed=0):
+    """生成与真实图片库分布相近的合成文件名（包含随机后缀和数字后缀）"""
+    rng = random.Random(seed)
+    keywords = sorted({k for info in generate_categories.CATEGORIES.values() for k in info["keywords"]})
+    alnum = string.ascii_lowercase + string.digits
+
+    filenames = []
+    seen = set()
+    while len(filenames) < count:
+        parts = []
+        if rng.random() < 0.3:
+            parts.append(rng.choice(MODIFIERS))
+        pool = FILLER_WORDS if rng.random() < 0.25 else keywords
+        parts.append(rng.choice(pool).replace(" ", "-"))
+        if rng.random() < 0.2:
+            parts.append(rng.choice(keywords).replace(" ", "-"))
+        base = "-".join(parts)
+
+        roll = rng.random()
+        if roll < 0.15:
+            base += "-" + "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(0, 2)))
+            base += rng.choice(string.digits) + "".join(rng.choice(alnum) for _ in range(rng.randint(2, 5)))
+        elif roll < 0.25:
+            base += f"-{rng.randint(1, 9)}"
+
+        filename = f"{base}.png"
+        # 与原始素材一样用随机后缀消除重名
+        while filename in seen:
+            filename = f"{base}-{rng.choice(string.digits)}{''.join(rng.choice(alnum) for _ in range(5))}.png"
+        seen.add(filename)
+        filenames.append(filename)
+
+    return filenames
+
+
+def build_original_deck(filenames, categories):
+    """按generate_categories.py的输出结构构建categories_original.json"""
+    grouped = {}
+    for filename, category_id in zip(filenames, categories):
+        grouped.setdefault(category_id, []).append(filename)
+
+    output = {
+        "version": "1.0",
+        "description": {"en": "Cartoon English Flash Card Categories", "zh": "卡通英语闪卡分类"},
+        "categories": [],
+    }
+    for category_id in list(generate_categories.CATEGORIES.keys()) + ["others"]:
+        if category_id not in grouped:
+            continue
+        info = generate_categories.CATEGORIES.get(category_id, {"en": "Others", "zh": "其他"})
+        output["categories"].append({
+            "id": category_id,
+            "name": {"en": info["en"], "zh": info["zh"]},
+            "count": len(grouped[category_id]),
+            "images": sorted(grouped[category_id]),
+        })
+    output["statistics"] = {
+        "total_images": len(filenames),
+        "total_categories": len(output["categories"]),
+        "categorized_images": len(filenames) - len(grouped.get("others", [])),
+        "uncategorized_images": len(grouped.get("others", [])),
+    }
+    return output
+
+
+@contextlib.contextmanager
+def quiet():
+    """屏蔽被测脚本的逐条打印"""
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+
+@contextlib.contextmanager
+def stub_tts():
+    """用不做任何合成的桩函数替换VITS命令行调用"""
+    module = vits_p273_english_tts
+    original = (module.check_tts_available, module.generate_vits_audio)
+    module.check_tts_available = lambda: True
+    module.generate_vits_audio = lambda text, output_path, speaker_id="p273": True
+    try:
+        yield
+    finally:
+        module.check_tts_available, module.generate_vits_audio = original
+
+
+def timed_run(func, number=1):
+    """运行number次，返回平均每次的耗时和最后一次的返回值"""
+    # 每次运行使用独立的指标对象，避免延迟样本跨轮累积；与timeit一样计时期间关闭GC
+    with metrics_session('benchmark'):
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            for _ in range(number):
+                result = func()
+            return (time.perf_counter() - start) / number, result
+        finally:
+            gc.enable()
+
+
+def calibration_workload():
+    """固定的纯Python负载，用于把耗时换算成与机器无关的相对值"""
+    total = 0
+    for i in range(200000):
+        s = f"item-{i}"
+        total += len(s.replace("-", " ").split())
+    return total
+
+
+def measure(func, repeat, calibrations=None, min_run_time=MIN_RUN_TIME):
+    """
+    运行repeat个样本，返回最短的平均耗时和最后一次的返回值；
+    单次短于min_run_time的阶段每个样本循环多次。
+    传入calibrations时每个样本前运行一次校准负载并追加耗时，
+    校准与各阶段交替运行，机器频率或负载的变化同时影响两者
+    """
+    elapsed, result = timed_run(func)
+    number = max(1, int(min_run_time / max(elapsed, 1e-9)) + 1) if elapsed < min_run_time else 1
+    best = float('inf')
+    for _ in range(repeat):
+        if calibrations is not None:
+            calibrations.append(timed_run(calibration_workload)[0])
+        elapsed, result = timed_run(func, number)
+        best = min(best, elapsed)
+    return best, result
+
+
+def calibrate(calibrations):
+    """交替运行得到的校准耗时取中位数，个别受干扰的样本不影响结果"""
+    return statistics.median(calibrations)
+
+
+def run_size(size, repeat, workdir, calibrations=None):
+    """对一个规模运行全部阶段"""
+    timings = {}
+    filenames = generate_filenames(size)
+
+    def measure_stage(func):
+        return measure(func, repeat, calibrations)
+
+    timings['get_category'], categories = measure_stage(
+        lambda: [generate_categories.get_category(f) for f in filenames])
+    timings['clean_filename_to_word'], words = measure_stage(
+        lambda: [transform_categories.clean_filename_to_word(f) for f in filenames])
+    timings['create_voice_filename'], _ = measure_stage(
+        lambda: [transform_categories.create_voice_filename(f) for f in filenames])
+    timings['normalize_filenames'], _ = measure_stage(
+        lambda: transform_categories.normalize_filenames(filenames))
+    timings['translate_to_chinese'], _ = measure_stage(
+        lambda: [transform_categories.translate_to_chinese(w, c) for w, c in zip(words, categories)])
+
+    original_path = os.path.join(workdir, 'categories_original.json')
+    deck_path = os.path.join(workdir, 'categories.json')
+    with open(original_path, 'w', encoding='utf-8') as f:
+        json.dump(build_original_deck(filenames, categories), f, ensure_ascii=False, indent=2)
+
+    def transform():
+        # transform_categories会就地改写备份文件，每次都从原始文件开始
+        with quiet():
+            return transform_categories.transform_categories(original_path, deck_path)
+
+    timings['transform_categories'], deck = measure_stage(transform)
+
+    def json_load():
+        with open(deck_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def json_dump():
+        with open(deck_path, 'w', encoding='utf-8') as f:
+            json.dump(deck, f, ensure_ascii=False, indent=2)
+
+    timings['json_load'], _ = measure_stage(json_load)
+    timings['deck_load'], _ = measure_stage(lambda: load_deck(deck_path))
+    timings['json_dump'], _ = measure_stage(json_dump)
+
+    with working_directory(workdir):
+        timings['tts_parse'], _ = measure_stage(vits_p273_english_tts.parse_categories_json)
+
+        def tts_batch():
+            with quiet(), stub_tts():
+                vits_p273_english_tts.batch_generate_english_audio(engine='cli')
+
+        timings['tts_batch_stub'], _ = measure_stage(tts_batch)
+
+    return timings
+
+
+def compare(results, baseline, tolerance, min_time):
+    """与基线比较归一化耗时，返回回退列表"""
+    regressions = []
+    for size, stages in results['normalized'].items():
+        base_stages = baseline.get('normalized', {}).get(size, {})
+        for stage, value in stages.items():
+            base_value = base_stages.get(stage)
+            if base_value is None:
+                continue
+            # 两边都低于计时精度下限时不做比较，避免噪声误报
+            raw = results['timings'][size][stage]
+            if raw < min_time and base_value * results['calibration'] < min_time:
+                continue
+            if value > base_value * (1 + tolerance):
+                regressions.append((size, stage, base_value, value))
+    return regressions
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='闪卡数据流水线基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='合成卡片数量')
+    parser.add_argument('--repeat', type=int, default=3, help='每个阶段重复次数，取最短耗时')
+    parser.add_argument('--output', type=str, default='benchmark_results.json', help='结果输出文件')
+    parser.add_argument('--baseline', type=str, default=DEFAULT_BASELINE, help='基线文件')
+    parser.add_argument('--update-baseline', action='store_true', help='用本次结果覆盖基线')
+    parser.add_argument('--tolerance', type=float, default=0.5, help='允许的相对回退比例 (默认: 0.5)')
+    parser.add_argument('--min-time', type=float, default=0.05, help='低于该秒数的阶段不参与比较 (默认: 0.05)')
+    args = parser.parse_args()
+
+    print("闪卡数据流水线基准测试")
+    print("=" * 60)
+
+    calibrations = []
+    results = {'timings': {}, 'normalized': {}}
+    workdir = tempfile.mkdtemp(prefix='deck-bench-')
+    try:
+        for size in args.sizes:
+            print(f"\n规模: {size:,} 张卡片")
+            timings = run_size(size, args.repeat, workdir, calibrations)
+            results['timings'][str(size)] = timings
+            for stage, seconds in timings.items():
+                print(f"  {stage:<24} {seconds * 1000:>10.1f} ms  {size / seconds:>12,.0f} 条/秒")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    # 全部规模跑完后才归一化，校准值来自整个运行期间
+    calibration = calibrate(calibrations)
+    results['calibration'] = calibration
+    for size, timings in results['timings'].items():
+        results['normalized'][size] = {k: v / calibration for k, v in timings.items()}
+    print(f"\n校准负载耗时: {calibration * 1000:.1f} ms (中位数，{len(calibrations)} 次交替运行)")
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n结果已保存到: {args.output}")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"基线已更新: {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print("未找到基线文件，跳过回退检查 (使用 --update-baseline 生成)")
+        return
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    regressions = compare(results, baseline, args.tolerance, args.min_time)
+    if regressions:
+        print("\n" + "!" * 60)
+        print(f"性能回退! 以下阶段超过基线 {args.tolerance:.0%}:")
+        for size, stage, base_value, value in regressions:
+            print(f"  [{size}] {stage}: 基线 {base_value:.2f} -> 当前 {value:.2f} (x{value / base_value:.2f})")
+        print("!" * 60)
+        sys.exit(1)
+
+    print("\n✓ 未发现性能回退")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+预计算游戏干扰项
+MemoryFlip、SoundTreasureHunt等游戏需要为目标卡片挑选"容易混淆"的其他卡片：
+同一分类中拼写相近(word.en)、发音相近(英文读音和拼音)或共用汉字(word.cn)的卡片。
+这里为每张卡片预先排好干扰项，App开局时直接读取，不必在手机上扫描整个分类
+
+相似度是几种字符n-gram TF-IDF向量余弦相似度的加权和；
+n-gram哈希与ngram_classifier.py相同，对全部卡片整批计算，每个分类作为一批做一次矩阵乘法
+
+输出目录结构:
+    manifest.json                 参数和分类列表
+    categories/<分类id>.json      {"ids": [卡片id, ...], "distractors": [[序号, ...], ...]}
+                                  distractors[i]是ids[i]的干扰项在ids中的序号，按相似度从高到低
+"""
+
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+
+from build_search_index import fold_ascii, replace_directory
+from deck_model import load_deck
+from ngram_classifier import HASH_DIMS, encode_texts, hash_ngrams
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+
+DISTRACTORS_VERSION = 1
+DEFAULT_TOP_K = 8
+DEFAULT_OUTPUT = 'distractors'
+
+# 特征: (n-gram长度, 权重)
+FEATURES = {
+    'spelling': ((3, 4), 0.35),   # 英文拼写
+    'sound': ((2, 3), 0.30),      # 英文读音的近似拼写
+    'pinyin': ((2, 3), 0.20),     # 不带声调的拼音
+    'hanzi': ((1, 2), 0.15),      # 共用的汉字
+}
+
+# 按顺序替换，把发音相同的拼写归并成同一个写法: "phone" -> "fone", "kite"/"cite" 的k/c
+PHONETIC_RULES = (
+    ('ph', 'f'), ('ck', 'k'), ('qu', 'kw'), ('wh', 'w'), ('wr', 'r'), ('kn', 'n'), ('x', 'ks'),
+    ('ce', 'se'), ('ci', 'si'), ('cy', 'sy'), ('c', 'k'), ('z', 's'),
+    ('ee', 'i'), ('ea', 'i'), ('ie', 'i'), ('y', 'i'), ('oo', 'u'),
+)
+REPEATED_LETTERS = re.compile(r'(.)\1+')
+
+
+def phonetic_key(word):
+    """英文单词读音的粗略拼写，用于比较发音相近的单词"""
+    key = fold_ascii(word)
+    for source, target in PHONETIC_RULES:
+        key = key.replace(source, target)
+    return REPEATED_LETTERS.sub(r'\1', key)
+
+
+def card_texts(deck):
+    """返回 (卡片列表[(分类id, 卡片)], {特征: 文本列表})；没有拼音时现场转换，pypinyin不可用则不使用拼音特征"""
+    cards = list(deck.cards())
+    texts = {
+        'spelling': [f" {card.word.en.lower()} " for _, card in cards],
+        'sound': [f" {phonetic_key(card.word.en)} " for _, card in cards],
+        'hanzi': [card.word.cn for _, card in cards],
+    }
+
+    pinyin = [card.word.pinyin for _, card in cards]
+    if not all(pinyin):
+        try:
+            from annotate_pinyin import PinyinConverter
+        except ImportError:
+            print("注意: 卡组没有拼音且未安装pypinyin，不使用拼音特征")
+            return cards, texts
+        converter = PinyinConverter()
+        pinyin = [p or (converter.convert(card.word.cn)[0] if card.word.cn else '') for p, (_, card) in zip(pinyin, cards)]
+    texts['pinyin'] = [f" {fold_ascii(p)} " for p in pinyin]
+    return cards, texts
+
+
+def ngram_features(texts, sizes):
+    """
+    整批计算TF-IDF加权的n-gram向量，按行做L2归一化
+    返回 (行号, 哈希桶, 权重)，同一行内每个桶只出现一次，按行号升序
+    """
+    rows, buckets = hash_ngrams(encode_texts(texts), sizes)
+    keys, counts = np.unique(rows.astype(np.int64) * HASH_DIMS + buckets, return_counts=True)
+    rows, buckets = keys // HASH_DIMS, keys % HASH_DIMS
+
+    df = np.bincount(buckets, minlength=HASH_DIMS)
+    idf = np.log((1 + len(texts)) / (1 + df)) + 1.0
+    weights = counts * idf[buckets]
+    norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=len(texts)))
+    norms[norms == 0] = 1.0
+    return rows, buckets, (weights / norms[rows]).astype(np.float32)
+
+
+def block_similarity(features, start, end):
+    """[start, end) 行之间的余弦相似度矩阵：只取这一批出现过的桶组成稠密矩阵再相乘"""
+    rows, buckets, weights = features
+    lo, hi = np.searchsorted(rows, [start, end])
+    columns, inverse = np.unique(buckets[lo:hi], return_inverse=True)
+    matrix = np.zeros((end - start, len(columns)), dtype=np.float32)
+    matrix[rows[lo:hi] - start, inverse] = weights[lo:hi]
+    return matrix @ matrix.T
+
+
+def rank_distractors(scores, en, cn, top_k):
+    """
+    按相似度排序每张卡片的干扰项，返回序号列表的列表
+    排除自身，以及英文或中文与目标完全相同的卡片(答案会有歧义)；相似度相同时按卡组顺序
+    """
+    n = len(scores)
+    en = np.array([word.lower() for word in en])
+    cn = np.array(cn)
+    excluded = (en[:, None] == en[None, :]) | ((cn[:, None] == cn[None, :]) & (cn[:, None] != ''))
+    excluded[np.arange(n), np.arange(n)] = True
+    scores = np.where(excluded, -np.inf, scores)
+
+    order = np.argsort(-scores, axis=1, kind='stable')[:, :top_k]
+    valid = np.isfinite(np.take_along_axis(scores, order, axis=1))
+    return [row[mask].tolist() for row, mask in zip(order, valid)]
+
+
+def build_distractors(deck, top_k=DEFAULT_TOP_K):
+    """返回 ({分类id: {'ids': [...], 'distractors': [[...], ...]}}, 使用的特征及权重)"""
+    metrics = get_metrics()
+    with metrics.stage('features', items=deck.card_count):
+        cards, texts = card_texts(deck)
+        features = {name: ngram_features(texts[name], FEATURES[name][0]) for name in FEATURES if name in texts}
+    weights = {name: FEATURES[name][1] for name in features}
+    total_weight = sum(weights.values())
+
+    shards = {}
+    start = 0
+    with metrics.stage('rank', items=len(cards)):
+        for category in deck.categories:
+            end = start + len(category.cards)
+            scores = sum(weights[name] / total_weight * block_similarity(features[name], start, end)
+                         for name in features)
+            shards[category.id] = {
+                'ids': [card.id for card in category.cards],
+                'distractors': rank_distractors(scores, [card.word.en for card in category.cards],
+                                                [card.word.cn for card in category.cards], top_k),
+            }
+            start = end
+    return shards, weights
+
+
+def write_json(path, payload):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+
+
+def write_distractors(shards, weights, top_k, output_dir):
+    """写出干扰项目录，先写入临时目录再整体替换"""
+    tmp_dir = f"{output_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(os.path.join(tmp_dir, 'categories'))
+
+    categories = {}
+    for category_id, shard in shards.items():
+        filename = f"categories/{category_id}.json"
+        write_json(os.path.join(tmp_dir, filename), shard)
+        categories[category_id] = {'file': filename, 'cards': len(shard['ids'])}
+
+    write_json(os.path.join(tmp_dir, 'manifest.json'), {
+        'version': DISTRACTORS_VERSION,
+        'top_k': top_k,
+        'weights': weights,
+        'categories': categories,
+    })
+
+    replace_directory(tmp_dir, output_dir)
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='为每张卡片预计算同一分类中的游戏干扰项')
+    parser.add_argument('--deck', type=str, default='categories.json', help='卡组文件 (默认: categories.json)')
+    parser.add_argument('--output', type=str, default=DEFAULT_OUTPUT, help=f'输出目录 (默认: {DEFAULT_OUTPUT})')
+    parser.add_argument('--top-k', type=int, default=DEFAULT_TOP_K,
+                        help=f'每张卡片保留的干扰项数 (默认: {DEFAULT_TOP_K})')
+    parser.add_argument('--show', type=str, help='构建完成后显示指定卡片id的干扰项，用于检查')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    print("游戏干扰项预计算")
+    print("=" * 50)
+
+    with metrics_session('build_distractors', args.metrics, args.profile):
+        deck = load_deck(args.deck)
+        shards, weights = build_distractors(deck, args.top_k)
+        with get_metrics().stage('write', items=len(shards)):
+            write_distractors(shards, weights, args.top_k, args.output)
+
+    print(f"特征权重: {', '.join(f'{name}={weight}' for name, weight in weights.items())}")
+    print(f"{deck.card_count} 张卡片，{len(shards)} 个分类，结果已保存到: {args.output}")
+
+    if args.show:
+        words = {card.id: card.word for _, card in deck.cards()}
+        for shard in shards.values():
+            if args.show in shard['ids']:
+                index = shard['ids'].index(args.show)
+                print(f"\n{args.show} ({words[args.show].en} / {words[args.show].cn}):")
+                for i in shard['distractors'][index]:
+                    card_id = shard['ids'][i]
+                    print(f"  {card_id}: {words[card_id].en} / {words[card_id].cn}")
+                break
+        else:
+            print(f"没有找到卡片: {args.show}")
+
+
+if __name__ == "__main__":
+    main()
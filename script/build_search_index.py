@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+构建单词搜索索引
+为categories.json中每张卡片的word.en、word.cn和拼音预先计算前缀/n-gram倒排索引，
+按首字母分片存储，App按查询的首字符懒加载对应分片，查询时无需扫描整个卡组
+
+输出目录结构:
+    manifest.json        索引参数、分片列表和文档分块信息
+    terms/<key>.json     一个分片: {词项: 差分编码的文档编号列表}
+    docs/<n>.json        文档分块: [[卡片id, 分类id, 英文, 中文, 拼音], ...]
+
+文档编号按 (英文长度, 英文) 排序分配，倒排表按编号升序存储，
+因此编号越小的结果越靠前，求交集的结果天然有序
+"""
+
+import json
+import os
+import re
+import shutil
+import unicodedata
+
+from deck_model import load_deck
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+
+INDEX_VERSION = 1
+MAX_PREFIX = 8
+CJK_BUCKETS = 16
+DOC_CHUNK_SIZE = 1024
+
+TOKEN_PATTERN = re.compile(r'[a-z0-9]+')
+
+
+def is_cjk(char):
+    """判断是否为中日韩统一表意文字"""
+    return '一' <= char <= '鿿' or '㐀' <= char <= '䶿'
+
+
+def fold_ascii(text):
+    """转小写并去掉声调等附加符号，例如 "Cháng" -> "chang"，"lǜ" -> "lv" """
+    # ü(包括带声调的ǖǘǚǜ)分解为u加分音符，去掉附加符号之前先换成拼音输入习惯的v
+    decomposed = unicodedata.normalize('NFKD', text.lower()).replace('u\u0308', 'v')
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def shard_key(term):
+    """词项所属的分片：ASCII按首字母，数字归入"0"，汉字按码位分桶"""
+    first = term[0]
+    if 'a' <= first <= 'z':
+        return first
+    if first.isdigit():
+        return '0'
+    return f"u{ord(first) % CJK_BUCKETS:02d}"
+
+
+def latin_terms(text):
+    """英文/拼音的前缀词项：每个单词的前缀，以及去空格整串的前缀"""
+    tokens = TOKEN_PATTERN.findall(fold_ascii(text))
+    terms = set()
+    for token in tokens + ([''.join(tokens)] if len(tokens) > 1 else []):
+        for length in range(1, min(len(token), MAX_PREFIX) + 1):
+            terms.add(token[:length])
+    return terms
+
+
+def cjk_terms(text):
+    """中文的n-gram词项：单字和相邻两字"""
+    chars = [c for c in text if is_cjk(c)]
+    terms = set(chars)
+    terms.update(a + b for a, b in zip(chars, chars[1:]))
+    return terms
+
+
+def card_terms(word_en, word_cn, pinyin):
+    """一张卡片的全部词项"""
+    terms = latin_terms(word_en)
+    terms |= cjk_terms(word_cn)
+    if pinyin:
+        terms |= latin_terms(pinyin)
+    return terms
+
+
+def load_cards(deck_path):
+    """读取卡组，返回 (卡片id, 分类id, 英文, 中文, 拼音) 列表"""
+    return [(card.id, category.id, card.word.en, card.word.cn, card.word.pinyin or '')
+            for category, card in load_deck(deck_path).cards()]
+
+
+def delta_encode(ids):
+    """升序编号差分编码，缩小JSON体积"""
+    previous = 0
+    encoded = []
+    for doc_id in ids:
+        encoded.append(doc_id - previous)
+        previous = doc_id
+    return encoded
+
+
+def delta_decode(encoded):
+    total = 0
+    ids = []
+    for delta in encoded:
+        total += delta
+        ids.append(total)
+    return ids
+
+
+def build_index(cards):
+    """构建倒排索引，返回 (按编号排列的文档, {分片: {词项: 编号列表}})"""
+    # 短词排在前面：编号即排名
+    docs = sorted(cards, key=lambda card: (len(card[2]), card[2].lower(), card[0]))
+
+    shards = {}
+    for doc_id, (_, _, word_en, word_cn, pinyin) in enumerate(docs):
+        for term in card_terms(word_en, word_cn, pinyin):
+            shards.setdefault(shard_key(term), {}).setdefault(term, []).append(doc_id)
+
+    return docs, shards
+
+
+def write_json(path, payload):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+
+
+def write_index(docs, shards, output_dir):
+    """写出索引目录，先写入临时目录再整体替换，保证读取方看不到半成品"""
+    tmp_dir = f"{output_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(os.path.join(tmp_dir, 'terms'))
+    os.makedirs(os.path.join(tmp_dir, 'docs'))
+
+    shard_files = {}
+    for key, terms in sorted(shards.items()):
+        filename = f"terms/{key}.json"
+        write_json(os.path.join(tmp_dir, filename),
+                   {term: delta_encode(ids) for term, ids in sorted(terms.items())})
+        shard_files[key] = {'file': filename, 'terms': len(terms)}
+
+    doc_chunks = []
+    for start in range(0, len(docs), DOC_CHUNK_SIZE):
+        filename = f"docs/{start // DOC_CHUNK_SIZE}.json"
+        write_json(os.path.join(tmp_dir, filename), [list(doc) for doc in docs[start:start + DOC_CHUNK_SIZE]])
+        doc_chunks.append(filename)
+
+    write_json(os.path.join(tmp_dir, 'manifest.json'), {
+        'version': INDEX_VERSION,
+        'max_prefix': MAX_PREFIX,
+        'cjk_buckets': CJK_BUCKETS,
+        'doc_chunk_size': DOC_CHUNK_SIZE,
+        'doc_fields': ['id', 'category', 'en', 'cn', 'pinyin'],
+        'total_docs': len(docs),
+        'shards': shard_files,
+        'doc_chunks': doc_chunks,
+    })
+
+    replace_directory(tmp_dir, output_dir)
+
+
+def replace_directory(tmp_dir, output_dir):
+    """
+    用写好的tmp_dir替换output_dir：旧目录先改名让开，新目录换入后再删除旧目录，
+    读取方只会在两次改名之间短暂看不到目录，不会读到删了一半的旧目录
+    """
+    old_dir = f"{output_dir}.old"
+    shutil.rmtree(old_dir, ignore_errors=True)
+    try:
+        os.rename(output_dir, old_dir)
+    except FileNotFoundError:
+        old_dir = None
+    try:
+        os.replace(tmp_dir, output_dir)
+    except OSError:
+        if old_dir:
+            os.rename(old_dir, output_dir)
+        raise
+    if old_dir:
+        shutil.rmtree(old_dir, ignore_errors=True)
+
+
+class SearchIndex:
+    """按需加载分片的索引读取器，查询逻辑与App端一致，用于验证和调试"""
+
+    def __init__(self, index_dir):
+        self.index_dir = index_dir
+        with open(os.path.join(index_dir, 'manifest.json'), 'r', encoding='utf-8') as f:
+            self.manifest = json.load(f)
+        self._shards = {}
+        self._postings = {}
+        self._posting_sets = {}
+        self._doc_chunks = {}
+
+    def _load_json(self, filename):
+        with open(os.path.join(self.index_dir, filename), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def postings(self, term):
+        """返回词项的文档编号列表，解码结果按词项缓存"""
+        if term not in self._postings:
+            key = shard_key(term)
+            if key not in self._shards:
+                info = self.manifest['shards'].get(key)
+                self._shards[key] = self._load_json(info['file']) if info else {}
+            self._postings[term] = delta_decode(self._shards[key].get(term, []))
+        return self._postings[term]
+
+    def posting_set(self, term):
+        if term not in self._posting_sets:
+            self._posting_sets[term] = set(self.postings(term))
+        return self._posting_sets[term]
+
+    def doc(self, doc_id):
+        chunk = doc_id // self.manifest['doc_chunk_size']
+        if chunk not in self._doc_chunks:
+            self._doc_chunks[chunk] = self._load_json(self.manifest['doc_chunks'][chunk])
+        return dict(zip(self.manifest['doc_fields'], self._doc_chunks[chunk][doc_id % self.manifest['doc_chunk_size']]))
+
+    def query_terms(self, query):
+        """把查询拆成需要同时命中的词项，以及超过前缀长度、需要回查原文的单词"""
+        terms = []
+        long_tokens = []
+        chars = [c for c in query if is_cjk(c)]
+        if chars:
+            # 中文按相邻两字求交集，单字查询直接用单字
+            terms = [a + b for a, b in zip(chars, chars[1:])] or chars
+        for token in TOKEN_PATTERN.findall(fold_ascii(query)):
+            terms.append(token[:self.manifest['max_prefix']])
+            if len(token) > self.manifest['max_prefix']:
+                long_tokens.append(token)
+        return terms, long_tokens
+
+    def search(self, query, limit=20):
+        """返回按排名排序的匹配卡片"""
+        terms, long_tokens = self.query_terms(query)
+        if not terms:
+            return []
+
+        # 以最短的倒排表驱动，按编号顺序逐个检查其余词项，凑够limit条即停止
+        terms = sorted(set(terms), key=lambda term: len(self.postings(term)))
+        others = [self.posting_set(term) for term in terms[1:]]
+
+        results = []
+        for doc_id in self.postings(terms[0]):
+            if not all(doc_id in other for other in others):
+                continue
+            doc = self.doc(doc_id)
+            if long_tokens:
+                text = fold_ascii(f"{doc['en']} {doc['pinyin']}")
+                words = TOKEN_PATTERN.findall(text)
+                joined = ''.join(words)
+                if not all(any(w.startswith(t) for w in words) or joined.startswith(t) for t in long_tokens):
+                    continue
+            results.append(doc)
+            if len(results) >= limit:
+                break
+        return results
+
+
+def build_search_index(deck_path, output_dir):
+    """构建并写出搜索索引"""
+    metrics = get_metrics()
+
+    with metrics.stage('load', items=1):
+        cards = load_cards(deck_path)
+    print(f"读取 {len(cards)} 张卡片")
+
+    with metrics.stage('index', items=len(cards)):
+        docs, shards = build_index(cards)
+    total_terms = sum(len(terms) for terms in shards.values())
+    print(f"生成 {total_terms} 个词项，{len(shards)} 个分片")
+
+    with metrics.stage('write', items=len(shards)):
+        write_index(docs, shards, output_dir)
+    print(f"索引已保存到: {output_dir}")
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='构建单词搜索索引')
+    parser.add_argument('--deck', type=str, default='categories.json', help='卡组文件 (默认: categories.json)')
+    parser.add_argument('--output', type=str, default='search_index', help='索引输出目录 (默认: search_index)')
+    parser.add_argument('--query', type=str, help='构建完成后执行一次查询用于验证')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    print("单词搜索索引构建")
+    print("=" * 50)
+
+    with metrics_session('build_search_index', args.metrics, args.profile):
+        build_search_index(args.deck, args.output)
+
+    if args.query:
+        index = SearchIndex(args.output)
+        for doc in index.search(args.query):
+            print(f"  {doc['id']}: {doc['en']} / {doc['cn']} ({doc['category']})")
+
+
+if __name__ == "__main__":
+    main()
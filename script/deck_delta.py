@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+"""
+卡组增量更新包
+比较两个版本的categories.json和它们引用的图片/语音文件(按sha256)，生成只包含变化部分的zip包：
+    delta.json           新旧版本的校验和、新增/删除/修改的卡片和资源列表，
+                         以及目标卡组的结构(未变化的卡片只记录卡片id，由旧版本补全)
+    assets/<相对路径>    新增或内容变化的资源文件
+
+旧版本的资源只需要它发布时由verify_assets.py生成的asset_manifest.json，不需要旧文件本身；
+新版本的资源直接读取当前的 resource/ 目录
+
+用法:
+    python3 deck_delta.py --from old/categories.json --from-manifest old/asset_manifest.json \\
+                          --output deck_delta.zip --verify
+    python3 deck_delta.py --apply deck_delta.zip --root 旧版本目录
+"""
+
+import hashlib
+import json
+import os
+import posixpath
+import sys
+import zipfile
+
+from deck_model import DeckValidationError, decode_deck
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+from verify_assets import IMAGE_ROOT, build_manifest, verify_assets
+from wav_info import VOICE_ROOT
+
+DELTA_VERSION = 1
+DELTA_PATH = 'deck_delta.zip'
+DELTA_ENTRY = 'delta.json'
+ASSET_PREFIX = 'assets/'
+# 已经压缩过的格式直接存储，压缩只会浪费CPU
+STORED_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.webp', '.mp3', '.ogg')
+
+
+def deck_bytes(data):
+    """卡组按项目中各脚本统一的格式(json.dump, indent=2)序列化后的字节"""
+    return json.dumps(data, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def read_deck(path):
+    """
+    读取卡组，返回 (原始JSON, 文件字节)；同时用deck_model校验结构
+    增量包在原始JSON上比较和还原，字段顺序与原文件一致，还原出的文件可以逐字节比较
+    """
+    with open(path, 'rb') as f:
+        content = f.read()
+    data = json.loads(content)
+    decode_deck(data)
+    return data, content
+
+
+def raw_cards(data):
+    """按顺序遍历 (分类id, 卡片id, 卡片条目)"""
+    for category in data['categories']:
+        for entry in category['images']:
+            yield category['id'], os.path.splitext(entry['filename'])[0], entry
+
+
+def card_hash(category_id, entry):
+    """卡片条目(连同所属分类)的内容哈希，与字段顺序无关"""
+    payload = json.dumps([category_id, entry], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def diff_cards(old_data, new_data):
+    """返回 (新增, 删除, 修改) 的卡片id列表；移动到其他分类也算修改"""
+    old = {card_id: card_hash(category_id, entry) for category_id, card_id, entry in raw_cards(old_data)}
+    new = {card_id: card_hash(category_id, entry) for category_id, card_id, entry in raw_cards(new_data)}
+    added = sorted(new.keys() - old.keys())
+    removed = sorted(old.keys() - new.keys())
+    changed = sorted(card_id for card_id in new.keys() & old.keys() if new[card_id] != old[card_id])
+    return added, removed, changed
+
+
+def diff_assets(old_assets, new_assets):
+    """比较两个资源清单的assets部分，返回 (新增, 修改, 删除) 的路径列表"""
+    added = sorted(new_assets.keys() - old_assets.keys())
+    removed = sorted(old_assets.keys() - new_assets.keys())
+    changed = sorted(path for path in new_assets.keys() & old_assets.keys()
+                     if new_assets[path]['sha256'] != old_assets[path]['sha256'])
+    return added, changed, removed
+
+
+def build_delta(old_data, old_content, old_manifest, new_data, new_content, new_manifest):
+    """生成delta.json的内容，以及需要放入包中的资源路径"""
+    # 比较序列化后的文本而不是dict，字段顺序不同的条目也要随包发送，才能逐字节还原
+    old_entries = {card_id: (category_id, json.dumps(entry, ensure_ascii=False))
+                   for category_id, card_id, entry in raw_cards(old_data)}
+    added, removed, changed = diff_cards(old_data, new_data)
+
+    deck = dict(new_data)
+    categories = []
+    unchanged = 0
+    for category in new_data['categories']:
+        images = []
+        for entry in category['images']:
+            card_id = os.path.splitext(entry['filename'])[0]
+            if old_entries.get(card_id) == (category['id'], json.dumps(entry, ensure_ascii=False)):
+                # 旧版本中有完全相同的条目，只记录id
+                images.append(card_id)
+                unchanged += 1
+            else:
+                images.append(entry)
+        categories.append(dict(category, images=images))
+    deck['categories'] = categories
+
+    new_assets = new_manifest['assets']
+    assets_added, assets_changed, assets_removed = diff_assets(old_manifest['assets'], new_assets)
+    delta = {
+        'version': DELTA_VERSION,
+        'from': {'deck_sha256': hashlib.sha256(old_content).hexdigest(), 'assets': len(old_manifest['assets'])},
+        'to': {'deck_sha256': hashlib.sha256(new_content).hexdigest(), 'assets': len(new_assets)},
+        'cards': {'added': added, 'removed': removed, 'changed': changed, 'unchanged': unchanged},
+        'assets': {
+            'added': {path: new_assets[path] for path in assets_added},
+            'changed': {path: new_assets[path] for path in assets_changed},
+            'removed': assets_removed,
+        },
+        'deck': deck,
+    }
+    return delta, assets_added + assets_changed
+
+
+def write_delta_package(delta, asset_paths, output_path, root='.'):
+    """原子地写出zip包，返回包的字节数"""
+    tmp_path = f"{output_path}.tmp"
+    with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=9) as package:
+        package.writestr(DELTA_ENTRY, json.dumps(delta, ensure_ascii=False, separators=(',', ':')))
+        for path in asset_paths:
+            compress_type = zipfile.ZIP_STORED if path.lower().endswith(STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+            package.write(os.path.join(root, path), ASSET_PREFIX + path, compress_type=compress_type)
+    os.replace(tmp_path, output_path)
+    return os.path.getsize(output_path)
+
+
+def read_delta(package):
+    delta = json.loads(package.read(DELTA_ENTRY))
+    if delta.get('version') != DELTA_VERSION:
+        raise ValueError(f"不支持的增量包版本: {delta.get('version')}")
+    return delta
+
+
+def safe_asset_path(path):
+    """包中的路径必须是相对路径且不能跳出目标目录"""
+    normalized = posixpath.normpath(path)
+    if posixpath.isabs(normalized) or normalized.startswith('..') or '\\' in path:
+        raise ValueError(f"增量包中的路径不安全: {path}")
+    return normalized
+
+
+def apply_deck_delta(base_data, delta):
+    """在旧卡组上应用delta，返回目标版本的原始JSON；包与旧卡组不匹配时抛出ValueError"""
+    base_cards = {card_id: entry for _, card_id, entry in raw_cards(base_data)}
+    data = dict(delta['deck'])
+    categories = []
+    for category in data['categories']:
+        images = []
+        for entry in category['images']:
+            if isinstance(entry, str):
+                if entry not in base_cards:
+                    raise ValueError(f"旧卡组中没有卡片 {entry}，增量包不适用于这个版本")
+                entry = base_cards[entry]
+            images.append(entry)
+        categories.append(dict(category, images=images))
+    data['categories'] = categories
+    decode_deck(data)
+    return data
+
+
+def apply_delta(package_path, root='.', deck_path='categories.json'):
+    """
+    把增量包应用到root目录下的旧版本：先校验旧卡组和包内文件，再写入资源、删除旧资源，最后写卡组
+    返回 (写入的资源数, 删除的资源数)
+    """
+    deck_file = os.path.join(root, deck_path)
+    with zipfile.ZipFile(package_path) as package:
+        delta = read_delta(package)
+        base_data, base_content = read_deck(deck_file)
+        if hashlib.sha256(base_content).hexdigest() != delta['from']['deck_sha256']:
+            raise ValueError(f"{deck_file} 不是增量包对应的旧版本")
+
+        data = deck_bytes(apply_deck_delta(base_data, delta))
+        if hashlib.sha256(data).hexdigest() != delta['to']['deck_sha256']:
+            raise ValueError("还原的卡组与目标版本的校验和不一致")
+
+        payloads = {**delta['assets']['added'], **delta['assets']['changed']}
+        # 全部文件校验通过后才开始写入，损坏的包不会留下半更新的目录
+        for path, entry in payloads.items():
+            safe_asset_path(path)
+            if hashlib.sha256(package.read(ASSET_PREFIX + path)).hexdigest() != entry['sha256']:
+                raise ValueError(f"包内文件校验和不一致: {path}")
+
+        for path in payloads:
+            target = os.path.join(root, safe_asset_path(path))
+            content = package.read(ASSET_PREFIX + path)
+            os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+            tmp_path = f"{target}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, target)
+
+        removed = 0
+        for path in delta['assets']['removed']:
+            try:
+                os.remove(os.path.join(root, safe_asset_path(path)))
+                removed += 1
+            except FileNotFoundError:
+                pass
+
+    tmp_path = f"{deck_file}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, deck_file)
+    return len(payloads), removed
+
+
+def verify_delta(package_path, old_deck_path, old_manifest, new_deck_path, new_manifest):
+    """
+    不接触任何资源目录，确认 旧版本 + 增量包 = 新版本：
+    旧卡组的校验和、还原出的卡组字节、包内每个文件的sha256，以及应用后的资源清单都与目标一致
+    返回问题列表，为空表示通过
+    """
+    problems = []
+    with zipfile.ZipFile(package_path) as package:
+        delta = read_delta(package)
+        old_data, old_content = read_deck(old_deck_path)
+        if hashlib.sha256(old_content).hexdigest() != delta['from']['deck_sha256']:
+            problems.append(f"旧卡组 {old_deck_path} 的校验和与增量包不一致")
+
+        try:
+            data = deck_bytes(apply_deck_delta(old_data, delta))
+            with open(new_deck_path, 'rb') as f:
+                if data != f.read():
+                    problems.append(f"还原的卡组与 {new_deck_path} 不一致")
+        except (ValueError, DeckValidationError) as e:
+            problems.append(f"无法还原卡组: {e}")
+
+        names = set(package.namelist())
+        state = {path: entry['sha256'] for path, entry in old_manifest['assets'].items()}
+        for path, entry in {**delta['assets']['added'], **delta['assets']['changed']}.items():
+            if ASSET_PREFIX + path not in names:
+                problems.append(f"包中缺少文件: {path}")
+                continue
+            if hashlib.sha256(package.read(ASSET_PREFIX + path)).hexdigest() != entry['sha256']:
+                problems.append(f"包内文件校验和不一致: {path}")
+            state[path] = entry['sha256']
+        for path in delta['assets']['removed']:
+            state.pop(path, None)
+
+    expected = {path: entry['sha256'] for path, entry in new_manifest['assets'].items()}
+    for path in sorted(state.keys() | expected.keys()):
+        if state.get(path) != expected.get(path):
+            problems.append(f"应用后的资源与目标版本不一致: {path}")
+    return problems
+
+
+def create_delta(old_deck_path, old_manifest_path, new_deck_path, output_path,
+                 image_root=IMAGE_ROOT, voice_root=VOICE_ROOT, verify=False):
+    """生成增量包；新版本的资源有缺失或损坏时不生成。返回验证问题列表"""
+    metrics = get_metrics()
+    with open(old_manifest_path, 'r', encoding='utf-8') as f:
+        old_manifest = json.load(f)
+    old_data, old_content = read_deck(old_deck_path)
+    new_data, new_content = read_deck(new_deck_path)
+    if deck_bytes(new_data) != new_content:
+        print(f"✗ {new_deck_path} 不是项目统一的JSON格式(indent=2)，无法保证逐字节还原；"
+              f"请先用 deck_model.save_deck() 重新写出")
+        sys.exit(1)
+
+    results, _ = verify_assets(decode_deck(new_data), image_root, voice_root)
+    broken = [result for result in results if result.error]
+    if broken:
+        print(f"✗ 新版本有 {len(broken)} 个资源缺失或损坏，请先运行 verify_assets.py 检查:")
+        for result in broken[:10]:
+            print(f"  - {result.path}: {result.error}")
+        sys.exit(1)
+    new_manifest = build_manifest(results, new_deck_path)
+
+    with metrics.stage('diff'):
+        delta, asset_paths = build_delta(old_data, old_content, old_manifest, new_data, new_content, new_manifest)
+    with metrics.stage('package', items=len(asset_paths)):
+        size = write_delta_package(delta, asset_paths, output_path)
+    metrics.incr('delta_package_bytes', size)
+
+    cards, assets = delta['cards'], delta['assets']
+    full_size = new_manifest['total_bytes'] + len(new_content)
+    print(f"卡片: 新增 {len(cards['added'])}，删除 {len(cards['removed'])}，修改 {len(cards['changed'])}，"
+          f"未变 {cards['unchanged']}")
+    print(f"资源: 新增 {len(assets['added'])}，修改 {len(assets['changed'])}，删除 {len(assets['removed'])}")
+    print(f"✓ 增量包已保存到: {output_path} ({size / 1024:.1f} KB，完整包 {full_size / 1024 / 1024:.1f} MB)")
+
+    if not verify:
+        return []
+    with metrics.stage('verify_delta'):
+        problems = verify_delta(output_path, old_deck_path, old_manifest, new_deck_path, new_manifest)
+    if problems:
+        print(f"✗ 验证失败，{len(problems)} 个问题:")
+        for problem in problems[:20]:
+            print(f"  - {problem}")
+    else:
+        print("✓ 验证通过: 旧版本 + 增量包 = 新版本")
+    return problems
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='生成或应用卡组增量更新包')
+    parser.add_argument('--from', dest='old_deck', type=str, help='旧版本的categories.json')
+    parser.add_argument('--from-manifest', type=str, help='旧版本发布时verify_assets.py生成的资源清单')
+    parser.add_argument('--to', dest='new_deck', type=str, default='categories.json',
+                        help='新版本的categories.json (默认: categories.json)')
+    parser.add_argument('--image-root', type=str, default=IMAGE_ROOT, help=f'新版本图片目录 (默认: {IMAGE_ROOT})')
+    parser.add_argument('--voice-root', type=str, default=VOICE_ROOT, help=f'新版本语音根目录 (默认: {VOICE_ROOT})')
+    parser.add_argument('--output', type=str, default=DELTA_PATH, help=f'增量包输出路径 (默认: {DELTA_PATH})')
+    parser.add_argument('--verify', action='store_true', help='生成后验证旧版本 + 增量包能还原出新版本')
+    parser.add_argument('--apply', type=str, help='把指定的增量包应用到--root目录下的旧版本')
+    parser.add_argument('--root', type=str, default='.', help='应用增量包的目录 (默认: 当前目录)')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    if args.apply:
+        try:
+            written, removed = apply_delta(args.apply, args.root)
+        except ValueError as e:
+            print(f"✗ 无法应用增量包: {e}")
+            sys.exit(1)
+        print(f"✓ 已更新 {args.root}: 写入 {written} 个文件，删除 {removed} 个文件")
+        return
+
+    if not (args.old_deck and args.from_manifest):
+        parser.error('生成增量包需要 --from 和 --from-manifest')
+
+    with metrics_session('deck_delta', args.metrics, args.profile):
+        problems = create_delta(args.old_deck, args.from_manifest, args.new_deck, args.output,
+                                args.image_root, args.voice_root, args.verify)
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+卡组数据模型
+categories.json在内存中的紧凑表示：Deck / Category / Card / Word / VoiceFiles 都使用__slots__，
+加载时一次遍历完成结构校验，错误带JSON路径一起报告；
+未知字段保存在extra中，to_dict()按原有字段顺序写回，读入再写出的文件与原文件逐字节一致
+"""
+
+import json
+import os
+
+DECK_PATH = 'categories.json'
+
+
+class DeckValidationError(ValueError):
+    """卡组结构不合法，errors为 "JSON路径: 问题" 列表"""
+
+    def __init__(self, errors):
+        self.errors = errors
+        summary = '; '.join(errors[:5])
+        if len(errors) > 5:
+            summary += f"; ... 共 {len(errors)} 个问题"
+        super().__init__(summary)
+
+
+def _extra(raw, known):
+    """未知字段，保持原有顺序；没有时为None以节省内存"""
+    if raw.keys() <= known:
+        return None
+    return {key: value for key, value in raw.items() if key not in known}
+
+
+class Word:
+    __slots__ = ('cn', 'en', 'pinyin', 'tones', 'extra')
+    KEYS = frozenset(('cn', 'en', 'pinyin', 'tones'))
+
+    def __init__(self, cn, en, pinyin=None, tones=None, extra=None):
+        self.cn = cn
+        self.en = en
+        self.pinyin = pinyin
+        self.tones = tones
+        self.extra = extra
+
+    def to_dict(self):
+        result = {'cn': self.cn, 'en': self.en}
+        if self.pinyin is not None:
+            result['pinyin'] = self.pinyin
+        if self.tones is not None:
+            result['tones'] = self.tones
+        if self.extra:
+            result.update(self.extra)
+        return result
+
+
+class VoiceFiles:
+    """各语言的语音文件名；en/cn之外的变体(例如慢速版本)保存在extra中"""
+    __slots__ = ('cn', 'en', 'extra')
+    KEYS = frozenset(('cn', 'en'))
+
+    def __init__(self, cn, en, extra=None):
+        self.cn = cn
+        self.en = en
+        self.extra = extra
+
+    def get(self, language, default=None):
+        if language in self.KEYS:
+            return getattr(self, language)
+        return (self.extra or {}).get(language, default)
+
+    def variants(self):
+        """extra中 <语言>_<变体> 形式的语音文件，返回 [(键, 语言, 文件名)]，例如 ('en_slow', 'en', 'cat_en_slow.wav')"""
+        return [(key, key.split('_', 1)[0], filename) for key, filename in (self.extra or {}).items()
+                if key.split('_', 1)[0] in self.KEYS and type(filename) is str]
+
+    def to_dict(self):
+        result = {'cn': self.cn, 'en': self.en}
+        if self.extra:
+            result.update(self.extra)
+        return result
+
+
+class Card:
+    __slots__ = ('filename', 'word', 'voice', 'voice_duration_ms', 'extra')
+    KEYS = frozenset(('filename', 'word', 'voice_filename', 'voice_duration_ms'))
+
+    def __init__(self, filename, word, voice, voice_duration_ms=None, extra=None):
+        self.filename = filename
+        self.word = word
+        self.voice = voice
+        self.voice_duration_ms = voice_duration_ms
+        self.extra = extra
+
+    @property
+    def id(self):
+        """卡片id为不带扩展名的图片文件名"""
+        return os.path.splitext(self.filename)[0]
+
+    def to_dict(self):
+        result = {'filename': self.filename, 'word': self.word.to_dict(), 'voice_filename': self.voice.to_dict()}
+        if self.voice_duration_ms is not None:
+            result['voice_duration_ms'] = self.voice_duration_ms
+        if self.extra:
+            result.update(self.extra)
+        return result
+
+
+class Category:
+    __slots__ = ('id', 'name', 'cards', 'extra')
+    KEYS = frozenset(('id', 'name', 'count', 'images'))
+
+    def __init__(self, id, name, cards, extra=None):
+        self.id = id
+        self.name = name
+        self.cards = cards
+        self.extra = extra
+
+    def to_dict(self):
+        result = {'id': self.id, 'name': self.name, 'count': len(self.cards),
+                  'images': [card.to_dict() for card in self.cards]}
+        if self.extra:
+            result.update(self.extra)
+        return result
+
+
+class Deck:
+    __slots__ = ('version', 'description', 'categories', 'statistics', 'extra')
+    KEYS = frozenset(('version', 'description', 'categories', 'statistics'))
+
+    def __init__(self, version, description, categories, statistics=None, extra=None):
+        self.version = version
+        self.description = description
+        self.categories = categories
+        self.statistics = statistics
+        self.extra = extra
+
+    def cards(self):
+        """按顺序遍历 (分类, 卡片)"""
+        for category in self.categories:
+            for card in category.cards:
+                yield category, card
+
+    @property
+    def card_count(self):
+        return sum(len(category.cards) for category in self.categories)
+
+    def to_dict(self):
+        result = {}
+        if self.version is not None:
+            result['version'] = self.version
+        if self.description is not None:
+            result['description'] = self.description
+        result['categories'] = [category.to_dict() for category in self.categories]
+        if self.statistics is not None:
+            result['statistics'] = self.statistics
+        if self.extra:
+            result.update(self.extra)
+        return result
+
+
+def _string_map(raw, path, errors, required):
+    """校验 {语言: 非空字符串} 形式的对象"""
+    if not isinstance(raw, dict):
+        errors.append(f"{path}: 应为对象")
+        return False
+    ok = True
+    for key in required:
+        value = raw.get(key)
+        if not isinstance(value, str) or not value:
+            errors.append(f"{path}.{key}: 应为非空字符串")
+            ok = False
+    return ok
+
+
+def _card_errors(raw, path):
+    """列出一张卡片的全部问题，只在快速检查失败时调用"""
+    errors = []
+    if not isinstance(raw, dict):
+        return [f"{path}: 应为对象"]
+    filename = raw.get('filename')
+    if not isinstance(filename, str) or not filename:
+        errors.append(f"{path}.filename: 应为非空字符串")
+    word = raw.get('word')
+    _string_map(word, f"{path}.word", errors, ('en',))
+    if isinstance(word, dict):
+        # 中文翻译可能尚未生成，允许为空字符串
+        if not isinstance(word.get('cn', ''), str):
+            errors.append(f"{path}.word.cn: 应为字符串")
+        tones = word.get('tones')
+        if tones is not None and not (isinstance(tones, list) and all(type(t) is int for t in tones)):
+            errors.append(f"{path}.word.tones: 应为整数数组")
+    _string_map(raw.get('voice_filename'), f"{path}.voice_filename", errors, ('en', 'cn'))
+    durations = raw.get('voice_duration_ms')
+    if durations is not None and not (isinstance(durations, dict)
+                                      and all(type(v) is int for v in durations.values())):
+        errors.append(f"{path}.voice_duration_ms: 应为 {{语言: 毫秒}} 对象")
+    return errors
+
+
+def decode_card(raw):
+    """解码一张卡片，结构不合法时返回None（由调用方用_card_errors()生成错误信息）"""
+    # 快速路径：只做类型检查，不拼接JSON路径
+    try:
+        filename = raw['filename']
+        word = raw['word']
+        voice = raw['voice_filename']
+        en = word['en']
+        cn = word.get('cn', '')
+        voice_cn = voice['cn']
+        voice_en = voice['en']
+    except (KeyError, TypeError, AttributeError):
+        return None
+    if not (type(filename) is str and filename and type(en) is str and en and type(cn) is str
+            and type(voice_cn) is str and voice_cn and type(voice_en) is str and voice_en):
+        return None
+
+    tones = word.get('tones')
+    if tones is not None and not (type(tones) is list and all(type(t) is int for t in tones)):
+        return None
+    durations = raw.get('voice_duration_ms')
+    if durations is not None and not (type(durations) is dict and all(type(v) is int for v in durations.values())):
+        return None
+
+    return Card(
+        filename,
+        Word(cn, en, word.get('pinyin'), tones, _extra(word, Word.KEYS)),
+        VoiceFiles(voice_cn, voice_en, _extra(voice, VoiceFiles.KEYS)),
+        durations,
+        _extra(raw, Card.KEYS),
+    )
+
+
+def decode_deck(data):
+    """一次遍历解码并校验整个卡组，发现任何问题时抛出DeckValidationError"""
+    errors = []
+    if not isinstance(data, dict) or not isinstance(data.get('categories'), list):
+        raise DeckValidationError(["$.categories: 应为数组"])
+
+    categories = []
+    seen_ids = {}
+    for i, raw in enumerate(data['categories']):
+        path = f"categories[{i}]"
+        if not isinstance(raw, dict):
+            errors.append(f"{path}: 应为对象")
+            continue
+        if not isinstance(raw.get('id'), str) or not raw['id']:
+            errors.append(f"{path}.id: 应为非空字符串")
+            continue
+        _string_map(raw.get('name'), f"{path}.name", errors, ('en',))
+        images = raw.get('images')
+        if not isinstance(images, list):
+            errors.append(f"{path}.images: 应为数组")
+            continue
+        if 'count' in raw and raw['count'] != len(images):
+            errors.append(f"{path}.count: 为 {raw['count']}，实际有 {len(images)} 张卡片")
+
+        cards = []
+        for j, image in enumerate(images):
+            card = decode_card(image)
+            if card is None:
+                errors.extend(_card_errors(image, f"{path}.images[{j}]"))
+                continue
+            if card.filename in seen_ids:
+                errors.append(f"{path}.images[{j}].filename: {card.filename} 与 {seen_ids[card.filename]} 重复")
+            seen_ids[card.filename] = f"{path}.images[{j}]"
+            cards.append(card)
+        categories.append(Category(raw['id'], raw.get('name'), cards, _extra(raw, Category.KEYS)))
+
+    if errors:
+        raise DeckValidationError(errors)
+    return Deck(data.get('version'), data.get('description'), categories, data.get('statistics'),
+                _extra(data, Deck.KEYS))
+
+
+def load_deck(path=DECK_PATH):
+    """读取并校验卡组文件"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return decode_deck(json.load(f))
+
+
+def save_deck(deck, path=DECK_PATH):
+    """原子地写出卡组文件，格式与项目中其他脚本一致"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(deck.to_dict(), f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='校验卡组文件')
+    parser.add_argument('--deck', type=str, default=DECK_PATH, help=f'卡组文件 (默认: {DECK_PATH})')
+    args = parser.parse_args()
+
+    try:
+        deck = load_deck(args.deck)
+    except DeckValidationError as e:
+        print(f"✗ {args.deck} 有 {len(e.errors)} 个问题:")
+        for error in e.errors[:50]:
+            print(f"  - {error}")
+        raise SystemExit(1)
+    print(f"✓ {args.deck}: {len(deck.categories)} 个分类，{deck.card_count} 张卡片")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+#!/usr/bin/env python3
+"""
+分布式语音重建
+协调器把卡组中需要合成的语音按语言拆成工作单元放入work_queue.py的队列，
+任意多台机器上的worker领取单元，在本机只加载一次模型，合成结果按
+(模型, 说话人, 语言, 文本) 的sha256写入内容寻址的音频存储(与tts_server.py的缓存格式相同)，
+全部完成后由协调器从存储中取出，写到 resource/voice/<语言>/ 下
+
+- 存储中已有的语音不进入队列，重建只合成新增或修改过的文本，相同文本只合成一次
+- 所有worker使用协调器指定的后端，同一文本在任何机器上都得到同一个键
+- worker处理期间定期续约；崩溃或断网的worker的单元在租约到期后由其他worker重做，
+  合成出错的单元延迟重试，超过最大尝试次数后记为失败
+- 单元远多于worker时，总耗时随构建机器数近似线性缩短
+
+多台机器需要访问同一个队列(redis://...)和同一个存储目录(共享挂载)
+
+用法:
+    # 协调器：提交任务、等待完成、写出语音文件
+    python3 distributed_tts.py --coordinator --queue redis://10.0.0.5:6379/0 --store /mnt/tts_store
+    # 每台构建机器上运行一个或多个worker
+    python3 distributed_tts.py --worker --queue redis://10.0.0.5:6379/0 --store /mnt/tts_store
+    # 单机：本地SQLite队列，协调器同时启动两个worker进程
+    python3 distributed_tts.py --coordinator --local-workers 2
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+from deck_model import load_deck
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+from tts_pipeline import encode_pcm16, wav_bytes
+from tts_server import DEFAULT_CACHE_DIR, AudioCache, audio_cache_key
+from wav_info import LANGUAGES, VOICE_ROOT
+from work_queue import DEFAULT_LEASE_SECONDS, DEFAULT_MAX_ATTEMPTS, DEFAULT_QUEUE, open_queue
+
+QUEUE_NAME = 'tts'
+DEFAULT_UNIT_SIZE = 20
+DEFAULT_POLL_INTERVAL = 2.0
+# 合成出错的单元等待一段时间再重试，给临时故障(显存不足、共享存储抖动)恢复的机会
+RETRY_DELAY = 30.0
+DEFAULT_BACKENDS = {'en': 'vits', 'cn': 'xtts'}
+
+
+def choose_backend(language, name=None):
+    """显式指定的后端，其次是本机校准结果(tts_calibrate.py)，最后是各语言一直使用的默认后端"""
+    if name:
+        return name
+    from tts_calibrate import cached_backend
+    return cached_backend(language) or DEFAULT_BACKENDS[language]
+
+
+def backend_identity(name, language):
+    """后端在缓存键中的 (模型名, 说话人, 语言)；只创建后端对象，不加载模型"""
+    from tts_backends import create_backend
+    backend = create_backend(name, language)
+    return backend.name, getattr(backend, 'speaker', None), getattr(backend, 'language', None)
+
+
+def card_texts(deck, language):
+    """[(文本, 语音文件名)]，与vits_p273_english_tts.py / xtts_chinese_tts.py的输入一致"""
+    items = []
+    for _, card in deck.cards():
+        text = card.word.en if language == 'en' else card.word.cn
+        if text and card.voice.get(language):
+            items.append((text, card.voice.get(language)))
+    return items
+
+
+def plan_units(deck, backends, store, voice_root=VOICE_ROOT, unit_size=DEFAULT_UNIT_SIZE, force=False):
+    """
+    返回 (工作单元列表, 输出列表)
+    工作单元: (单元id, {'language', 'backend', 'force', 'items': [{'key', 'text'}]})，
+    只包含存储中没有的文本(force时包含全部文本，worker也不再检查存储)
+    输出: [(语音文件路径, 键)]，包括已经在存储中的语音
+    """
+    units, targets = [], []
+    for language, name in backends.items():
+        model, speaker, backend_language = backend_identity(name, language)
+        missing = {}
+        for text, filename in card_texts(deck, language):
+            key = audio_cache_key(model, speaker, backend_language, text)
+            targets.append((os.path.join(voice_root, language, filename), key))
+            if key not in missing and (force or not store.has(key)):
+                missing[key] = text
+        items = [{'key': key, 'text': text} for key, text in missing.items()]
+        for start in range(0, len(items), unit_size):
+            unit_id = f"{language}-{start // unit_size:05d}"
+            units.append((unit_id, {'language': language, 'backend': name, 'force': force,
+                                    'items': items[start:start + unit_size]}))
+    return units, targets
+
+
+def materialize(targets, store):
+    """把存储中的语音写到卡组引用的路径，内容相同的文件不动；返回 (写入数, 缺失的路径列表)"""
+    written, missing = 0, []
+    for path, key in targets:
+        data = store.get(key)
+        if data is None:
+            missing.append(path)
+            continue
+        try:
+            with open(path, 'rb') as f:
+                if f.read() == data:
+                    continue
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        written += 1
+    return written, missing
+
+
+class LeaseKeeper(threading.Thread):
+    """处理单元期间每隔租约时长的三分之一续约一次；续约失败说明租约已经被别人接手"""
+
+    def __init__(self, queue, lease):
+        super().__init__(daemon=True)
+        self.queue = queue
+        self.lease = lease
+        self.lost = False
+        self._finished = threading.Event()
+
+    def run(self):
+        while not self._finished.wait(self.queue.lease_seconds / 3):
+            if not self.queue.extend(self.lease):
+                self.lost = True
+                return
+
+    def stop(self):
+        self._finished.set()
+        self.join()
+
+
+class Worker:
+    """在一台机器上循环领取并处理单元，每种 (后端, 语言) 的模型只加载一次"""
+
+    def __init__(self, queue, store, worker_id=None):
+        self.queue = queue
+        self.store = store
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._backends = {}
+
+    def backend(self, name, language):
+        if (name, language) not in self._backends:
+            from tts_backends import create_backend
+            backend = create_backend(name, language)
+            backend.load()
+            self._backends[name, language] = backend
+        return self._backends[name, language]
+
+    def process(self, lease, keeper):
+        """合成单元中存储里还没有的文本(单元带有force时全部重新合成)，返回结果摘要；租约丢失时返回None"""
+        metrics = get_metrics()
+        start = time.perf_counter()
+        payload = lease.payload
+        backend = self.backend(payload['backend'], payload['language'])
+        synthesized = cached = 0
+        for item in payload['items']:
+            if keeper.lost:
+                return None
+            # 另一个worker(租约过期前的旧worker)可能已经写入
+            if not payload.get('force') and self.store.has(item['key']):
+                cached += 1
+                metrics.cache_result('tts_store', True)
+                continue
+            metrics.cache_result('tts_store', False)
+            with metrics.timed('synthesis'):
+                samples, sample_rate = backend.synthesize(item['text'])
+            self.store.put(item['key'], wav_bytes(encode_pcm16(samples), sample_rate))
+            synthesized += 1
+        return {'worker': self.worker_id, 'synthesized': synthesized, 'cached': cached,
+                'seconds': round(time.perf_counter() - start, 3)}
+
+    def run(self, poll_interval=DEFAULT_POLL_INTERVAL, keep_running=False):
+        """处理单元直到队列中没有未完成的单元(keep_running时一直等待新任务)，返回处理的单元数"""
+        metrics = get_metrics()
+        processed = 0
+        print(f"worker {self.worker_id} 已启动")
+        while True:
+            lease = self.queue.claim(self.worker_id)
+            if lease is None:
+                status = self.queue.status()
+                if not keep_running and not status.pending and not status.leased:
+                    break
+                # 其他worker还在处理，它们的租约可能过期，稍后再看
+                time.sleep(poll_interval)
+                continue
+
+            keeper = LeaseKeeper(self.queue, lease)
+            keeper.start()
+            try:
+                result = self.process(lease, keeper)
+            except KeyboardInterrupt:
+                keeper.stop()
+                self.queue.release(lease)
+                raise
+            except ImportError as e:
+                # 本机没有安装TTS：单元交还给其他机器，不计入尝试次数
+                keeper.stop()
+                self.queue.release(lease)
+                print(f"✗ 本机无法加载模型: {e}")
+                break
+            except Exception as e:
+                keeper.stop()
+                error = f"{type(e).__name__}: {e}"
+                print(f"  ✗ {lease.unit_id} (第 {lease.attempt} 次): {error}")
+                metrics.incr('units_failed')
+                self.queue.fail(lease, error, RETRY_DELAY)
+                continue
+            keeper.stop()
+
+            if result is None or not self.queue.complete(lease, result):
+                print(f"  ⚠️  {lease.unit_id} 的租约已过期并被其他worker接手")
+                metrics.incr('units_lost')
+                continue
+            processed += 1
+            metrics.add_items('units')
+            print(f"  ✓ {lease.unit_id}: 合成 {result['synthesized']} 条，"
+                  f"已存在 {result['cached']} 条，用时 {result['seconds']:.1f} 秒")
+        print(f"worker {self.worker_id} 退出，处理了 {processed} 个单元")
+        return processed
+
+
+def start_local_workers(count, args):
+    """在本机启动count个worker进程，使用与协调器相同的队列和存储"""
+    command = [sys.executable, os.path.abspath(__file__), '--worker', '--queue', args.queue,
+               '--store', args.store, '--lease', str(args.lease), '--max-attempts', str(args.max_attempts)]
+    return [subprocess.Popen(command) for _ in range(count)]
+
+
+def wait_for_queue(queue, total_units, poll_interval=DEFAULT_POLL_INTERVAL, processes=()):
+    """
+    等待全部单元完成或失败，定期打印进度；
+    processes为本机启动的worker进程，它们全部退出(例如本机无法加载模型)时不再等待
+    """
+    start = time.monotonic()
+    last = None
+    while True:
+        status = queue.status()
+        finished = status.done + status.failed
+        if status != last:
+            elapsed = time.monotonic() - start
+            eta = elapsed / finished * (total_units - finished) if finished else 0
+            print(f"  进度: {finished}/{total_units} 个单元 (处理中 {status.leased}，失败 {status.failed})，"
+                  f"已用 {elapsed:.0f} 秒{f'，预计还需 {eta:.0f} 秒' if finished else ''}")
+            last = status
+        if not status.pending and not status.leased:
+            return status
+        if processes and all(process.poll() is not None for process in processes):
+            print(f"⚠️  本机的worker已全部退出，还有 {status.pending + status.leased} 个单元未完成")
+            return status
+        time.sleep(poll_interval)
+
+
+def run_coordinator(queue, store, deck_path, backends, voice_root=VOICE_ROOT, unit_size=DEFAULT_UNIT_SIZE,
+                    force=False, start_workers=None, poll_interval=DEFAULT_POLL_INTERVAL):
+    """提交任务并等待完成，写出语音文件；返回是否全部成功"""
+    metrics = get_metrics()
+    deck = load_deck(deck_path)
+    with metrics.stage('plan', items=deck.card_count):
+        units, targets = plan_units(deck, backends, store, voice_root, unit_size, force)
+    texts = sum(len(payload['items']) for _, payload in units)
+    print(f"卡组共 {len(targets)} 个语音文件，需要合成 {texts} 条不同的文本，分成 {len(units)} 个单元 "
+          f"(后端: {', '.join(f'{language}={name}' for language, name in backends.items())})")
+
+    processes = []
+    if units:
+        queue.clear()
+        queue.submit(units)
+        processes = start_workers() if start_workers else []
+        if not processes:
+            print(f"已提交到队列 {queue.name}，在构建机器上运行 distributed_tts.py --worker 开始处理")
+        with metrics.stage('wait', items=len(units)):
+            status = wait_for_queue(queue, len(units), poll_interval, processes)
+        for process in processes:
+            process.wait()
+
+        contributions = {}
+        for result in queue.results().values():
+            entry = contributions.setdefault(result['worker'], [0, 0, 0.0])
+            entry[0] += 1
+            entry[1] += result['synthesized']
+            entry[2] += result['seconds']
+        for worker, (count, synthesized, seconds) in sorted(contributions.items()):
+            print(f"  {worker}: {count} 个单元，合成 {synthesized} 条，处理用时 {seconds:.0f} 秒")
+        for unit_id, error in sorted(queue.failures().items()):
+            print(f"  ✗ {unit_id}: {error}")
+        if status.failed:
+            print(f"⚠️  {status.failed} 个单元失败，修复后重新运行协调器只会提交仍然缺少的文本")
+
+    with metrics.stage('materialize', items=len(targets)):
+        written, missing = materialize(targets, store)
+    print(f"写出 {written} 个语音文件，{len(targets) - written - len(missing)} 个未变化，缺失 {len(missing)} 个")
+    return not missing
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='通过共享队列在多台机器上并行重建卡组语音')
+    role = parser.add_mutually_exclusive_group(required=True)
+    role.add_argument('--coordinator', action='store_true', help='提交任务、等待完成并写出语音文件')
+    role.add_argument('--worker', action='store_true', help='领取并处理队列中的单元')
+    role.add_argument('--status', action='store_true', help='显示队列状态')
+    parser.add_argument('--queue', type=str, default=DEFAULT_QUEUE,
+                        help=f'队列地址，sqlite:<路径> 或 redis://主机:端口/库 (默认: {DEFAULT_QUEUE})')
+    parser.add_argument('--store', type=str, default=DEFAULT_CACHE_DIR,
+                        help=f'内容寻址的音频存储目录，多台机器时使用共享挂载 (默认: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--lease', type=float, default=DEFAULT_LEASE_SECONDS,
+                        help=f'租约时长，秒 (默认: {DEFAULT_LEASE_SECONDS})')
+    parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS,
+                        help=f'每个单元最多尝试次数 (默认: {DEFAULT_MAX_ATTEMPTS})')
+    parser.add_argument('--deck', type=str, default='categories.json', help='卡组文件 (默认: categories.json)')
+    parser.add_argument('--voice-root', type=str, default=VOICE_ROOT, help=f'语音根目录 (默认: {VOICE_ROOT})')
+    parser.add_argument('--languages', type=str, nargs='+', choices=LANGUAGES, default=list(LANGUAGES),
+                        help='重建的语言 (默认: en cn)')
+    parser.add_argument('--en-backend', type=str, help='英文后端 (默认: 本机校准结果或vits)')
+    parser.add_argument('--cn-backend', type=str, help='中文后端 (默认: 本机校准结果或xtts)')
+    parser.add_argument('--unit-size', type=int, default=DEFAULT_UNIT_SIZE,
+                        help=f'每个单元的文本数 (默认: {DEFAULT_UNIT_SIZE})')
+    parser.add_argument('--force', action='store_true', help='忽略存储中已有的语音，全部重新合成')
+    parser.add_argument('--local-workers', type=int, default=0, help='协调器同时在本机启动的worker进程数 (默认: 0)')
+    parser.add_argument('--keep-running', action='store_true', help='worker在队列处理完后继续等待新任务')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    queue = open_queue(args.queue, QUEUE_NAME, args.lease, args.max_attempts)
+    if args.status:
+        from work_queue import print_status
+        print_status(queue)
+        return
+
+    store = AudioCache(args.store)
+    if args.worker:
+        with metrics_session('distributed_tts_worker', args.metrics, args.profile):
+            try:
+                Worker(queue, store).run(keep_running=args.keep_running)
+            except KeyboardInterrupt:
+                print("\n已放弃当前单元，其他worker会接手")
+        return
+
+    with metrics_session('distributed_tts', args.metrics, args.profile):
+        explicit = {'en': args.en_backend, 'cn': args.cn_backend}
+        backends = {language: choose_backend(language, explicit[language]) for language in args.languages}
+        start_workers = (lambda: start_local_workers(args.local_workers, args)) if args.local_workers else None
+        ok = run_coordinator(queue, store, args.deck, backends, args.voice_root, args.unit_size, args.force,
+                             start_workers)
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
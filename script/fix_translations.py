@@ -3,18 +3,18 @@
 直接修复categories.json中的中文翻译
 """
 
-import json
 import re
 
+from deck_model import load_deck, save_deck
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+
 def load_categories():
-    """加载categories.json文件"""
-    with open('categories.json', 'r', encoding='utf-8') as f:
-        return json.load(f)
+    """加载并校验categories.json文件"""
+    return load_deck('categories.json')
 
-def save_categories(data):
+def save_categories(deck):
     """保存categories.json文件"""
-    with open('categories.json', 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    save_deck(deck, 'categories.json')
 
 def create_translation_fixes():
     """创建翻译修复映射"""
@@ -254,48 +254,60 @@ def improve_animal_translations(chinese_text, english_text):
 
 def fix_translations():
     """修复翻译"""
+    metrics = get_metrics()
+
     print("正在加载categories.json...")
-    data = load_categories()
+    with metrics.stage('load', items=1):
+        deck = load_categories()
 
     print("正在修复翻译...")
     fixes = create_translation_fixes()
 
     total_fixes = 0
-    for category in data['categories']:
-        for image in category['images']:
-            original_cn = image['word']['cn']
-            original_en = image['word']['en']
+    with metrics.stage('fix'):
+        for category, card in deck.cards():
+            original_cn = card.word.cn
+            original_en = card.word.en
 
             # 应用直接修复
             if original_cn in fixes:
-                image['word']['cn'] = fixes[original_cn]
+                card.word.cn = fixes[original_cn]
                 total_fixes += 1
                 continue
 
             # 应用动物翻译改进
-            if category['id'] == 'animals':
+            if category.id == 'animals':
                 improved = improve_animal_translations(original_cn, original_en)
                 if improved != original_cn:
-                    image['word']['cn'] = improved
+                    card.word.cn = improved
                     total_fixes += 1
                     continue
 
             # 通用模式修复
             fixed = fix_common_patterns(original_cn)
             if fixed != original_cn:
-                image['word']['cn'] = fixed
+                card.word.cn = fixed
                 total_fixes += 1
 
+    metrics.add_items('fix', total_fixes)
     print(f"修复了 {total_fixes} 个翻译")
 
     print("正在保存修复后的文件...")
-    save_categories(data)
+    with metrics.stage('write', items=1):
+        save_categories(deck)
 
     print("翻译修复完成！")
 
 def main():
     """主函数"""
-    fix_translations()
+    import argparse
+
+    parser = argparse.ArgumentParser(description='修复categories.json中的中文翻译')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    with metrics_session('fix_translations', args.metrics, args.profile):
+        fix_translations()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Fork-server模式的TTS合成进程池
+父进程只加载一次模型，然后fork出多个合成进程，模型权重以写时复制的方式在进程间共享；
+每个合成进程只增加自己的私有内存，可同时运行的进程数不再受"每个进程一份权重"的限制
+
+父进程中的ForkServer.worker_backend()返回与CoquiBackend接口相同的代理对象，
+直接交给tts_pipeline.TTSPipeline使用：每个合成线程对应一个子进程，写文件仍在父进程的写入线程池中完成
+
+只支持Linux/macOS的fork启动方式，且只用于CPU推理(CUDA上下文不能跨fork使用)
+"""
+
+import gc
+import itertools
+import multiprocessing
+import os
+import threading
+
+from pipeline_metrics import get_metrics
+from tts_pipeline import encode_pcm16
+
+
+def _serve(backend, conn, threads):
+    """子进程：循环接收 (文本, 说话人, 语言)，返回 (错误, PCM字节, 采样率)"""
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        try:
+            samples, sample_rate = backend.synthesize(*request)
+            conn.send((None, encode_pcm16(samples), sample_rate))
+        except Exception as e:
+            conn.send((str(e), None, 0))
+    conn.close()
+
+
+def read_smaps_rollup(pid):
+    """读取/proc/<pid>/smaps_rollup，返回 {字段: 字节数}；不支持的平台返回None"""
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", 'r') as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    values = {}
+    for line in lines[1:]:
+        parts = line.split()
+        if len(parts) >= 3 and parts[2] == 'kB':
+            values[parts[0].rstrip(':')] = int(parts[1]) * 1024
+    return values
+
+
+class WorkerBackend:
+    """父进程中代表一个合成子进程的代理，synthesize()在子进程中执行"""
+
+    def __init__(self, server, conn, index):
+        self.server = server
+        self.conn = conn
+        self.index = index
+        self.speaker = server.backend.speaker
+        self.language = server.backend.language
+        self._lock = threading.Lock()
+
+    @property
+    def name(self):
+        return self.server.backend.name
+
+    def load(self):
+        return self
+
+    def synthesize(self, text, speaker=None, language=None):
+        import numpy as np
+
+        with self._lock:
+            self.conn.send((text, speaker, language))
+            error, pcm, sample_rate = self.conn.recv()
+        if error is not None:
+            raise RuntimeError(error)
+        return np.frombuffer(pcm, dtype='<i2').astype(np.float32) / 32767, sample_rate
+
+
+class ForkServer:
+    """
+    用法:
+        with ForkServer(lambda: xtts_backend('1'), workers=4) as server:
+            run_tts_jobs(server.worker_backend, jobs, synthesis_workers=server.workers)
+            server.print_memory_report()
+    """
+
+    def __init__(self, backend_factory, workers=2, threads_per_worker=None):
+        self.backend_factory = backend_factory
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self.backend = None
+        self._processes = []
+        self._proxies = []
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+
+    def start(self):
+        metrics = get_metrics()
+        with metrics.stage('model_load', items=1):
+            self.backend = self.backend_factory()
+            self.backend.load()
+
+        # 把加载模型产生的对象移出GC跟踪，子进程中的垃圾回收不会写这些对象的内存页
+        gc.collect()
+        gc.freeze()
+
+        context = multiprocessing.get_context('fork')
+        for index in range(self.workers):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=_serve, args=(self.backend, child_conn, self.threads_per_worker),
+                                      name=f"tts-worker-{index}", daemon=True)
+            process.start()
+            child_conn.close()
+            self._processes.append(process)
+            self._proxies.append(WorkerBackend(self, parent_conn, index))
+        gc.unfreeze()
+        return self
+
+    def worker_backend(self):
+        """作为TTSPipeline的backend_factory：依次返回各子进程的代理，每个合成线程拿到不同的子进程"""
+        with self._lock:
+            return self._proxies[next(self._next) % len(self._proxies)]
+
+    def memory_report(self):
+        """
+        父进程和每个子进程的内存占用：
+        rss为常驻内存，shared为与其他进程共享的页，private为该进程独占的页，pss为按共享比例分摊后的内存
+        """
+        report = []
+        for role, pid in [('parent', os.getpid())] + [(p.name, p.pid) for p in self._processes]:
+            smaps = read_smaps_rollup(pid)
+            if smaps is None:
+                report.append({'role': role, 'pid': pid})
+                continue
+            report.append({
+                'role': role,
+                'pid': pid,
+                'rss': smaps.get('Rss', 0),
+                'pss': smaps.get('Pss', 0),
+                'shared': smaps.get('Shared_Clean', 0) + smaps.get('Shared_Dirty', 0),
+                'private': smaps.get('Private_Clean', 0) + smaps.get('Private_Dirty', 0),
+            })
+        return report
+
+    def print_memory_report(self):
+        metrics = get_metrics()
+        report = self.memory_report()
+        if not any('rss' in entry for entry in report):
+            print("当前平台不支持/proc/<pid>/smaps_rollup，无法分别统计进程内存")
+            return report
+
+        print(f"{'进程':<16}{'RSS':>10}{'共享':>10}{'私有':>10}{'PSS':>10}  (MB)")
+        for entry in report:
+            print(f"{entry['role']:<16}{entry['rss'] / 2**20:>10.0f}{entry['shared'] / 2**20:>10.0f}"
+                  f"{entry['private'] / 2**20:>10.0f}{entry['pss'] / 2**20:>10.0f}")
+            if entry['role'] != 'parent':
+                metrics.incr('worker_private_bytes', entry['private'])
+                metrics.incr('worker_shared_bytes', entry['shared'])
+        total_pss = sum(entry['pss'] for entry in report)
+        metrics.incr('fork_server_total_pss_bytes', total_pss)
+        print(f"全部进程合计PSS: {total_pss / 2**20:.0f} MB")
+        return report
+
+    def stop(self):
+        for proxy in self._proxies:
+            try:
+                proxy.conn.send(None)
+            except OSError:
+                pass
+        for process in self._processes:
+            process.join(timeout=10)
+            if process.is_alive():
+                process.terminate()
+        self._processes = []
+        self._proxies = []
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
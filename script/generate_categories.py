@@ -10,6 +10,8 @@ import os
 import re
 import shutil
 
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+
 # 定义分类规则
 CATEGORIES = {
     "animals": {
@@ -474,11 +476,15 @@ def get_category(filename):
     # 如果没有匹配，返回其他类别
     return "others"
 
-def main():
+def categorize_images(reclassify_others=False):
+    metrics = get_metrics()
+
     # 读取所有文件
     image_dir = "/Volumes/dz/code/cartoon-english-flash-card/resource/all"
     output_dir = "/Volumes/dz/code/cartoon-english-flash-card/resource/categorized"
-    files = [f for f in os.listdir(image_dir) if f.endswith('.png')]
+    with metrics.stage('scan'):
+        files = [f for f in os.listdir(image_dir) if f.endswith('.png')]
+    metrics.add_items('scan', len(files))
     
     # 创建输出目录
     if not os.path.exists(output_dir):
@@ -493,33 +499,46 @@ def main():
     
     # 分类文件
     print(f"\n🔍 开始分类 {len(files)} 张图片...")
-    for filename in files:
-        category = get_category(filename)
-        categorized[category].append(filename)
+    with metrics.stage('classify', items=len(files)):
+        for filename in files:
+            category = get_category(filename)
+            categorized[category].append(filename)
+
+    # 第二轮：用字符n-gram分类器处理关键词没有命中的文件
+    if reclassify_others:
+        try:
+            from ngram_classifier import reclassify_others as ngram_reclassify
+        except ImportError as e:
+            print(f"⚠️  无法加载n-gram分类器 ({e})，跳过第二轮分类")
+        else:
+            moved = ngram_reclassify(categorized)
+            print(f"🔁 n-gram分类器从 others 中重新分类 {len(moved)} 张图片")
     
     # 创建分类文件夹并复制图片
     print(f"\n📂 创建分类文件夹并复制图片...")
     copy_count = 0
     
-    for category_id in list(CATEGORIES.keys()) + ["others"]:
-        if categorized[category_id]:
-            # 创建分类文件夹
-            category_folder = os.path.join(output_dir, category_id)
-            if not os.path.exists(category_folder):
-                os.makedirs(category_folder)
-                print(f"  ✓ 创建文件夹: {category_id}/")
+    with metrics.stage('copy'):
+        for category_id in list(CATEGORIES.keys()) + ["others"]:
+            if categorized[category_id]:
+                # 创建分类文件夹
+                category_folder = os.path.join(output_dir, category_id)
+                if not os.path.exists(category_folder):
+                    os.makedirs(category_folder)
+                    print(f"  ✓ 创建文件夹: {category_id}/")
             
-            # 复制图片到分类文件夹
-            for filename in categorized[category_id]:
-                src_path = os.path.join(image_dir, filename)
-                dst_path = os.path.join(category_folder, filename)
+                # 复制图片到分类文件夹
+                for filename in categorized[category_id]:
+                    src_path = os.path.join(image_dir, filename)
+                    dst_path = os.path.join(category_folder, filename)
                 
-                # 复制文件
-                shutil.copy2(src_path, dst_path)
-                copy_count += 1
+                    # 复制文件
+                    shutil.copy2(src_path, dst_path)
+                    copy_count += 1
             
-            print(f"    → 复制了 {len(categorized[category_id])} 张图片")
+                print(f"    → 复制了 {len(categorized[category_id])} 张图片")
     
+    metrics.add_items('copy', copy_count)
     print(f"\n✅ 共复制 {copy_count} 张图片到分类文件夹")
     
     # 构建输出结构
@@ -568,8 +587,9 @@ def main():
     
     # 保存到JSON文件
     output_file = "/Volumes/dz/code/cartoon-english-flash-card/categories.json"
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(output, f, ensure_ascii=False, indent=2)
+    with metrics.stage('write', items=1):
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
     
     print(f"\n" + "="*60)
     print(f"🎉 分类完成!")
@@ -585,6 +605,18 @@ def main():
     print(f"📂 分类目录: {output_dir}")
     print(f"="*60)
 
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description='卡通英语闪卡图片分类')
+    parser.add_argument('--reclassify-others', action='store_true',
+                        help='用字符n-gram分类器对未命中关键词的图片做第二轮分类 (需要numpy)')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    with metrics_session('generate_categories', args.metrics, args.profile):
+        categorize_images(args.reclassify_others)
+
 if __name__ == "__main__":
     main()
 
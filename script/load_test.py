@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+资源分发压力测试
+模拟一个教室的设备同时打开App：每台设备依次进行若干次闪卡学习，
+每次学习先下载一个分类分片，然后按顺序浏览若干张卡片，每张卡片请求图片、英文语音和中文语音；
+设备之间并发，设备内部串行并保持连接(与浏览器的行为一致)
+
+按资源类别(shard / image / audio_en / audio_cn)统计延迟分位数、吞吐量和错误率，
+用于评估asset_server.py或任何静态服务器/CDN的缓存和带宽需求
+
+用法:
+    python3 load_test.py --devices 30 --sessions 3 --cards 12
+    python3 load_test.py --url http://192.168.1.10:8080 --devices 60 --ramp-up 10 --revalidate
+"""
+
+import http.client
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import quote, urlparse
+
+from deck_model import load_deck
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session, percentile
+from precache_manifest import AUDIO_URL_PREFIX, IMAGE_URL_PREFIX
+
+DEFAULT_URL = 'http://127.0.0.1:8080'
+DEFAULT_SHARD_URL = '/distractors/categories/{category}.json'
+ASSET_CLASSES = ('shard', 'image', 'audio_en', 'audio_cn')
+REQUEST_TIMEOUT = 30
+
+
+def plan_sessions(deck, devices, sessions, cards, shard_url=DEFAULT_SHARD_URL, seed=0):
+    """
+    为每台设备生成请求序列：[[会话1的 (类别, URL) 列表, 会话2 ...], ...]
+    分类按卡片数加权随机选择，会话从分类中随机位置开始顺序浏览
+    """
+    rng = random.Random(seed)
+    categories = [category for category in deck.categories if category.cards]
+    weights = [len(category.cards) for category in categories]
+    plans = []
+    for _ in range(devices):
+        device = []
+        for _ in range(sessions):
+            category = rng.choices(categories, weights)[0]
+            start = rng.randrange(len(category.cards))
+            requests = [('shard', shard_url.format(category=quote(category.id)))]
+            for offset in range(min(cards, len(category.cards))):
+                card = category.cards[(start + offset) % len(category.cards)]
+                requests.append(('image', IMAGE_URL_PREFIX + quote(card.filename)))
+                requests.append(('audio_en', AUDIO_URL_PREFIX + quote(card.voice.en)))
+                requests.append(('audio_cn', AUDIO_URL_PREFIX + quote(card.voice.cn)))
+            device.append(requests)
+        plans.append(device)
+    return plans
+
+
+def new_stats():
+    return {name: {'latencies': [], 'bytes': 0, 'errors': 0, 'status': {}} for name in ASSET_CLASSES}
+
+
+class Device(threading.Thread):
+    """一台设备：一个保持连接的HTTP客户端，按计划串行请求；revalidate时模拟浏览器缓存，重复的URL带If-None-Match"""
+
+    def __init__(self, base_url, plan, think_time, revalidate, start_delay, seed):
+        super().__init__(daemon=True)
+        url = urlparse(base_url)
+        self.host, self.port = url.hostname, url.port or (443 if url.scheme == 'https' else 80)
+        self.connection_class = http.client.HTTPSConnection if url.scheme == 'https' else http.client.HTTPConnection
+        self.plan = plan
+        self.think_time = think_time
+        self.revalidate = revalidate
+        self.start_delay = start_delay
+        self.rng = random.Random(seed)
+        self.etags = {}
+        self.stats = new_stats()
+        self._connection = None
+
+    def _request(self, path):
+        headers = {'Accept-Encoding': 'br, gzip'}
+        if self.revalidate and path in self.etags:
+            headers['If-None-Match'] = self.etags[path]
+        for attempt in range(2):
+            if self._connection is None:
+                self._connection = self.connection_class(self.host, self.port, timeout=REQUEST_TIMEOUT)
+            try:
+                self._connection.request('GET', path, headers=headers)
+                response = self._connection.getresponse()
+                body = response.read()
+                return response.status, len(body), response.getheader('ETag')
+            except (http.client.RemoteDisconnected, BrokenPipeError, ConnectionResetError):
+                # 服务器关闭了空闲连接，重新连接一次
+                self._connection.close()
+                self._connection = None
+                if attempt:
+                    raise
+
+    def run(self):
+        time.sleep(self.start_delay)
+        for session in self.plan:
+            for asset_class, path in session:
+                stats = self.stats[asset_class]
+                start = time.perf_counter()
+                try:
+                    status, size, etag = self._request(path)
+                except (OSError, http.client.HTTPException) as e:
+                    stats['errors'] += 1
+                    stats['status'][type(e).__name__] = stats['status'].get(type(e).__name__, 0) + 1
+                    if self._connection is not None:
+                        self._connection.close()
+                        self._connection = None
+                    continue
+                stats['latencies'].append(time.perf_counter() - start)
+                stats['bytes'] += size
+                stats['status'][str(status)] = stats['status'].get(str(status), 0) + 1
+                if status >= 400:
+                    stats['errors'] += 1
+                elif etag:
+                    self.etags[path] = etag
+
+                if asset_class != 'shard' and asset_class != 'audio_cn':
+                    continue
+                # 浏览分类列表、每张卡片看完(中文语音播放完)后停留一会儿
+                if self.think_time:
+                    time.sleep(self.rng.expovariate(1 / self.think_time))
+        if self._connection is not None:
+            self._connection.close()
+
+
+def run_load_test(base_url, plans, think_time=0.0, revalidate=False, ramp_up=0.0, seed=0):
+    """并发运行全部设备，返回 (按类别合并的统计, 总耗时秒)"""
+    devices = [Device(base_url, plan, think_time, revalidate, ramp_up * i / max(len(plans), 1), seed + i)
+               for i, plan in enumerate(plans)]
+    start = time.perf_counter()
+    for device in devices:
+        device.start()
+    for device in devices:
+        device.join()
+    elapsed = time.perf_counter() - start
+
+    merged = new_stats()
+    for device in devices:
+        for name, stats in device.stats.items():
+            merged[name]['latencies'].extend(stats['latencies'])
+            merged[name]['bytes'] += stats['bytes']
+            merged[name]['errors'] += stats['errors']
+            for status, count in stats['status'].items():
+                merged[name]['status'][status] = merged[name]['status'].get(status, 0) + count
+    return merged, elapsed
+
+
+def summarize(stats, elapsed):
+    """每个类别的请求数、错误率、吞吐量和延迟分位数(毫秒)，以及全部请求的合计"""
+    report = {}
+    everything = new_stats()['shard']
+    for name in ASSET_CLASSES:
+        entry = stats[name]
+        everything['latencies'].extend(entry['latencies'])
+        everything['bytes'] += entry['bytes']
+        everything['errors'] += entry['errors']
+        for status, count in entry['status'].items():
+            everything['status'][status] = everything['status'].get(status, 0) + count
+    for name, entry in list(stats.items()) + [('total', everything)]:
+        latencies = sorted(entry['latencies'])
+        requests = len(latencies) + sum(count for status, count in entry['status'].items() if not status.isdigit())
+        if not requests:
+            continue
+        report[name] = {
+            'requests': requests,
+            'errors': entry['errors'],
+            'error_rate': entry['errors'] / requests,
+            'requests_per_second': requests / elapsed,
+            'megabytes_per_second': entry['bytes'] / elapsed / 1024 / 1024,
+            'status': dict(sorted(entry['status'].items())),
+            'latency_ms': {
+                'p50': percentile(latencies, 0.5) * 1000,
+                'p90': percentile(latencies, 0.9) * 1000,
+                'p99': percentile(latencies, 0.99) * 1000,
+                'max': (latencies[-1] if latencies else 0.0) * 1000,
+            },
+        }
+    return report
+
+
+def print_report(report, elapsed, devices):
+    print(f"\n{devices} 台设备，耗时 {elapsed:.1f} 秒")
+    print(f"{'类别':<10}{'请求':>8}{'错误率':>8}{'请求/秒':>10}{'MB/秒':>8}{'p50':>9}{'p90':>9}{'p99':>9}{'最大':>9}  (毫秒)")
+    for name, entry in report.items():
+        latency = entry['latency_ms']
+        print(f"{name:<10}{entry['requests']:>8}{entry['error_rate']:>8.1%}{entry['requests_per_second']:>10.1f}"
+              f"{entry['megabytes_per_second']:>8.1f}{latency['p50']:>9.1f}{latency['p90']:>9.1f}"
+              f"{latency['p99']:>9.1f}{latency['max']:>9.1f}")
+    statuses = ', '.join(f"{status}: {count}" for status, count in report.get('total', {}).get('status', {}).items())
+    print(f"状态码: {statuses}")
+
+
+def write_report(report, path, parameters):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({'parameters': parameters, 'results': report}, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='模拟多台设备同时学习闪卡，测量资源分发的延迟、吞吐量和错误率')
+    parser.add_argument('--url', type=str, default=DEFAULT_URL, help=f'服务器地址 (默认: {DEFAULT_URL})')
+    parser.add_argument('--deck', type=str, default='categories.json', help='卡组文件 (默认: categories.json)')
+    parser.add_argument('--devices', type=int, default=30, help='并发设备数 (默认: 30)')
+    parser.add_argument('--sessions', type=int, default=3, help='每台设备的学习次数 (默认: 3)')
+    parser.add_argument('--cards', type=int, default=12, help='每次学习浏览的卡片数 (默认: 12)')
+    parser.add_argument('--think-time', type=float, default=0.0,
+                        help='每张卡片的平均停留时间，秒，按指数分布随机 (默认: 0，不停留)')
+    parser.add_argument('--ramp-up', type=float, default=0.0, help='设备在这段时间内依次启动，秒 (默认: 0，同时启动)')
+    parser.add_argument('--revalidate', action='store_true', help='模拟浏览器缓存：重复请求带If-None-Match')
+    parser.add_argument('--shard-url', type=str, default=DEFAULT_SHARD_URL,
+                        help=f'分类分片的URL模板 (默认: {DEFAULT_SHARD_URL})')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子，相同参数生成相同的请求序列 (默认: 0)')
+    parser.add_argument('--report', type=str, help='把结果写入JSON文件')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    with metrics_session('load_test', args.metrics, args.profile):
+        deck = load_deck(args.deck)
+        plans = plan_sessions(deck, args.devices, args.sessions, args.cards, args.shard_url, args.seed)
+        total = sum(len(session) for plan in plans for session in plan)
+        print(f"目标: {args.url}，{args.devices} 台设备 × {args.sessions} 次学习 × {args.cards} 张卡片，共 {total} 个请求")
+
+        stats, elapsed = run_load_test(args.url, plans, args.think_time, args.revalidate, args.ramp_up, args.seed)
+        metrics = get_metrics()
+        for name, entry in stats.items():
+            for latency in entry['latencies']:
+                metrics.observe(f"load_{name}", latency)
+            metrics.incr(f"load_{name}_errors", entry['errors'])
+
+    report = summarize(stats, elapsed)
+    print_report(report, elapsed, args.devices)
+    if args.report:
+        write_report(report, args.report, {key: value for key, value in vars(args).items()
+                                           if key not in ('metrics', 'profile', 'report')})
+        print(f"结果已保存到: {args.report}")
+
+
+if __name__ == "__main__":
+    main()
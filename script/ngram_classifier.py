@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+"""
+字符n-gram分类器
+get_category()的关键词没有命中的文件名会落入"others"，这里作为第二轮分类：
+用已分类的文件名学习每个分类的n-gram质心，再对剩余文件名整批打分
+
+所有文件名先编码成定长的码位矩阵，n-gram哈希、TF-IDF加权和打分都是整批的数组运算，
+打分相当于一次 稀疏文档矩阵 × 稠密质心矩阵 的乘法，不需要逐个文件的Python循环
+"""
+
+import json
+import os
+
+import numpy as np
+
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+
+NGRAM_SIZES = (3, 4)
+HASH_DIMS = 1 << 17
+MAX_NAME_LENGTH = 64
+# 重新分类需要同时满足：与质心的余弦相似度不低于MIN_SCORE，
+# 置信度 (最高分 - 次高分) / 最高分 不低于MIN_CONFIDENCE；
+# 在已分类文件名上留出20%验证，默认阈值约覆盖22%的文件，准确率约88%
+DEFAULT_MIN_SCORE = 0.1
+DEFAULT_MIN_CONFIDENCE = 0.45
+OTHERS = "others"
+
+# 每个n-gram位置使用不同的奇数乘子做多项式哈希
+_HASH_MULTIPLIERS = np.array([0x9E3779B1, 0x85EBCA77, 0xC2B2AE3D, 0x27D4EB2F], dtype=np.uint64)
+
+
+def normalize_names(filenames):
+    """与get_category()相同的规范化：小写、连字符/下划线变空格、去扩展名，两端补空格标记词边界"""
+    return [" " + f.lower().replace("-", " ").replace("_", " ").replace(".png", "") + " " for f in filenames]
+
+
+def encode_texts(texts, width=MAX_NAME_LENGTH):
+    """把字符串编码为 (N, width) 的uint32码位矩阵，不足部分为0，超出部分截断"""
+    names = np.array(texts, dtype=f"U{width}")
+    return names.view(np.uint32).reshape(len(texts), width).astype(np.uint64)
+
+
+def encode_names(filenames, width=MAX_NAME_LENGTH):
+    """把规范化后的文件名编码为码位矩阵"""
+    return encode_texts(normalize_names(filenames), width)
+
+
+def hash_ngrams(codes, sizes=NGRAM_SIZES):
+    """
+    对码位矩阵整批计算n-gram哈希
+    返回 (行号, 哈希桶) 两个等长数组，按行号升序排列
+    """
+    rows = []
+    buckets = []
+    n_rows, width = codes.shape
+    for n in sizes:
+        if width < n:
+            continue
+        span = width - n + 1
+        hashed = np.full((n_rows, span), n, dtype=np.uint64)
+        valid = np.ones((n_rows, span), dtype=bool)
+        for offset in range(n):
+            window = codes[:, offset:offset + span]
+            hashed = hashed * _HASH_MULTIPLIERS[offset] + window
+            valid &= window != 0
+        row_index, col_index = np.nonzero(valid)
+        rows.append(row_index)
+        buckets.append(hashed[row_index, col_index] % HASH_DIMS)
+
+    rows = np.concatenate(rows)
+    buckets = np.concatenate(buckets).astype(np.int64)
+    order = np.argsort(rows, kind="stable")
+    return rows[order], buckets[order]
+
+
+class NgramClassifier:
+    """基于字符n-gram TF-IDF质心的最近质心分类器"""
+
+    def __init__(self):
+        self.labels = []
+        self.idf = None
+        self.centroids = None
+
+    def _weights(self, rows, buckets, n_rows):
+        """每个n-gram的TF-IDF权重，按文档做L2归一化"""
+        weights = self.idf[buckets]
+        norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=n_rows))
+        norms[norms == 0] = 1.0
+        return weights / norms[rows]
+
+    def fit(self, filenames, labels):
+        """用已分类的文件名学习每个分类的质心"""
+        self.labels = sorted(set(labels))
+        label_index = {label: i for i, label in enumerate(self.labels)}
+        y = np.array([label_index[label] for label in labels], dtype=np.int64)
+
+        rows, buckets = hash_ngrams(encode_names(filenames))
+        n_docs = len(filenames)
+
+        # 文档频率：同一文档内重复的n-gram只计一次
+        unique_pairs = np.unique(rows * HASH_DIMS + buckets)
+        df = np.bincount(unique_pairs % HASH_DIMS, minlength=HASH_DIMS)
+        self.idf = np.log((1 + n_docs) / (1 + df)) + 1.0
+
+        weights = self._weights(rows, buckets, n_docs)
+        centroids = np.zeros((HASH_DIMS, len(self.labels)), dtype=np.float64)
+        np.add.at(centroids, (buckets, y[rows]), weights)
+        norms = np.linalg.norm(centroids, axis=0)
+        norms[norms == 0] = 1.0
+        self.centroids = (centroids / norms).astype(np.float32)
+        return self
+
+    def scores(self, filenames):
+        """返回 (N, 分类数) 的余弦相似度矩阵"""
+        n_docs = len(filenames)
+        if n_docs == 0:
+            return np.zeros((0, len(self.labels)), dtype=np.float32)
+
+        rows, buckets = hash_ngrams(encode_names(filenames))
+        contributions = self.centroids[buckets] * self._weights(rows, buckets, n_docs)[:, None].astype(np.float32)
+
+        # 行号已排序：按行分段求和即稀疏矩阵乘法
+        scores = np.zeros((n_docs, len(self.labels)), dtype=np.float32)
+        if len(rows):
+            starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+            scores[rows[starts]] = np.add.reduceat(contributions, starts, axis=0)
+        return scores
+
+    def predict(self, filenames):
+        """返回 (预测分类列表, 最高分数组, 置信度数组)，置信度为最高分领先次高分的相对幅度"""
+        scores = self.scores(filenames)
+        if scores.shape[0] == 0:
+            return [], np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.float32)
+        best = scores.argmax(axis=1)
+        ranked = np.sort(scores, axis=1)
+        top = ranked[:, -1]
+        second = ranked[:, -2] if scores.shape[1] > 1 else np.zeros_like(top)
+        confidence = np.where(top > 0, (top - second) / np.maximum(top, 1e-12), 0.0)
+        return [self.labels[i] for i in best], top, confidence
+
+
+def reclassify_others(categorized, min_score=DEFAULT_MIN_SCORE, min_confidence=DEFAULT_MIN_CONFIDENCE):
+    """
+    第二轮分类：categorized为 {分类id: [文件名, ...]}，
+    用非others分类训练，把others中得分和置信度都达到阈值的文件移到预测的分类，
+    返回 {文件名: (分类, 置信度)}
+    """
+    metrics = get_metrics()
+
+    train_names = []
+    train_labels = []
+    for category_id, filenames in categorized.items():
+        if category_id != OTHERS:
+            train_names.extend(filenames)
+            train_labels.extend([category_id] * len(filenames))
+
+    remaining = categorized.get(OTHERS, [])
+    if not remaining or len(set(train_labels)) < 2:
+        return {}
+
+    with metrics.stage('ngram_fit', items=len(train_names)):
+        classifier = NgramClassifier().fit(train_names, train_labels)
+    with metrics.stage('ngram_predict', items=len(remaining)):
+        predicted, top_scores, confidence = classifier.predict(remaining)
+        accepted = (top_scores >= min_score) & (confidence >= min_confidence)
+
+    moved = {}
+    kept = []
+    for filename, category_id, ok, score in zip(remaining, predicted, accepted.tolist(), confidence.tolist()):
+        if ok:
+            categorized[category_id].append(filename)
+            moved[filename] = (category_id, score)
+        else:
+            kept.append(filename)
+    categorized[OTHERS] = kept
+    metrics.incr('ngram_reclassified', len(moved))
+    return moved
+
+
+def reclassify_deck(deck_path, output_path=None, min_score=DEFAULT_MIN_SCORE,
+                    min_confidence=DEFAULT_MIN_CONFIDENCE, apply=False):
+    """对已有卡组的others分类执行第二轮分类；apply为True时移动卡片并写回"""
+    with open(deck_path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+
+    # 同时支持categories_original.json(文件名数组)和转换后的categories.json(卡片对象)
+    entries = {}
+    categorized = {}
+    for category in data['categories']:
+        categorized[category['id']] = []
+        for image in category['images']:
+            filename = image if isinstance(image, str) else image['filename']
+            entries[filename] = image
+            categorized[category['id']].append(filename)
+    categorized.setdefault(OTHERS, [])
+
+    before = len(categorized[OTHERS])
+    moved = reclassify_others(categorized, min_score, min_confidence)
+
+    print(f"others: {before} -> {before - len(moved)} (重新分类 {len(moved)} 个)")
+    for filename, (category_id, score) in sorted(moved.items(), key=lambda x: -x[1][1])[:30]:
+        print(f"  {filename:<48} -> {category_id:<28} {score:.2f}")
+
+    if not apply:
+        return moved
+
+    for category in data['categories']:
+        category['images'] = sorted((entries[f] for f in categorized[category['id']]),
+                                    key=lambda image: image if isinstance(image, str) else image['filename'])
+        category['count'] = len(category['images'])
+    if 'statistics' in data:
+        data['statistics']['uncategorized_images'] = len(categorized[OTHERS])
+        data['statistics']['categorized_images'] = data['statistics']['total_images'] - len(categorized[OTHERS])
+
+    output_path = output_path or deck_path
+    tmp_path = f"{output_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, output_path)
+    print(f"结果已保存到: {output_path}")
+    return moved
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='用字符n-gram分类器缩小others分类')
+    parser.add_argument('--deck', type=str, default='categories_original.json', help='卡组文件')
+    parser.add_argument('--output', type=str, help='输出文件 (默认: 覆盖卡组文件)')
+    parser.add_argument('--min-score', type=float, default=DEFAULT_MIN_SCORE,
+                        help=f'重新分类所需的最低相似度 (默认: {DEFAULT_MIN_SCORE})')
+    parser.add_argument('--min-confidence', type=float, default=DEFAULT_MIN_CONFIDENCE,
+                        help=f'重新分类所需的最低置信度 (默认: {DEFAULT_MIN_CONFIDENCE})')
+    parser.add_argument('--apply', action='store_true', help='移动卡片并写回，否则只打印结果')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    with metrics_session('ngram_classifier', args.metrics, args.profile):
+        reclassify_deck(args.deck, args.output, args.min_score, args.min_confidence, args.apply)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+离线英汉词典
+把本地的双语词典文件编译成SQLite查询表，代替googletrans逐词联网翻译：
+- 支持CC-CEDICT格式(繁体 简体 [拼音] /释义1/释义2/)，按英文释义反向建立索引
+- 支持TSV(英文<TAB>中文，列的顺序按是否包含汉字自动识别)，适合手工整理的词表
+- 可以把卡组中已经人工校对过的翻译一起编入词典
+多个来源按命令行顺序排优先级，同一英文短语只保留优先级最高的翻译
+
+多词条目(例如 "African Elephant")按短语切分翻译：用动态规划把单词序列切成尽量少的词典短语，
+优先整体匹配 "african elephant"，找不到再拆成 "african" + "elephant"；最后一个词找不到时尝试单数形式
+
+用法:
+    python3 offline_dictionary.py --compile cedict_ts.u8 --include-deck
+    python3 offline_dictionary.py --lookup "African Elephant" "Ski Goggles"
+    python3 offline_dictionary.py --check categories.json
+"""
+
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from build_search_index import fold_ascii
+from deck_model import load_deck
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+
+DEFAULT_DICTIONARY_PATH = os.path.join('.cache', 'dictionary.sqlite')
+# 表结构或规范化规则变化时递增，旧文件需要重新编译
+SCHEMA_VERSION = 1
+# 一个短语最多包含的单词数，超过的词条不收录
+MAX_PHRASE_WORDS = 6
+# 切分时找不到翻译的单词的代价，远大于一个短语，保证优先使用词典短语
+UNKNOWN_WORD_COST = 100
+
+CEDICT_LINE = re.compile(r'^(\S+) (\S+) \[([^\]]*)\] /(.+)/\s*$')
+CJK = re.compile(r'[㐀-鿿]')
+LATIN = re.compile(r'[A-Za-z]')
+CAMEL_CASE = re.compile(r'(?<=[a-z])(?=[A-Z])')
+NON_WORD = re.compile(r"[^a-z0-9' ]+")
+SEPARATORS = re.compile(r'[\s\-_/]+')
+PARENTHESES = re.compile(r'\([^)]*\)')
+# CEDICT中不是译名的释义
+SKIPPED_GLOSSES = ('variant of', 'old variant of', 'see ', 'see also', 'surname ', 'cl:', 'abbr. for',
+                   'used in', 'pr. ', 'erhua variant', 'japanese variant', 'also written')
+GLOSS_PREFIXES = ('to ', 'a ', 'an ', 'the ')
+
+Translation = namedtuple('Translation', ['chinese', 'segments', 'complete'])
+
+
+def normalize_phrase(text):
+    """查询键：拆开驼峰写法，转小写并去掉附加符号，连字符等分隔符换成空格"""
+    text = CAMEL_CASE.sub(' ', text)
+    text = fold_ascii(text).replace('-', ' ').replace('_', ' ').replace('/', ' ')
+    return ' '.join(NON_WORD.sub(' ', text).split())
+
+
+def split_words(text):
+    """返回 (规范化后的单词, 原文中对应的写法) 两个等长列表，原文写法用于保留找不到翻译的单词"""
+    keys, originals = [], []
+    for token in SEPARATORS.split(CAMEL_CASE.sub(' ', text)):
+        words = normalize_phrase(token).split()
+        keys.extend(words)
+        originals.extend([token.strip(".,;:!?()[]\"'")] if len(words) == 1 else words)
+    return keys, originals
+
+
+def singular_forms(word):
+    """英文复数的可能单数形式，按可能性排序"""
+    forms = []
+    if word.endswith('ies') and len(word) > 4:
+        forms.append(word[:-3] + 'y')
+    if word.endswith(('ses', 'xes', 'zes', 'ches', 'shes', 'oes')):
+        forms.append(word[:-2])
+    if word.endswith('s') and not word.endswith('ss') and len(word) > 3:
+        forms.append(word[:-1])
+    return forms
+
+
+def clean_gloss(gloss):
+    """
+    CEDICT释义 -> (查询键, 是否带括号限定)，不是译名的释义返回None
+    带限定的释义(例如 "African (person)")只是某个特定义项，排在不带限定的释义之后
+    """
+    qualified = PARENTHESES.search(gloss) is not None
+    gloss = PARENTHESES.sub('', gloss).strip()
+    lower = gloss.lower()
+    if not gloss or lower.startswith(SKIPPED_GLOSSES) or CJK.search(gloss):
+        return None
+    for prefix in GLOSS_PREFIXES:
+        if lower.startswith(prefix):
+            gloss = gloss[len(prefix):]
+            break
+    key = normalize_phrase(gloss)
+    if not key or len(key.split()) > MAX_PHRASE_WORDS:
+        return None
+    return key, qualified
+
+
+def parse_dictionary_file(path):
+    """
+    逐行解析词典文件，产生 (查询键, 中文, 同一来源内的排序键)
+    CEDICT中同一英文对应多个词时，不带限定、释义排在越前面、义项越少的词越优先；
+    中文必须包含汉字，"T恤" 这类夹带字母的词可以收录
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f):
+            line = line.rstrip('\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            match = CEDICT_LINE.match(line)
+            if match:
+                simplified = match.group(2)
+                if not CJK.search(simplified):
+                    continue
+                glosses = match.group(4).split('/')
+                for position, gloss in enumerate(glosses):
+                    cleaned = clean_gloss(gloss)
+                    if cleaned:
+                        key, qualified = cleaned
+                        yield key, simplified, (qualified, position, len(glosses), len(simplified), line_number)
+                continue
+
+            columns = [column.strip() for column in line.split('\t')]
+            if len(columns) < 2:
+                continue
+            if CJK.search(columns[0]) and not CJK.search(columns[1]):
+                columns[0], columns[1] = columns[1], columns[0]
+            key = normalize_phrase(columns[0])
+            if key and CJK.search(columns[1]):
+                yield key, columns[1], (False, 0, 1, 0, line_number)
+
+
+def deck_entries(deck):
+    """卡组中已有的翻译：中文不含拉丁字母且与英文不同的才算校对过"""
+    for index, (_, card) in enumerate(deck.cards()):
+        chinese = card.word.cn
+        if chinese and chinese != card.word.en and CJK.search(chinese) and not LATIN.search(chinese):
+            key = normalize_phrase(card.word.en)
+            if key:
+                yield key, chinese, (False, 0, 1, 0, index)
+
+
+def compile_dictionary(sources, output=DEFAULT_DICTIONARY_PATH):
+    """
+    sources: [(来源名称, 条目迭代器)]，排在前面的来源优先
+    写入新的SQLite文件后整体替换，返回 {来源名称: 采用的条目数}
+    """
+    metrics = get_metrics()
+    best = {}
+    with metrics.stage('parse'):
+        for priority, (name, entries) in enumerate(sources):
+            for key, chinese, rank in entries:
+                rank = (priority,) + rank
+                current = best.get(key)
+                if current is None or rank < current[1]:
+                    best[key] = (chinese, rank, name)
+                metrics.add_items('parse')
+
+    directory = os.path.dirname(output)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{output}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    with metrics.stage('write', items=len(best)):
+        db = sqlite3.connect(tmp_path)
+        db.execute('CREATE TABLE entries (phrase TEXT PRIMARY KEY, chinese TEXT NOT NULL, source TEXT NOT NULL) '
+                   'WITHOUT ROWID')
+        db.execute('CREATE TABLE meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        db.executemany('INSERT INTO entries VALUES (?, ?, ?)',
+                       ((key, chinese, name) for key, (chinese, _, name) in sorted(best.items())))
+        max_words = max((len(key.split()) for key in best), default=1)
+        db.executemany('INSERT INTO meta VALUES (?, ?)', [
+            ('schema_version', str(SCHEMA_VERSION)),
+            ('max_words', str(max_words)),
+            ('sources', '\n'.join(name for name, _ in sources)),
+            ('created_at', str(time.time())),
+        ])
+        db.commit()
+        db.close()
+    os.replace(tmp_path, output)
+
+    counts = {name: 0 for name, _ in sources}
+    for _, _, name in best.values():
+        counts[name] += 1
+    return counts
+
+
+class OfflineDictionary:
+    """只读的离线词典；查询结果缓存在内存中，每个线程使用自己的连接"""
+
+    def __init__(self, path=DEFAULT_DICTIONARY_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._memory = {}
+        meta = dict(self._connection().execute('SELECT name, value FROM meta').fetchall())
+        if meta.get('schema_version') != str(SCHEMA_VERSION):
+            raise ValueError(f"{path} 的版本为 {meta.get('schema_version')}，需要重新编译")
+        self.max_words = int(meta['max_words'])
+        self.sources = meta['sources'].split('\n')
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.db = db
+        return db
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def _get(self, key):
+        if key not in self._memory:
+            row = self._connection().execute('SELECT chinese FROM entries WHERE phrase = ?', (key,)).fetchone()
+            self._memory[key] = row[0] if row else None
+        return self._memory[key]
+
+    def lookup(self, phrase):
+        """整体查询一个短语(已规范化)，最后一个词找不到时尝试单数形式"""
+        chinese = self._get(phrase)
+        if chinese is not None:
+            return chinese
+        head, _, last = phrase.rpartition(' ')
+        for form in singular_forms(last):
+            chinese = self._get(f"{head} {form}" if head else form)
+            if chinese is not None:
+                return chinese
+        return None
+
+    def translate(self, english):
+        """
+        翻译英文单词或短语，返回Translation(中文, [(英文片段, 中文或None)], 是否全部找到)
+        找不到的单词保留英文原文
+        """
+        words, originals = split_words(english)
+        if not words:
+            return Translation(english, [], False)
+
+        # cost[i]: 覆盖前i个单词的最小代价；choice[i]: 最后一段的起点和翻译
+        n = len(words)
+        cost = [0] + [None] * n
+        choice = [None] * (n + 1)
+        for end in range(1, n + 1):
+            for start in range(max(0, end - self.max_words), end):
+                if cost[start] is None:
+                    continue
+                chinese = self.lookup(' '.join(words[start:end]))
+                if chinese is None and end - start > 1:
+                    continue
+                step = cost[start] + (1 if chinese is not None else UNKNOWN_WORD_COST)
+                if cost[end] is None or step < cost[end]:
+                    cost[end], choice[end] = step, (start, chinese)
+
+        segments = []
+        end = n
+        while end:
+            start, chinese = choice[end]
+            segments.append((start, end, chinese))
+            end = start
+        segments.reverse()
+
+        complete = all(chinese is not None for _, _, chinese in segments)
+        get_metrics().cache_result('offline_dictionary', complete)
+        if len(segments) == 1 and not complete:
+            return Translation(english, [(' '.join(words), None)], False)
+        # 汉字之间不加空格，相邻的英文单词之间保留空格
+        text = ''
+        for start, end, chinese in segments:
+            part = chinese if chinese is not None else ' '.join(originals[start:end])
+            if text and text[-1].isascii() and text[-1].isalnum() and part[0].isascii() and part[0].isalnum():
+                text += ' '
+            text += part
+        return Translation(text, [(' '.join(words[start:end]), chinese) for start, end, chinese in segments], complete)
+
+
+_dictionaries = {}
+_dictionaries_lock = threading.Lock()
+
+
+def get_dictionary(path=DEFAULT_DICTIONARY_PATH):
+    """进程内共享的词典实例；词典文件不存在时返回None"""
+    with _dictionaries_lock:
+        if path not in _dictionaries:
+            _dictionaries[path] = OfflineDictionary(path) if os.path.exists(path) else None
+        return _dictionaries[path]
+
+
+def check_deck(dictionary, deck):
+    """用词典翻译卡组中的全部英文，返回 (结果列表[(英文, 现有中文, Translation)], 秒)"""
+    start = time.perf_counter()
+    results = [(card.word.en, card.word.cn, dictionary.translate(card.word.en)) for _, card in deck.cards()]
+    return results, time.perf_counter() - start
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='编译和查询离线英汉词典')
+    parser.add_argument('--dictionary', type=str, default=DEFAULT_DICTIONARY_PATH,
+                        help=f'编译后的词典文件 (默认: {DEFAULT_DICTIONARY_PATH})')
+    parser.add_argument('--compile', type=str, nargs='*', metavar='SOURCE',
+                        help='编译词典：CC-CEDICT或TSV文件，排在前面的优先')
+    parser.add_argument('--include-deck', type=str, nargs='?', const='categories.json', metavar='DECK',
+                        help='把卡组中已校对的翻译编入词典，优先于其他来源 (默认卡组: categories.json)')
+    parser.add_argument('--lookup', type=str, nargs='+', metavar='WORD', help='查询单词或短语')
+    parser.add_argument('--check', type=str, metavar='DECK', help='翻译整个卡组，统计覆盖率和与现有翻译的一致性')
+    parser.add_argument('--show', type=int, default=20, help='--check时显示的不一致/未覆盖条目数 (默认: 20)')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    if args.compile is None and not args.lookup and not args.check:
+        parser.error('需要 --compile、--lookup 或 --check')
+
+    with metrics_session('offline_dictionary', args.metrics, args.profile):
+        if args.compile is not None:
+            sources = []
+            if args.include_deck:
+                sources.append((args.include_deck, deck_entries(load_deck(args.include_deck))))
+            missing = [path for path in args.compile if not os.path.exists(path)]
+            if missing:
+                print(f"错误: 找不到词典文件 {', '.join(missing)}")
+                sys.exit(1)
+            sources.extend((path, parse_dictionary_file(path)) for path in args.compile)
+            if not sources:
+                parser.error('--compile 需要至少一个词典文件或 --include-deck')
+            counts = compile_dictionary(sources, args.dictionary)
+            print(f"词典已编译到: {args.dictionary}，共 {sum(counts.values())} 个短语")
+            for name, count in counts.items():
+                print(f"  {name}: {count}")
+
+        if not os.path.exists(args.dictionary):
+            print(f"错误: 找不到 {args.dictionary}，请先用 --compile 编译")
+            sys.exit(1)
+        dictionary = OfflineDictionary(args.dictionary)
+
+        for word in args.lookup or []:
+            result = dictionary.translate(word)
+            parts = ' + '.join(f"{phrase}={chinese or '?'}" for phrase, chinese in result.segments)
+            print(f"{word} -> {result.chinese}{'' if result.complete else ' (不完整)'}  [{parts}]")
+
+        if args.check:
+            results, seconds = check_deck(dictionary, load_deck(args.check))
+            complete = [item for item in results if item[2].complete]
+            agreed = [item for item in complete if item[2].chinese == item[1]]
+            print(f"{len(results)} 个单词，用时 {seconds * 1000:.0f} 毫秒")
+            print(f"  完整翻译: {len(complete)} ({len(complete) / max(len(results), 1):.1%})")
+            print(f"  与卡组现有翻译一致: {len(agreed)}")
+            shown = [item for item in results if not item[2].complete or item[2].chinese != item[1]][:args.show]
+            for english, existing, result in shown:
+                print(f"  {english}: {existing} -> {result.chinese}{'' if result.complete else ' (不完整)'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+音素缓存
+把VITS文本前端的结果(规范化文本 -> 音素序列)保存在SQLite中，按 文本 + 前端版本 作为键，
+同一台机器上的所有合成进程/线程共用，重新生成卡组时不再重复调用espeak音素化；
+缓存内容可以导出为发音词典(TSV)供人工检查
+
+只对在进程内加载模型的合成方式生效(--engine api 和 tts_server.py)，tts命令无法接入
+"""
+
+import os
+import sqlite3
+import threading
+import time
+
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+
+DEFAULT_CACHE_PATH = os.path.join('.cache', 'phonemes.sqlite')
+# 缓存键的格式变化时递增，旧记录自然失效
+SCHEMA_VERSION = 1
+
+
+def frontend_version(tokenizer):
+    """描述文本前端的字符串：清洗函数、音素化器名称及其版本，任何一项变化都会使缓存失效"""
+    cleaner = getattr(tokenizer.text_cleaner, '__name__', repr(tokenizer.text_cleaner))
+    phonemizer = tokenizer.phonemizer
+    return f"v{SCHEMA_VERSION}:{cleaner}:{phonemizer.name()}:{phonemizer.version()}"
+
+
+class PhonemeCache:
+    """SQLite音素缓存，WAL模式，可被多个进程同时读写；每个线程使用自己的连接"""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        self._memory = {}
+        with self._connection() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS phonemes (
+                    text TEXT NOT NULL,
+                    frontend TEXT NOT NULL,
+                    phonemes TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (text, frontend)
+                ) WITHOUT ROWID
+            """)
+
+    def _connection(self):
+        # fork_server.py在父进程加载模型(已经打开连接)后才fork，SQLite连接不能跨fork使用：
+        # 子进程中发现pid变化时丢弃继承来的连接(不关闭，以免影响父进程的锁)，重新打开
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def get(self, text, frontend):
+        key = (text, frontend)
+        if key in self._memory:
+            return self._memory[key]
+        row = self._connection().execute(
+            'SELECT phonemes FROM phonemes WHERE text = ? AND frontend = ?', key).fetchone()
+        if row is not None:
+            self._memory[key] = row[0]
+            return row[0]
+        return None
+
+    def put(self, text, frontend, phonemes):
+        self._memory[(text, frontend)] = phonemes
+        with self._connection() as db:
+            db.execute('INSERT OR REPLACE INTO phonemes VALUES (?, ?, ?, ?)',
+                       (text, frontend, phonemes, time.time()))
+
+    def install(self, tts):
+        """
+        为已加载的Coqui TTS模型的音素化器套上缓存，返回是否成功
+        模型不使用音素(例如XTTS直接使用BPE)时不做任何事
+        """
+        model = getattr(getattr(tts, 'synthesizer', None), 'tts_model', None)
+        return self.install_tokenizer(getattr(model, 'tokenizer', None))
+
+    def install_tokenizer(self, tokenizer):
+        """为Coqui TTSTokenizer的音素化器套上缓存，用于不经过TTS.api加载的前端(例如ONNX后端)"""
+        if tokenizer is None or not getattr(tokenizer, 'use_phonemes', False) or tokenizer.phonemizer is None:
+            return False
+
+        phonemizer = tokenizer.phonemizer
+        frontend = frontend_version(tokenizer)
+        original = phonemizer.phonemize
+
+        def phonemize(text, separator='|', language=None):
+            key_frontend = f"{frontend}:{language or phonemizer.language}:{separator}"
+            cached = self.get(text, key_frontend)
+            get_metrics().cache_result('phonemes', cached is not None)
+            if cached is None:
+                cached = original(text, separator=separator, language=language)
+                self.put(text, key_frontend, cached)
+            return cached
+
+        phonemizer.phonemize = phonemize
+        return True
+
+    def stats(self):
+        """{前端版本: 条目数}"""
+        rows = self._connection().execute('SELECT frontend, COUNT(*) FROM phonemes GROUP BY frontend ORDER BY frontend')
+        return dict(rows.fetchall())
+
+    def export_lexicon(self, path, frontend=None):
+        """导出为按文本排序的TSV发音词典，返回条目数"""
+        query = 'SELECT text, phonemes, frontend FROM phonemes'
+        params = ()
+        if frontend:
+            query += ' WHERE frontend = ?'
+            params = (frontend,)
+        rows = self._connection().execute(query + ' ORDER BY text, frontend', params).fetchall()
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("text\tphonemes\tfrontend\n")
+            for text, phonemes, row_frontend in rows:
+                f.write(f"{text}\t{phonemes}\t{row_frontend}\n")
+        os.replace(tmp_path, path)
+        return len(rows)
+
+
+def warm_cache(deck_path, cache_path=DEFAULT_CACHE_PATH):
+    """只运行文本前端，为卡组中所有英文单词预先填充缓存，不做推理"""
+    from deck_model import load_deck
+    from tts_backends import vits_backend
+
+    metrics = get_metrics()
+    backend = vits_backend(phoneme_cache_path=cache_path)
+    tokenizer = backend.load().synthesizer.tts_model.tokenizer
+
+    words = sorted({card.word.en for _, card in load_deck(deck_path).cards()})
+    with metrics.stage('phonemize', items=len(words)):
+        for word in words:
+            tokenizer.text_to_ids(word)
+    print(f"处理了 {len(words)} 个不同的英文单词")
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='VITS文本前端的音素缓存')
+    parser.add_argument('--cache', type=str, default=DEFAULT_CACHE_PATH, help=f'缓存文件 (默认: {DEFAULT_CACHE_PATH})')
+    parser.add_argument('--warm', action='store_true', help='为卡组中的英文单词预先填充缓存(需要TTS)')
+    parser.add_argument('--deck', type=str, default='categories.json', help='卡组文件 (默认: categories.json)')
+    parser.add_argument('--export', type=str, help='导出发音词典TSV到指定路径')
+    parser.add_argument('--frontend', type=str, help='导出时只包含指定前端版本的条目')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    with metrics_session('phoneme_cache', args.metrics, args.profile):
+        if args.warm:
+            warm_cache(args.deck, args.cache)
+
+        cache = PhonemeCache(args.cache)
+        if args.export:
+            count = cache.export_lexicon(args.export, args.frontend)
+            print(f"导出了 {count} 条发音到: {args.export}")
+
+    print(f"音素缓存: {args.cache}")
+    for frontend, count in cache.stats().items():
+        print(f"  {frontend}: {count} 条")
+
+
+if __name__ == "__main__":
+    main()
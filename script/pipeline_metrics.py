@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+流水线性能指标采集
+为script/下的各个脚本提供统一的阶段耗时、单项延迟分布、吞吐量、峰值内存和缓存命中率统计，
+结果可输出为JSON或Prometheus textfile格式，并可选地用cProfile/pyinstrument采样
+"""
+
+import contextlib
+import json
+import os
+import sys
+import threading
+import time
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PROFILERS = ('cprofile', 'pyinstrument')
+
+
+def percentile(sorted_values, q):
+    """对已排序的数组按线性插值计算分位数"""
+    if not sorted_values:
+        return 0.0
+    pos = (len(sorted_values) - 1) * q
+    lower = int(pos)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (pos - lower)
+
+
+def peak_rss_bytes(who='self'):
+    """返回进程(或已结束子进程)的峰值RSS，单位字节"""
+    if resource is None:
+        return 0
+    target = resource.RUSAGE_SELF if who == 'self' else resource.RUSAGE_CHILDREN
+    peak = resource.getrusage(target).ru_maxrss
+    # macOS返回字节，Linux返回KB
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class PipelineMetrics:
+    """一次脚本运行的指标集合，线程安全"""
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.latencies = {}
+        self.caches = {}
+        self.counters = {}
+
+    @contextlib.contextmanager
+    def stage(self, name, items=0):
+        """统计一个阶段的墙钟时间，items为该阶段处理的条目数"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                entry = self.stages.setdefault(name, {'wall_time': 0.0, 'calls': 0, 'items': 0})
+                entry['wall_time'] += elapsed
+                entry['calls'] += 1
+                entry['items'] += items
+
+    def add_items(self, stage, count=1):
+        """为阶段追加已处理条目数(条目数在进入阶段时未知时使用)"""
+        with self._lock:
+            entry = self.stages.setdefault(stage, {'wall_time': 0.0, 'calls': 0, 'items': 0})
+            entry['items'] += count
+
+    def observe(self, name, seconds):
+        """记录单个条目的处理延迟"""
+        with self._lock:
+            self.latencies.setdefault(name, []).append(seconds)
+
+    @contextlib.contextmanager
+    def timed(self, name):
+        """以上下文管理器的方式记录单个条目的延迟"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def cache_result(self, name, hit):
+        """记录一次缓存查询结果"""
+        with self._lock:
+            entry = self.caches.setdefault(name, {'hits': 0, 'misses': 0})
+            entry['hits' if hit else 'misses'] += 1
+
+    def incr(self, name, value=1):
+        """累加计数器"""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def snapshot(self):
+        """生成可序列化的指标快照"""
+        with self._lock:
+            stages = {}
+            for name, entry in self.stages.items():
+                wall = entry['wall_time']
+                stages[name] = dict(entry, throughput=(entry['items'] / wall) if wall > 0 and entry['items'] else 0.0)
+
+            latencies = {}
+            for name, values in self.latencies.items():
+                ordered = sorted(values)
+                latencies[name] = {
+                    'count': len(ordered),
+                    'sum': sum(ordered),
+                    'p50': percentile(ordered, 0.50),
+                    'p95': percentile(ordered, 0.95),
+                    'p99': percentile(ordered, 0.99),
+                    'max': ordered[-1] if ordered else 0.0,
+                }
+
+            caches = {}
+            for name, entry in self.caches.items():
+                total = entry['hits'] + entry['misses']
+                caches[name] = dict(entry, hit_rate=(entry['hits'] / total) if total else 0.0)
+
+            return {
+                'pipeline': self.pipeline,
+                'started_at': self.started_at,
+                'wall_time': time.perf_counter() - self._start,
+                'peak_rss_bytes': peak_rss_bytes('self'),
+                'peak_children_rss_bytes': peak_rss_bytes('children'),
+                'stages': stages,
+                'latencies': latencies,
+                'caches': caches,
+                'counters': dict(self.counters),
+            }
+
+    def to_prometheus(self):
+        """按Prometheus textfile collector格式输出"""
+        snap = self.snapshot()
+        label = f'pipeline="{snap["pipeline"]}"'
+        lines = [
+            '# TYPE pipeline_wall_time_seconds gauge',
+            f'pipeline_wall_time_seconds{{{label}}} {snap["wall_time"]:.6f}',
+            '# TYPE pipeline_peak_rss_bytes gauge',
+            f'pipeline_peak_rss_bytes{{{label},process="self"}} {snap["peak_rss_bytes"]}',
+            f'pipeline_peak_rss_bytes{{{label},process="children"}} {snap["peak_children_rss_bytes"]}',
+        ]
+
+        lines.append('# TYPE pipeline_stage_seconds gauge')
+        for name, entry in snap['stages'].items():
+            lines.append(f'pipeline_stage_seconds{{{label},stage="{name}"}} {entry["wall_time"]:.6f}')
+        lines.append('# TYPE pipeline_stage_items gauge')
+        for name, entry in snap['stages'].items():
+            lines.append(f'pipeline_stage_items{{{label},stage="{name}"}} {entry["items"]}')
+        lines.append('# TYPE pipeline_stage_throughput gauge')
+        for name, entry in snap['stages'].items():
+            lines.append(f'pipeline_stage_throughput{{{label},stage="{name}"}} {entry["throughput"]:.6f}')
+
+        lines.append('# TYPE pipeline_item_latency_seconds summary')
+        for name, entry in snap['latencies'].items():
+            for q in ('p50', 'p95', 'p99'):
+                quantile = int(q[1:]) / 100
+                lines.append(
+                    f'pipeline_item_latency_seconds{{{label},op="{name}",quantile="{quantile}"}} {entry[q]:.6f}'
+                )
+            lines.append(f'pipeline_item_latency_seconds_sum{{{label},op="{name}"}} {entry["sum"]:.6f}')
+            lines.append(f'pipeline_item_latency_seconds_count{{{label},op="{name}"}} {entry["count"]}')
+
+        lines.append('# TYPE pipeline_cache_requests_total counter')
+        for name, entry in snap['caches'].items():
+            lines.append(f'pipeline_cache_requests_total{{{label},cache="{name}",result="hit"}} {entry["hits"]}')
+            lines.append(f'pipeline_cache_requests_total{{{label},cache="{name}",result="miss"}} {entry["misses"]}')
+
+        lines.append('# TYPE pipeline_counter_total counter')
+        for name, value in snap['counters'].items():
+            lines.append(f'pipeline_counter_total{{{label},name="{name}"}} {value}')
+
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """写入指标文件，.prom后缀使用Prometheus格式，其余使用JSON"""
+        if path.endswith('.prom'):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+        # textfile collector要求原子替换
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+_current = PipelineMetrics('default')
+
+
+def get_metrics():
+    """返回当前运行的指标对象，供各脚本的库函数直接上报"""
+    return _current
+
+
+def add_metrics_arguments(parser):
+    """为脚本的argparse添加统一的指标/性能分析参数"""
+    parser.add_argument('--metrics', type=str, default=os.environ.get('PIPELINE_METRICS'),
+                        help='指标输出文件 (.json 或 .prom，默认读取 PIPELINE_METRICS 环境变量)')
+    parser.add_argument('--profile', choices=PROFILERS, default=os.environ.get('PIPELINE_PROFILE') or None,
+                        help='启用cProfile或pyinstrument性能分析 (默认读取 PIPELINE_PROFILE 环境变量)')
+    return parser
+
+
+@contextlib.contextmanager
+def metrics_session(pipeline, metrics_path=None, profile=None):
+    """
+    包裹一次脚本运行：
+    创建新的指标对象，按需启动性能分析，并在结束时(包括异常退出)写出结果
+    """
+    global _current
+    previous = _current
+    _current = PipelineMetrics(pipeline)
+
+    profiler = None
+    if profile == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif profile == 'pyinstrument':
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            print("警告: 未安装pyinstrument，跳过性能分析 (pip install pyinstrument)")
+        else:
+            profiler = Profiler()
+            profiler.start()
+
+    try:
+        yield _current
+    finally:
+        base = os.path.splitext(metrics_path)[0] if metrics_path else pipeline
+        if profile == 'cprofile' and profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(f"{base}.prof")
+            print(f"性能分析结果已保存到: {base}.prof")
+        elif profile == 'pyinstrument' and profiler is not None:
+            profiler.stop()
+            with open(f"{base}.html", 'w', encoding='utf-8') as f:
+                f.write(profiler.output_html())
+            print(f"性能分析结果已保存到: {base}.html")
+
+        if metrics_path:
+            _current.write(metrics_path)
+            print(f"指标已保存到: {metrics_path}")
+
+        _current = previous
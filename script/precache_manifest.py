@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Service Worker预缓存清单和预压缩文件
+为卡组JSON、索引/干扰项分片以及卡组引用的图片和语音生成带版本号的预缓存清单：
+每个条目的revision是文件内容sha256的前16位，内容变化时revision随之变化，
+Service Worker只需重新下载revision变化的条目；清单整体的revision由全部条目计算
+
+文本文件(JSON等)同时生成 .br 和 .gz 预压缩版本，放在原文件旁边，
+服务器或Service Worker按Accept-Encoding直接返回，不必在请求时压缩；
+压缩在线程池中并行进行，revision未变且压缩文件仍在时跳过
+
+清单格式:
+    {"version": 1, "revision": ..., "entries": [
+        {"url": "/categories.json", "path": "categories.json", "revision": ..., "size": ...,
+         "encodings": {"br": 大小, "gzip": 大小}}, ...]}
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from deck_model import DeckValidationError, load_deck
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+from verify_assets import IMAGE_ROOT, verify_assets
+from wav_info import VOICE_ROOT
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+PRECACHE_VERSION = 1
+PRECACHE_PATH = 'precache-manifest.json'
+DEFAULT_SHARD_DIRS = ('search_index', 'distractors')
+# 与src/components/flashcard中getImageUrl()/getAudioUrl()一致
+IMAGE_URL_PREFIX = '/images/'
+AUDIO_URL_PREFIX = '/audio/'
+TEXT_EXTENSIONS = ('.json', '.js', '.css', '.html', '.svg', '.txt', '.tsv', '.webmanifest')
+# 压缩后不小于原文件的95%时不生成该版本
+MAX_COMPRESSED_RATIO = 0.95
+ENCODINGS = {'br': '.br', 'gzip': '.gz'}
+
+
+def revision_of(data):
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def compress(encoding, data):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    # mtime固定为0，相同内容产生相同的.gz文件
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def available_encodings():
+    return [encoding for encoding in ENCODINGS if encoding != 'br' or brotli is not None]
+
+
+def write_atomic(path, data):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def precompress_file(path, previous=None, encodings=None):
+    """
+    读取文本文件，计算revision并生成预压缩版本，返回清单条目(不含url)
+    previous为上一次清单中同一路径的条目：revision相同且压缩文件都在时直接沿用
+    """
+    metrics = get_metrics()
+    with open(path, 'rb') as f:
+        data = f.read()
+    revision = revision_of(data)
+    entry = {'path': path, 'revision': revision, 'size': len(data), 'encodings': {}}
+
+    for encoding in encodings or available_encodings():
+        variant = path + ENCODINGS[encoding]
+        cached = (previous or {}).get('encodings', {}).get(encoding)
+        if previous and previous['revision'] == revision and cached and os.path.exists(variant):
+            metrics.cache_result('precompressed', True)
+            entry['encodings'][encoding] = cached
+            continue
+        metrics.cache_result('precompressed', False)
+
+        compressed = compress(encoding, data)
+        if len(compressed) < len(data) * MAX_COMPRESSED_RATIO:
+            write_atomic(variant, compressed)
+            entry['encodings'][encoding] = len(compressed)
+        elif os.path.exists(variant):
+            # 旧版本留下的压缩文件已经过期
+            os.remove(variant)
+    return entry
+
+
+def text_files(deck_paths, shard_dirs):
+    """需要预缓存的文本文件：卡组文件和各分片目录下的全部文本文件，按路径排序"""
+    paths = set(deck_paths)
+    for directory in shard_dirs:
+        for root, _, filenames in os.walk(directory):
+            for filename in filenames:
+                if filename.endswith(TEXT_EXTENSIONS):
+                    paths.add(os.path.join(root, filename))
+    return sorted(paths)
+
+
+def path_url(path):
+    return '/' + os.path.relpath(path).replace(os.sep, '/')
+
+
+def asset_url(kind, path):
+    """图片和语音按App中的URL规则映射，语音文件名已带有语言后缀，在/audio/下不会冲突"""
+    prefix = IMAGE_URL_PREFIX if kind == 'image' else AUDIO_URL_PREFIX
+    return prefix + os.path.basename(path)
+
+
+def build_precache_manifest(deck, deck_paths, shard_dirs, previous_manifest=None,
+                            image_root=IMAGE_ROOT, voice_root=VOICE_ROOT, workers=None):
+    """返回 (清单, 缺失或损坏的资源列表)"""
+    metrics = get_metrics()
+    previous = {entry['path']: entry for entry in (previous_manifest or {}).get('entries', [])
+                if 'path' in entry}
+    encodings = available_encodings()
+
+    paths = text_files(deck_paths, shard_dirs)
+    with metrics.stage('precompress', items=len(paths)):
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as executor:
+            entries = list(executor.map(lambda path: precompress_file(path, previous.get(path), encodings), paths))
+    for entry in entries:
+        entry['url'] = path_url(entry['path'])
+
+    results, _ = verify_assets(deck, image_root, voice_root, workers)
+    problems = [result for result in results if result.error]
+    for result in results:
+        if not result.error:
+            entries.append({'url': asset_url(result.kind, result.path), 'path': result.path,
+                            'revision': result.sha256[:16], 'size': result.size, 'encodings': {}})
+
+    entries.sort(key=lambda entry: entry['url'])
+    manifest = {
+        'version': PRECACHE_VERSION,
+        'revision': revision_of(''.join(f"{e['url']}\0{e['revision']}\n" for e in entries).encode('utf-8')),
+        'total_bytes': sum(entry['size'] for entry in entries),
+        'entries': [{key: entry[key] for key in ('url', 'path', 'revision', 'size', 'encodings')}
+                    for entry in entries],
+    }
+    return manifest, problems
+
+
+def load_manifest(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_manifest(manifest, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='生成Service Worker预缓存清单和预压缩文件')
+    parser.add_argument('--deck', type=str, default='categories.json', help='卡组文件 (默认: categories.json)')
+    parser.add_argument('--extra', type=str, nargs='*', default=[],
+                        help='其他需要预缓存并预压缩的文本文件，例如 public/manifest.json')
+    parser.add_argument('--shards', type=str, nargs='*', default=list(DEFAULT_SHARD_DIRS),
+                        help=f'分片目录 (默认: {" ".join(DEFAULT_SHARD_DIRS)}，不存在的目录会被跳过)')
+    parser.add_argument('--image-root', type=str, default=IMAGE_ROOT, help=f'图片目录 (默认: {IMAGE_ROOT})')
+    parser.add_argument('--voice-root', type=str, default=VOICE_ROOT, help=f'语音根目录 (默认: {VOICE_ROOT})')
+    parser.add_argument('--output', type=str, default=PRECACHE_PATH, help=f'清单输出路径 (默认: {PRECACHE_PATH})')
+    parser.add_argument('--workers', type=int, help='并行线程数')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    print("预缓存清单生成")
+    print("=" * 50)
+    if brotli is None:
+        print("注意: 未安装brotli/brotlicffi，只生成.gz版本")
+
+    shard_dirs = [directory for directory in args.shards if os.path.isdir(directory)]
+    with metrics_session('precache_manifest', args.metrics, args.profile):
+        try:
+            deck = load_deck(args.deck)
+        except DeckValidationError as e:
+            print(f"✗ {args.deck} 结构不合法: {e}")
+            sys.exit(1)
+
+        manifest, problems = build_precache_manifest(deck, [args.deck] + args.extra, shard_dirs,
+                                                     load_manifest(args.output), args.image_root,
+                                                     args.voice_root, args.workers)
+        if problems:
+            # 预缓存中任何一个条目下载失败都会使Service Worker安装失败，不写出不完整的清单
+            print(f"✗ {len(problems)} 个资源缺失或损坏，请先运行 verify_assets.py 检查:")
+            for result in problems[:10]:
+                print(f"  - {result.path}: {result.error}")
+            sys.exit(1)
+        write_manifest(manifest, args.output)
+
+    entries = manifest['entries']
+    compressed = [entry for entry in entries if entry['encodings']]
+    text_bytes = sum(entry['size'] for entry in compressed)
+    print(f"{len(entries)} 个条目 ({manifest['total_bytes'] / 1024 / 1024:.1f} MB)，清单版本 {manifest['revision']}")
+    if compressed:
+        for encoding in available_encodings():
+            size = sum(entry['encodings'].get(encoding, entry['size']) for entry in compressed)
+            print(f"  {encoding}: {len(compressed)} 个文本文件 {text_bytes / 1024:.0f} KB -> {size / 1024:.0f} KB")
+    print(f"清单已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+变速语音生成
+为初学者提供慢速(默认0.75倍)发音：不重新运行TTS，而是对已有的语音做保持音高的时间伸缩，
+成本只有重新合成的一小部分。使用WSOLA(波形相似重叠相加)：
+每个输出帧在理想位置附近的容差范围内，选取与上一帧自然延续最相似的一段输入再重叠相加，
+全部候选位置的互相关由一次np.correlate算出；文件在进程池中并行处理
+
+变体文件写在原文件旁边，例如 resource/voice/en/cat_en_slow.wav，
+并登记为卡组中 voice_filename 的额外条目 (en_slow / cn_slow)，asset_server.py和预缓存清单会随卡组一起处理
+
+用法:
+    python3 time_stretch.py                         # 生成慢速版本 (0.75倍)
+    python3 time_stretch.py --variants slow fast    # 同时生成快速版本 (1.25倍)
+    python3 time_stretch.py --variants slow=0.6 --force
+"""
+
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from audio_qa import map_samples
+from deck_model import load_deck, save_deck
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+from tts_pipeline import encode_pcm16, write_wav_atomic
+from wav_info import LANGUAGES, VOICE_ROOT, read_wav_info
+
+# 变体名称 -> 语速倍数 (小于1变慢)
+SPEED_VARIANTS = {'slow': 0.75, 'fast': 1.25}
+# 帧长覆盖数个基音周期；容差至少一个最低基音周期(约100Hz)，才能找到对齐的位置
+FRAME_MS = 30
+TOLERANCE_MS = 10
+
+
+def wsola(samples, rate, sample_rate, frame_ms=FRAME_MS, tolerance_ms=TOLERANCE_MS):
+    """单声道采样的时间伸缩，输出长度约为 len(samples) / rate，音高不变"""
+    x = np.asarray(samples, dtype=np.float32)
+    frame = max(4, int(sample_rate * frame_ms / 1000) // 2 * 2)
+    hop = frame // 2
+    tolerance = int(sample_rate * tolerance_ms / 1000)
+    output_length = int(round(len(x) / rate))
+    frames = output_length // hop + 1
+    # 周期Hann窗在半帧重叠时逐点相加恰好为1
+    window = (0.5 - 0.5 * np.cos(2 * np.pi * np.arange(frame) / frame)).astype(np.float32)
+
+    # 两端补零，候选段和自然延续段都不会越界；padded中的位置 = 输入位置 + tolerance
+    tail = int(frames * hop * rate) + frame + 2 * tolerance + hop
+    padded = np.concatenate([np.zeros(tolerance, np.float32), x, np.zeros(max(tail - len(x), 0), np.float32)])
+    energy = np.concatenate([[0.0], np.cumsum(padded.astype(np.float64) ** 2)])
+
+    output = np.zeros(frames * hop + frame, dtype=np.float32)
+    weight = np.zeros_like(output)
+    position = 0
+    for k in range(frames):
+        if k:
+            natural = padded[position + tolerance + hop:position + tolerance + hop + frame]
+            start = max(int(round(k * hop * rate)) - tolerance, -tolerance)
+            region = padded[start + tolerance:start + 3 * tolerance + frame]
+            starts = np.arange(start + tolerance, start + 3 * tolerance + 1)
+            # 全部候选位置的归一化互相关；静音候选的能量为0，用一个极小值避免除零
+            similarity = np.correlate(region, natural, 'valid') / np.sqrt(energy[starts + frame] - energy[starts] + 1e-9)
+            position = start + int(np.argmax(similarity))
+        offset = k * hop
+        output[offset:offset + frame] += window * padded[position + tolerance:position + tolerance + frame]
+        weight[offset:offset + frame] += window
+    # 开头半帧只有上升沿的窗，按窗的累加值归一化
+    output /= np.where(weight > 1e-3, weight, 1.0)
+    return output[:output_length]
+
+
+def stretch_samples(samples, rate, sample_rate):
+    """(帧数, 声道) 的采样逐声道伸缩"""
+    samples = np.asarray(samples, dtype=np.float32)
+    return np.stack([wsola(samples[:, channel], rate, sample_rate) for channel in range(samples.shape[1])], axis=1)
+
+
+def stretch_file(task):
+    """在工作进程中运行：task为 (源文件, 输出文件, 语速)，返回 (输出文件, 错误信息或None)"""
+    source, target, rate = task
+    try:
+        info = read_wav_info(source)
+        stretched = stretch_samples(map_samples(source, info), rate, info.sample_rate)
+        write_wav_atomic(target, encode_pcm16(stretched), info.sample_rate, info.channels)
+        return target, None
+    except (OSError, ValueError, struct.error) as e:
+        return target, str(e)
+
+
+def parse_variant(text):
+    """'slow' 或 'slow=0.7' -> ('slow', 0.7)"""
+    name, _, rate = text.partition('=')
+    if not name:
+        raise ValueError(f"变体缺少名称: {text}")
+    if not rate:
+        if name not in SPEED_VARIANTS:
+            raise ValueError(f"未知的变体 {name}，可用: {', '.join(SPEED_VARIANTS)}，或写成 名称=倍数")
+        return name, SPEED_VARIANTS[name]
+    rate = float(rate)
+    if not 0.25 <= rate <= 4:
+        raise ValueError(f"语速倍数应在0.25到4之间: {text}")
+    return name, rate
+
+
+def variant_filename(filename, variant):
+    stem, extension = os.path.splitext(filename)
+    return f"{stem}_{variant}{extension or '.wav'}"
+
+
+def plan_variants(deck, variants, voice_root=VOICE_ROOT, force=False):
+    """
+    返回 (任务列表[(源文件, 输出文件, 语速)], 登记列表[(卡片, 键, 文件名, 输出文件)])
+    输出文件比源文件新时跳过(改变语速后使用--force重新生成)
+    """
+    tasks, registrations, planned = [], [], set()
+    for _, card in deck.cards():
+        for language in LANGUAGES:
+            source = os.path.join(voice_root, language, card.voice.get(language))
+            for variant, rate in variants:
+                filename = variant_filename(card.voice.get(language), variant)
+                target = os.path.join(voice_root, language, filename)
+                registrations.append((card, f"{language}_{variant}", filename, target))
+                if target in planned or not os.path.exists(source):
+                    continue
+                planned.add(target)
+                if force or not os.path.exists(target) or os.path.getmtime(target) < os.path.getmtime(source):
+                    tasks.append((source, target, rate))
+    return tasks, registrations
+
+
+def register_variants(registrations):
+    """存在的变体文件登记到voice_filename，不存在的从卡组中删除；返回卡组是否有变化"""
+    changed = False
+    for card, key, filename, target in registrations:
+        extra = card.voice.extra or {}
+        if os.path.exists(target):
+            if extra.get(key) != filename:
+                extra[key] = filename
+                card.voice.extra = extra
+                changed = True
+        elif key in extra:
+            del extra[key]
+            card.voice.extra = extra or None
+            changed = True
+    return changed
+
+
+def run_stretch(tasks, workers=None):
+    """在进程池中生成全部变体，返回失败列表[(输出文件, 错误信息)]"""
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # 每个任务只有几十毫秒，成批分发减少进程间通信
+        chunksize = max(1, len(tasks) // ((workers or os.cpu_count() or 1) * 8))
+        for done, (target, error) in enumerate(executor.map(stretch_file, tasks, chunksize=chunksize), 1):
+            if error:
+                failed.append((target, error))
+            if done % 1000 == 0:
+                print(f"  已处理 {done}/{len(tasks)}")
+    return failed
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='对已有语音做保持音高的变速，生成慢速/快速版本并登记到卡组')
+    parser.add_argument('--deck', type=str, default='categories.json', help='卡组文件 (默认: categories.json)')
+    parser.add_argument('--voice-root', type=str, default=VOICE_ROOT, help=f'语音根目录 (默认: {VOICE_ROOT})')
+    parser.add_argument('--variants', type=str, nargs='+', default=['slow'],
+                        help=f"生成的变体，名称或 名称=倍数 ({', '.join(f'{k}={v}' for k, v in SPEED_VARIANTS.items())}，"
+                             f"默认: slow)")
+    parser.add_argument('--force', action='store_true', help='重新生成已存在的变体文件')
+    parser.add_argument('--workers', type=int, help='并行进程数')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    try:
+        variants = [parse_variant(text) for text in args.variants]
+    except ValueError as e:
+        parser.error(str(e))
+
+    with metrics_session('time_stretch', args.metrics, args.profile):
+        metrics = get_metrics()
+        deck = load_deck(args.deck)
+        with metrics.stage('plan', items=deck.card_count):
+            tasks, registrations = plan_variants(deck, variants, args.voice_root, args.force)
+        print(f"变体: {', '.join(f'{name} ({rate}倍)' for name, rate in variants)}，"
+              f"需要生成 {len(tasks)} 个文件，{len(registrations) - len(tasks)} 个已是最新或缺少原文件")
+
+        failed = []
+        if tasks:
+            with metrics.stage('stretch', items=len(tasks)):
+                failed = run_stretch(tasks, args.workers)
+        for target, error in failed[:20]:
+            print(f"  ✗ {target}: {error}")
+
+        if register_variants(registrations):
+            with metrics.stage('write', items=1):
+                save_deck(deck, args.deck)
+            print(f"已更新 {args.deck} 中的voice_filename")
+
+    print(f"✓ 生成 {len(tasks) - len(failed)} 个变体文件{f'，失败 {len(failed)} 个' if failed else ''}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,6 +9,42 @@ import re
 import os
 from pathlib import Path
 
+from offline_dictionary import get_dictionary
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+
+# 文件名后缀的组合模式，一次匹配等价于依次执行：
+# 1. 移除随机字母数字后缀（如 -edk7q2, -68rc1e）：连字符后跟3-10个字符，包含数字
+# 2. 再移除简单的数字后缀（如 -1, -2）
+# 使用MULTILINE模式，可以对换行拼接的整批文件名一次性处理
+FILENAME_SUFFIX_PATTERN = re.compile(r'(?:-\d+)?(?:-[a-zA-Z]*[0-9][a-zA-Z0-9]{2,9})?$', re.MULTILINE)
+
+# 转换为单词时保留大写的特殊缩写
+SPECIAL_WORDS = {
+    'ai': 'AI',
+    'tts': 'TTS',
+    'cpu': 'CPU',
+    'led': 'LED',
+    'usb': 'USB',
+    'wifi': 'Wi-Fi',
+    'tv': 'TV',
+    'pc': 'PC',
+    'dna': 'DNA',
+    'phd': 'PhD',
+    'mri': 'MRI',
+    'xray': 'X-ray'
+}
+
+def filename_to_base_name(filename):
+    """
+    移除扩展名和随机后缀，得到基础名
+    例如: "cat-edk7q2.png" -> "cat"
+    """
+    return FILENAME_SUFFIX_PATTERN.sub('', filename.replace('.png', ''), count=1)
+
+def format_token(token):
+    """单词首字母大写，其余小写，特殊缩写保持原有写法"""
+    return SPECIAL_WORDS.get(token.lower()) or token.capitalize()
+
 def clean_filename_to_word(filename):
     """
     将文件名转换为英文单词
@@ -16,49 +52,46 @@ def clean_filename_to_word(filename):
          "cat-edk7q2.png" -> "cat"
          "apple-juice.png" -> "apple juice"
     """
-    # 移除 .png 扩展名
-    base_name = filename.replace('.png', '')
-
-    # 更精确地移除随机字母数字后缀（如 -edk7q2, -68rc1e）
-    # 匹配模式：连字符后跟3-10个字符，包含至少2个数字或混合字母数字
-    # 这样避免误删真正的词汇
-    base_name = re.sub(r'-[a-zA-Z]*[0-9][a-zA-Z0-9]{2,9}$', '', base_name)
-
-    # 处理简单的数字后缀（如 -1, -2）
-    base_name = re.sub(r'-\d+$', '', base_name)
-
-    # 将连字符替换为空格
-    word = base_name.replace('-', ' ')
-
-    # 转换为合适的大小写格式（首字母大写，其余小写）
-    # 但保留一些特殊缩写的大写
-    special_words = {
-        'ai': 'AI',
-        'tts': 'TTS',
-        'cpu': 'CPU',
-        'led': 'LED',
-        'usb': 'USB',
-        'wifi': 'Wi-Fi',
-        'tv': 'TV',
-        'pc': 'PC',
-        'dna': 'DNA',
-        'phd': 'PhD',
-        'mri': 'MRI',
-        'xray': 'X-ray'
-    }
-
-    words = word.split()
-    result_words = []
-
-    for w in words:
-        lower_w = w.lower()
-        if lower_w in special_words:
-            result_words.append(special_words[lower_w])
-        else:
-            # 首字母大写，其余小写
-            result_words.append(w.capitalize())
+    # 将连字符替换为空格，并规范每个单词的大小写
+    return ' '.join(format_token(w) for w in filename_to_base_name(filename).replace('-', ' ').split())
 
-    return ' '.join(result_words)
+def normalize_filenames(filenames):
+    """
+    批量规范化文件名
+    对整批文件名只执行一次后缀正则，每个文件只计算一次基础名，
+    同时返回英文单词列表和语音文件名列表（与输入顺序一致）
+    """
+    filenames = list(filenames)
+    if not filenames:
+        return [], []
+
+    joined = '\n'.join(filenames)
+    if joined.count('\n') != len(filenames) - 1:
+        # 文件名本身包含换行时无法整批处理，逐个计算
+        return ([clean_filename_to_word(f) for f in filenames],
+                [create_voice_filename(f) for f in filenames])
+
+    joined = FILENAME_SUFFIX_PATTERN.sub('', joined.replace('.png', ''))
+    base_names = joined.split('\n')
+
+    # 同一个单词在整批中只格式化一次
+    token_cache = {}
+
+    def cached_format(token):
+        formatted = token_cache.get(token)
+        if formatted is None:
+            formatted = token_cache[token] = format_token(token)
+        return formatted
+
+    words = [
+        ' '.join([cached_format(token) for token in line.split()])
+        for line in joined.replace('-', ' ').split('\n')
+    ]
+    voice_filenames = [
+        {"cn": f"{base_name}_cn.wav", "en": f"{base_name}_en.wav"}
+        for base_name in base_names
+    ]
+    return words, voice_filenames
 
 def translate_to_chinese(english_word, category_id):
     """
@@ -122,6 +155,7 @@ def translate_to_chinese(english_word, category_id):
     # 首先检查常用翻译字典
     lower_word = english_word.lower()
     if lower_word in common_translations:
+        get_metrics().cache_result('translation_dictionary', True)
         return common_translations[lower_word]
 
     # 根据分类进行专门翻译
@@ -164,9 +198,18 @@ def translate_to_chinese(english_word, category_id):
 
     if category_id in category_translations:
         if lower_word in category_translations[category_id]:
+            get_metrics().cache_result('translation_dictionary', True)
             return category_translations[category_id][lower_word]
 
-    # 如果没有找到翻译，尝试智能翻译
+    # 如果没有找到翻译，查询编译好的离线词典(offline_dictionary.py)，只采用全部单词都找到的结果
+    get_metrics().cache_result('translation_dictionary', False)
+    dictionary = get_dictionary()
+    if dictionary is not None:
+        translation = dictionary.translate(english_word)
+        if translation.complete:
+            return translation.chinese
+
+    # 最后尝试智能翻译
     return smart_translate(english_word, category_id)
 
 def smart_translate(english_word, category_id):
@@ -282,11 +325,8 @@ def create_voice_filename(filename):
     创建语音文件名
     例如: "apple-juice.png" -> {"cn": "apple-juice_cn.wav", "en": "apple-juice_en.wav"}
     """
-    base_name = filename.replace('.png', '')
-
     # 使用与clean_filename_to_word相同的逻辑移除随机后缀
-    base_name = re.sub(r'-[a-zA-Z]*[0-9][a-zA-Z0-9]{2,9}$', '', base_name)
-    base_name = re.sub(r'-\d+$', '', base_name)
+    base_name = filename_to_base_name(filename)
 
     return {
         "cn": f"{base_name}_cn.wav",
@@ -300,9 +340,12 @@ def transform_categories(input_file, output_file=None):
     if output_file is None:
         output_file = input_file
 
+    metrics = get_metrics()
+
     # 读取原始文件
-    with open(input_file, 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    with metrics.stage('load', items=1):
+        with open(input_file, 'r', encoding='utf-8') as f:
+            data = json.load(f)
 
     print(f"开始转换 {len(data['categories'])} 个分类...")
 
@@ -310,64 +353,63 @@ def transform_categories(input_file, output_file=None):
     total_failed = 0
 
     # 转换每个分类
-    for category in data['categories']:
-        category_id = category['id']
-        original_images = category['images']
-        transformed_images = []
-
-        print(f"\n处理分类: {category_id} ({category['name']['en']})")
-        print(f"原始图片数量: {len(original_images)}")
-
-        failed_in_category = 0
-
-        for filename in original_images:
-            try:
-                # 生成英文单词
-                english_word = clean_filename_to_word(filename)
-
-                # 生成中文翻译
-                chinese_word = translate_to_chinese(english_word, category_id)
-
-                # 生成语音文件名
-                voice_filenames = create_voice_filename(filename)
-
-                # 创建新的图片对象
-                image_object = {
-                    "filename": filename,
-                    "word": {
-                        "cn": chinese_word,
-                        "en": english_word
-                    },
-                    "voice_filename": voice_filenames
-                }
-
-                transformed_images.append(image_object)
-
-            except Exception as e:
-                print(f"处理文件 {filename} 时出错: {e}")
-                # 创建一个基本的对象，即使翻译失败
-                english_word = clean_filename_to_word(filename)
-                image_object = {
-                    "filename": filename,
-                    "word": {
-                        "cn": english_word,  # 使用英文作为备用
-                        "en": english_word
-                    },
-                    "voice_filename": create_voice_filename(filename)
-                }
-                transformed_images.append(image_object)
-                failed_in_category += 1
-
-        # 更新分类的图片数组
-        category['images'] = transformed_images
-        category['count'] = len(transformed_images)
-
-        total_processed += len(transformed_images)
-        total_failed += failed_in_category
-
-        print(f"转换完成: {len(transformed_images)} 个图片对象")
-        if failed_in_category > 0:
-            print(f"警告: {failed_in_category} 个文件处理时遇到问题")
+    with metrics.stage('transform'):
+        for category in data['categories']:
+            category_id = category['id']
+            original_images = category['images']
+            transformed_images = []
+
+            print(f"\n处理分类: {category_id} ({category['name']['en']})")
+            print(f"原始图片数量: {len(original_images)}")
+
+            failed_in_category = 0
+
+            # 批量生成英文单词和语音文件名
+            english_words, voice_filename_list = normalize_filenames(original_images)
+
+            for filename, english_word, voice_filenames in zip(original_images, english_words, voice_filename_list):
+                try:
+                    # 生成中文翻译
+                    with metrics.timed('translation'):
+                        chinese_word = translate_to_chinese(english_word, category_id)
+
+                    # 创建新的图片对象
+                    image_object = {
+                        "filename": filename,
+                        "word": {
+                            "cn": chinese_word,
+                            "en": english_word
+                        },
+                        "voice_filename": voice_filenames
+                    }
+
+                    transformed_images.append(image_object)
+
+                except Exception as e:
+                    print(f"处理文件 {filename} 时出错: {e}")
+                    # 创建一个基本的对象，即使翻译失败
+                    image_object = {
+                        "filename": filename,
+                        "word": {
+                            "cn": english_word,  # 使用英文作为备用
+                            "en": english_word
+                        },
+                        "voice_filename": voice_filenames
+                    }
+                    transformed_images.append(image_object)
+                    failed_in_category += 1
+
+            # 更新分类的图片数组
+            category['images'] = transformed_images
+            category['count'] = len(transformed_images)
+
+            total_processed += len(transformed_images)
+            total_failed += failed_in_category
+            metrics.add_items('transform', len(transformed_images))
+
+            print(f"转换完成: {len(transformed_images)} 个图片对象")
+            if failed_in_category > 0:
+                print(f"警告: {failed_in_category} 个文件处理时遇到问题")
 
     # 更新统计信息
     data['statistics']['total_images'] = total_processed
@@ -378,15 +420,16 @@ def transform_categories(input_file, output_file=None):
     print(f"处理失败数: {total_failed}")
     print(f"成功率: {((total_processed - total_failed) / total_processed * 100):.1f}%")
 
-    # 备份原始文件
-    backup_file = input_file.replace('.json', '_backup.json')
-    with open(backup_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-    print(f"原始文件已备份到: {backup_file}")
+    with metrics.stage('write', items=2):
+        # 备份原始文件
+        backup_file = input_file.replace('.json', '_backup.json')
+        with open(backup_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        print(f"原始文件已备份到: {backup_file}")
 
-    # 写入转换后的文件
-    with open(output_file, 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+        # 写入转换后的文件
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
 
     print(f"转换完成！结果已保存到: {output_file}")
 
@@ -394,6 +437,12 @@ def transform_categories(input_file, output_file=None):
 
 def main():
     """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='categories.json 结构转换脚本')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
     input_file = 'categories_original.json'
     output_file = 'categories.json'
 
@@ -406,7 +455,8 @@ def main():
 
     try:
         # 执行转换
-        transform_categories(input_file, output_file)
+        with metrics_session('transform_categories', args.metrics, args.profile):
+            transform_categories(input_file, output_file)
 
         print("\n转换成功完成！")
         print("建议检查转换结果，特别是中文翻译的准确性。")
@@ -1,39 +1,96 @@
-import json
 import asyncio
-from googletrans import Translator
+import time
+
+from deck_model import load_deck, save_deck
+from offline_dictionary import DEFAULT_DICTIONARY_PATH, LATIN, OfflineDictionary
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
 
 async def translate_text(translator, text, dest_language='zh-cn'):
     """
     Translates the given text to the specified destination language.
     """
+    start = time.perf_counter()
     try:
         translation = await translator.translate(text, dest=dest_language)
+        get_metrics().observe('translation', time.perf_counter() - start)
         return translation.text
     except Exception as e:
         print(f"Error translating '{text}': {type(e).__name__} - {e}")
         return text
 
-async def fix_translations():
+def translate_offline(dictionary, text):
+    """
+    Translates the given text with the compiled offline dictionary.
+    Returns None when some of the words are not in the dictionary.
+    """
+    start = time.perf_counter()
+    translation = dictionary.translate(text)
+    get_metrics().observe('translation', time.perf_counter() - start)
+    return translation.chinese if translation.complete else None
+
+async def fix_translations(dictionary_path=None):
     """
     Reads the categories.json file, translates the word.cn fields, and saves the updated file.
+    With dictionary_path, words are looked up in the offline dictionary instead of googletrans;
+    words the dictionary cannot fully translate are left unchanged and listed at the end.
     """
-    with open('categories.json', 'r', encoding='utf-8') as f:
-        data = json.load(f)
+    metrics = get_metrics()
+
+    with metrics.stage('load', items=1):
+        deck = load_deck('categories.json')
 
-    translator = Translator()
-    for category in data['categories']:
-        for image in category['images']:
-            english_word = image['word']['en']
-            chinese_word = image['word']['cn']
+    if dictionary_path:
+        dictionary = OfflineDictionary(dictionary_path)
+        translator = None
+    else:
+        from googletrans import Translator
+        dictionary = None
+        translator = Translator()
+    untranslated = []
+    with metrics.stage('translate'):
+        for _, card in deck.cards():
+            english_word = card.word.en
+            chinese_word = card.word.cn
 
-            # If the Chinese word is the same as the English word, or if it contains non-Chinese characters,
-            # then it needs to be translated.
-            if chinese_word == english_word or any(char.isalpha() for char in chinese_word):
+            # If the Chinese word is empty, the same as the English word, or contains Latin letters,
+            # then it needs to be translated. (str.isalpha() is also true for CJK characters.)
+            needs_translation = not chinese_word or chinese_word == english_word or bool(LATIN.search(chinese_word))
+            metrics.cache_result('existing_translation', not needs_translation)
+            if needs_translation and dictionary is not None:
+                translation = translate_offline(dictionary, english_word)
+                if translation is None:
+                    untranslated.append(english_word)
+                else:
+                    card.word.cn = translation
+                metrics.add_items('translate')
+            elif needs_translation:
                 print(f"Translating '{english_word}' to Chinese...")
-                image['word']['cn'] = await translate_text(translator, english_word)
+                card.word.cn = await translate_text(translator, english_word)
+                metrics.add_items('translate')
+
+    if untranslated:
+        print(f"{len(untranslated)} words are not fully covered by the offline dictionary:")
+        for english_word in untranslated:
+            print(f"  {english_word}")
+
+    with metrics.stage('write', items=1):
+        save_deck(deck, 'categories.json')
+
+async def main():
+    """
+    Parses command-line options and runs the translation pass with metrics collection.
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Translate word.cn fields in categories.json')
+    parser.add_argument('--offline', type=str, nargs='?', const=DEFAULT_DICTIONARY_PATH, metavar='DICTIONARY',
+                        help='Translate with a dictionary compiled by offline_dictionary.py instead of googletrans '
+                             f'(default: {DEFAULT_DICTIONARY_PATH})')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
 
-    with open('categories.json', 'w', encoding='utf-8') as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+    with metrics_session('translate', args.metrics, args.profile):
+        await fix_translations(args.offline)
 
 if __name__ == '__main__':
-    asyncio.run(fix_translations())
\ No newline at end of file
+    asyncio.run(main())
\ No newline at end of file
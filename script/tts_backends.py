@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+TTS后端
+在当前进程内加载一次Coqui TTS模型，直接返回音频采样，
+替代每个单词启动一次tts命令(每次都要重新加载模型)的方式
+"""
+
+import importlib.util
+import io
+import json
+import os
+import urllib.request
+import wave
+
+from phoneme_cache import DEFAULT_CACHE_PATH as DEFAULT_PHONEME_CACHE, PhonemeCache
+
+VITS_MODEL = 'tts_models/en/vctk/vits'
+XTTS_MODEL = 'tts_models/multilingual/multi-dataset/xtts_v2'
+BAKER_MODEL = 'tts_models/zh-CN/baker/tacotron2-DDC-GST'
+
+# api: 进程内加载模型并流水合成；cli: 每条调用一次tts命令
+ENGINES = ('auto', 'api', 'cli')
+
+
+def coqui_available():
+    """是否安装了Coqui TTS的Python包"""
+    return importlib.util.find_spec('TTS') is not None
+
+
+def resolve_engine(engine):
+    """auto: 安装了TTS Python包时使用api，否则使用cli"""
+    if engine == 'auto':
+        return 'api' if coqui_available() else 'cli'
+    return engine
+
+
+class CoquiBackend:
+    """
+    Coqui TTS Python API的封装，模型在第一次合成时加载
+    synthesize() 返回 (float采样列表, 采样率)
+    指定phoneme_cache_path时，模型的音素化结果写入共享的音素缓存
+    """
+
+    def __init__(self, model_name, speaker=None, language=None, device='cpu', phoneme_cache_path=None):
+        self.model_name = model_name
+        self.speaker = speaker
+        self.language = language
+        self.device = device
+        self.phoneme_cache_path = phoneme_cache_path
+        self._tts = None
+
+    @property
+    def name(self):
+        return self.model_name
+
+    def load(self):
+        if self._tts is None:
+            os.environ.setdefault('COQUI_TTS_AGREED', '1')
+            from TTS.api import TTS
+            self._tts = TTS(model_name=self.model_name, progress_bar=False).to(self.device)
+            if self.phoneme_cache_path:
+                PhonemeCache(self.phoneme_cache_path).install(self._tts)
+        return self._tts
+
+    @property
+    def sample_rate(self):
+        return self.load().synthesizer.output_sample_rate
+
+    def resolve_speaker(self, speaker):
+        """说话人名称；xtts_chinese_tts.py沿用的数字ID按从1开始的序号解析"""
+        speakers = self.load().speakers or []
+        speaker = speaker or self.speaker
+        if speaker in speakers or not speakers:
+            return speaker
+        if speaker and speaker.isdigit() and 0 < int(speaker) <= len(speakers):
+            return speakers[int(speaker) - 1]
+        return speakers[0]
+
+    def synthesize(self, text, speaker=None, language=None):
+        tts = self.load()
+        kwargs = {}
+        if tts.is_multi_speaker:
+            kwargs['speaker'] = self.resolve_speaker(speaker)
+        if tts.is_multi_lingual:
+            kwargs['language'] = language or self.language
+        return tts.tts(text=text, **kwargs), self.sample_rate
+
+
+class RemoteBackend:
+    """
+    tts_server.py的HTTP客户端，接口与CoquiBackend相同，
+    多个脚本共用服务中已经加载好的模型，重复的文本直接命中服务端缓存
+    """
+
+    def __init__(self, url, speaker=None, language=None, timeout=600):
+        self.url = url.rstrip('/')
+        self.speaker = speaker
+        self.language = language
+        self.timeout = timeout
+
+    @property
+    def name(self):
+        return f"remote:{self.url}"
+
+    def synthesize_wav(self, text, speaker=None, language=None):
+        """返回服务端生成的WAV文件内容"""
+        payload = json.dumps({'text': text, 'speaker': speaker or self.speaker,
+                              'language': language or self.language}).encode('utf-8')
+        request = urllib.request.Request(f"{self.url}/synthesize", data=payload,
+                                         headers={'Content-Type': 'application/json'})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return response.read()
+
+    def synthesize(self, text, speaker=None, language=None):
+        import numpy as np
+
+        with wave.open(io.BytesIO(self.synthesize_wav(text, speaker, language)), 'rb') as f:
+            pcm = np.frombuffer(f.readframes(f.getnframes()), dtype='<i2')
+            return pcm.astype(np.float32) / 32767, f.getframerate()
+
+
+def vits_backend(speaker='p273', phoneme_cache_path=DEFAULT_PHONEME_CACHE):
+    """英文VITS (VCTK) 后端，默认启用音素缓存"""
+    return CoquiBackend(VITS_MODEL, speaker=speaker, phoneme_cache_path=phoneme_cache_path)
+
+
+def xtts_backend(speaker=None, language='zh-cn'):
+    """多语言XTTS v2后端"""
+    return CoquiBackend(XTTS_MODEL, speaker=speaker, language=language)
+
+
+def baker_backend():
+    """中文单说话人Tacotron2 (Baker) 后端"""
+    return CoquiBackend(BAKER_MODEL)
+
+
+# 每种语言可选的后端，按名称创建；tts_calibrate.py在其中按实测速度选择
+BACKEND_CANDIDATES = {
+    'en': ('vits-onnx-int8', 'vits-onnx', 'vits', 'xtts'),
+    'cn': ('baker', 'xtts'),
+}
+XTTS_LANGUAGES = {'en': 'en', 'cn': 'zh-cn'}
+
+
+def onnx_model_path(name):
+    """vits-onnx / vits-onnx-int8 对应的模型文件"""
+    from vits_onnx import DEFAULT_MODEL_PATH, quantized_path
+    return quantized_path(DEFAULT_MODEL_PATH) if name.endswith('int8') else DEFAULT_MODEL_PATH
+
+
+def backend_available(name):
+    """后端依赖的包和模型文件是否存在(不加载模型)"""
+    if name.startswith('vits-onnx'):
+        return (coqui_available() and importlib.util.find_spec('onnxruntime') is not None
+                and os.path.exists(onnx_model_path(name)))
+    return coqui_available()
+
+
+def create_backend(name, language, speaker=None):
+    """按名称创建后端；speaker只对多说话人模型有意义，未指定时使用各脚本一直使用的默认值"""
+    if name == 'vits':
+        return vits_backend(speaker or 'p273')
+    if name.startswith('vits-onnx'):
+        from vits_onnx import OnnxVitsBackend
+        return OnnxVitsBackend(onnx_model_path(name), speaker or 'p273')
+    if name == 'baker':
+        return baker_backend()
+    if name == 'xtts':
+        return xtts_backend(speaker or '1', XTTS_LANGUAGES[language])
+    raise ValueError(f"未知的TTS后端: {name}")
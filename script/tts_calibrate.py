@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+TTS后端自动选择
+用卡组中抽取的一批单词，在本机上依次测量每个可用后端(ONNX int8/fp32、VITS、Baker、XTTS)的
+模型加载时间、实时率(RTF = 合成耗时 / 音频时长)和峰值内存，并检查输出音频是否通过质量门槛；
+每种语言选出通过门槛且RTF最低的后端，结果按机器和软件版本的指纹缓存在 .cache/tts_calibration.json
+
+vits_p273_english_tts.py 和 xtts_chinese_tts.py 的 --engine auto 会读取这里的选择，
+缓存不存在或指纹不匹配时先自动测量一次；--calibrate 强制重新测量。
+没有合格后端的结论也会缓存，之后直接使用各脚本的默认后端，不会每次运行都重新测量
+
+每个后端在单独的spawn子进程中测量，峰值内存互不影响，测量结束后模型随进程释放
+
+用法:
+    python3 tts_calibrate.py                       # 测量英文和中文
+    python3 tts_calibrate.py --language cn --words 10
+    python3 tts_calibrate.py --show                # 只显示缓存的选择
+"""
+
+import hashlib
+import importlib.metadata
+import json
+import multiprocessing
+import os
+import platform
+import random
+import time
+from collections import namedtuple
+
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session, peak_rss_bytes
+from tts_backends import BACKEND_CANDIDATES, backend_available, create_backend, onnx_model_path
+
+DEFAULT_CALIBRATION_PATH = os.path.join('.cache', 'tts_calibration.json')
+DEFAULT_SAMPLE_WORDS = 20
+DEFAULT_TIMEOUT = 1800
+# 指纹中包含版本号的软件包，任何一个升级都会重新测量
+FINGERPRINT_PACKAGES = ('TTS', 'torch', 'onnxruntime', 'numpy')
+# 已经测量过但没有合格后端(或没有可用后端)：调用方使用自己的默认后端。
+# 与表示"没有缓存"的None区分；它是假值，`calibrated_backend(language) or 默认后端` 的写法不需要改
+USE_DEFAULT = ''
+
+# 质量门槛：单条音频的响度、削波比例和每个字符的时长范围，以及允许不合格的比例
+QualityGate = namedtuple('QualityGate', 'min_rms max_clipping min_seconds_per_char max_seconds_per_char max_failure_ratio')
+DEFAULT_GATE = QualityGate(min_rms=0.01, max_clipping=0.001, min_seconds_per_char=0.03,
+                           max_seconds_per_char=1.5, max_failure_ratio=0.1)
+
+
+def machine_fingerprint():
+    """描述本机硬件和TTS相关软件版本的字典及其哈希；导出的ONNX模型变化也会改变指纹"""
+    packages = {}
+    for name in FINGERPRINT_PACKAGES:
+        try:
+            packages[name] = importlib.metadata.version(name)
+        except importlib.metadata.PackageNotFoundError:
+            packages[name] = None
+
+    models = {}
+    for name in sorted({name for names in BACKEND_CANDIDATES.values() for name in names}):
+        if name.startswith('vits-onnx') and backend_available(name):
+            stat = os.stat(onnx_model_path(name))
+            models[name] = [stat.st_size, int(stat.st_mtime)]
+
+    machine = {
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'packages': packages,
+        'onnx_models': models,
+    }
+    digest = hashlib.sha256(json.dumps(machine, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return machine, digest
+
+
+def sample_deck_words(deck_path, language, count, seed=0):
+    """从卡组中抽取固定的一批单词，同一卡组每次测量使用相同的样本"""
+    from deck_model import load_deck
+
+    words = sorted({getattr(card.word, language) for _, card in load_deck(deck_path).cards()} - {None, ''})
+    return random.Random(seed).sample(words, min(count, len(words)))
+
+
+def audio_quality(samples, sample_rate, text):
+    """单条音频的响度(RMS)、峰值、削波比例和每个字符的时长"""
+    import numpy as np
+
+    x = np.asarray(samples, dtype=np.float32)
+    seconds = len(x) / sample_rate
+    chars = max(len(text.replace(' ', '')), 1)
+    return {
+        'seconds': seconds,
+        'rms': float(np.sqrt(np.mean(x * x))) if len(x) else 0.0,
+        'peak': float(np.max(np.abs(x))) if len(x) else 0.0,
+        'clipping': float(np.mean(np.abs(x) >= 0.999)) if len(x) else 0.0,
+        'seconds_per_char': seconds / chars,
+    }
+
+
+def quality_problems(quality, gate):
+    """返回单条音频不满足门槛的原因列表"""
+    problems = []
+    if quality['rms'] < gate.min_rms:
+        problems.append(f"音量过低 (RMS {quality['rms']:.4f})")
+    if quality['clipping'] > gate.max_clipping:
+        problems.append(f"削波 {quality['clipping']:.2%}")
+    if quality['seconds_per_char'] < gate.min_seconds_per_char:
+        problems.append(f"过短 ({quality['seconds']:.2f}s)")
+    if quality['seconds_per_char'] > gate.max_seconds_per_char:
+        problems.append(f"过长 ({quality['seconds']:.2f}s)")
+    return problems
+
+
+def _measure_backend(name, language, words, conn):
+    """子进程：加载后端，预热一次后逐个合成样本单词，把测量结果发回父进程"""
+    try:
+        backend = create_backend(name, language)
+        start = time.perf_counter()
+        backend.load()
+        load_seconds = time.perf_counter() - start
+        backend.synthesize(words[0])  # 预热，不计时
+
+        samples = []
+        for word in words:
+            start = time.perf_counter()
+            audio, sample_rate = backend.synthesize(word)
+            elapsed = time.perf_counter() - start
+            samples.append(dict(audio_quality(audio, sample_rate, word), text=word, synthesis_seconds=elapsed))
+        conn.send({'load_seconds': load_seconds, 'samples': samples, 'peak_rss_bytes': peak_rss_bytes('self')})
+    except Exception as e:
+        conn.send({'error': f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+
+def measure_backend(name, language, words, timeout=DEFAULT_TIMEOUT):
+    """在新的spawn子进程中测量一个后端，返回原始测量结果；超时或进程异常退出时返回error"""
+    context = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = context.Pipe(duplex=False)
+    process = context.Process(target=_measure_backend, args=(name, language, words, child_conn),
+                              name=f"tts-calibrate-{name}", daemon=True)
+    process.start()
+    child_conn.close()
+    try:
+        if parent_conn.poll(timeout):
+            return parent_conn.recv()
+        return {'error': f"超过 {timeout} 秒未完成"}
+    except EOFError:
+        process.join(timeout=10)
+        return {'error': f"测量进程异常退出 (exit code {process.exitcode})"}
+    finally:
+        process.join(timeout=10)
+        if process.is_alive():
+            process.terminate()
+        parent_conn.close()
+
+
+def summarize(measurement, gate):
+    """把原始测量结果汇总为 RTF、内存和质量结论"""
+    if 'error' in measurement:
+        return {'passed': False, 'error': measurement['error']}
+
+    samples = measurement['samples']
+    synthesis_seconds = sum(s['synthesis_seconds'] for s in samples)
+    audio_seconds = sum(s['seconds'] for s in samples)
+    failures = {}
+    for sample in samples:
+        problems = quality_problems(sample, gate)
+        if problems:
+            failures[sample['text']] = problems
+    failure_ratio = len(failures) / len(samples)
+    return {
+        'passed': failure_ratio <= gate.max_failure_ratio,
+        'rtf': synthesis_seconds / max(audio_seconds, 1e-9),
+        'load_seconds': measurement['load_seconds'],
+        'peak_rss_bytes': measurement['peak_rss_bytes'],
+        'mean_rms': sum(s['rms'] for s in samples) / len(samples),
+        'failure_ratio': failure_ratio,
+        'failures': failures,
+    }
+
+
+def calibrate_language(language, words, gate=DEFAULT_GATE, timeout=DEFAULT_TIMEOUT):
+    """测量一种语言的全部可用后端，返回 (选中的后端名称或None, {后端: 汇总结果})"""
+    metrics = get_metrics()
+    results = {}
+    for name in BACKEND_CANDIDATES[language]:
+        if not backend_available(name):
+            continue
+        print(f"正在测量 {language}/{name} ({len(words)} 个单词)...")
+        with metrics.stage(f"calibrate_{language}_{name}", items=len(words)):
+            results[name] = summarize(measure_backend(name, language, words, timeout), gate)
+
+    passed = [name for name, result in results.items() if result['passed']]
+    chosen = min(passed, key=lambda name: results[name]['rtf']) if passed else None
+    return chosen, results
+
+
+def load_calibration(path=DEFAULT_CALIBRATION_PATH):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_calibration(calibration, path=DEFAULT_CALIBRATION_PATH):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(calibration, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def cached_backend(language, path=DEFAULT_CALIBRATION_PATH):
+    """
+    缓存中本机当前指纹下为该语言选出的后端；测量过但没有合格后端时返回USE_DEFAULT，
+    没有缓存、指纹已变化或选中的后端已不可用时返回None
+    """
+    calibration = load_calibration(path)
+    _, digest = machine_fingerprint()
+    if calibration.get('fingerprint') != digest:
+        return None
+    entry = calibration.get('languages', {}).get(language)
+    if entry is None:
+        return None
+    chosen = entry.get('backend')
+    if not chosen:
+        return USE_DEFAULT
+    return chosen if backend_available(chosen) else None
+
+
+def calibrate(languages, deck_path='categories.json', words=DEFAULT_SAMPLE_WORDS, gate=DEFAULT_GATE,
+              timeout=DEFAULT_TIMEOUT, path=DEFAULT_CALIBRATION_PATH):
+    """测量并缓存各语言的选择，返回 {语言: 选中的后端名称或None}"""
+    machine, digest = machine_fingerprint()
+    calibration = load_calibration(path)
+    if calibration.get('fingerprint') != digest:
+        calibration = {'fingerprint': digest, 'machine': machine, 'languages': {}}
+
+    choices = {}
+    for language in languages:
+        sample = sample_deck_words(deck_path, language, words)
+        chosen, results = calibrate_language(language, sample, gate, timeout)
+        print_results(language, chosen, results)
+        calibration['languages'][language] = {
+            'backend': chosen,
+            'calibrated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'gate': gate._asdict(),
+            'words': sample,
+            'results': results,
+        }
+        choices[language] = chosen
+    save_calibration(calibration, path)
+    return choices
+
+
+def calibrated_backend(language, recalibrate=False, deck_path='categories.json', path=DEFAULT_CALIBRATION_PATH):
+    """
+    供生成脚本的 --engine auto 使用：返回本机上该语言最快的合格后端名称，
+    没有缓存时先测量一次；没有任何可用或合格的后端时返回USE_DEFAULT
+    """
+    if not any(backend_available(name) for name in BACKEND_CANDIDATES[language]):
+        return USE_DEFAULT
+    chosen = None if recalibrate else cached_backend(language, path)
+    if chosen is None:
+        print("没有本机的TTS后端测量结果，先测量各后端的速度和输出质量...")
+        chosen = calibrate([language], deck_path, path=path)[language] or USE_DEFAULT
+    print(f"自动选择的TTS后端: {chosen or '无合格后端，使用默认后端'}")
+    return chosen
+
+
+def print_results(language, chosen, results):
+    print(f"\n[{language}] {'后端':<16}{'加载(s)':>9}{'RTF':>8}{'峰值内存(MB)':>14}{'不合格':>8}  结论")
+    for name, result in results.items():
+        if 'error' in result:
+            print(f"     {name:<16}{'-':>9}{'-':>8}{'-':>14}{'-':>8}  ✗ {result['error']}")
+            continue
+        verdict = '✓ 选中' if name == chosen else ('✓' if result['passed'] else '✗ 未通过质量门槛')
+        print(f"     {name:<16}{result['load_seconds']:>9.1f}{result['rtf']:>8.3f}"
+              f"{result['peak_rss_bytes'] / 2**20:>14.0f}{result['failure_ratio']:>8.0%}  {verdict}")
+        for text, problems in list(result['failures'].items())[:3]:
+            print(f"         {text}: {', '.join(problems)}")
+    if not results:
+        print("     没有可用的后端 (需要安装TTS，ONNX后端还需要onnxruntime和vits_onnx.py导出的模型)")
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='测量各TTS后端在本机上的速度和输出质量，为每种语言选择最快的合格后端')
+    parser.add_argument('--language', choices=['en', 'cn', 'all'], default='all', help='测量的语言 (默认: all)')
+    parser.add_argument('--deck', type=str, default='categories.json', help='抽取样本单词的卡组文件')
+    parser.add_argument('--words', type=int, default=DEFAULT_SAMPLE_WORDS,
+                        help=f'每个后端合成的样本单词数 (默认: {DEFAULT_SAMPLE_WORDS})')
+    parser.add_argument('--cache', type=str, default=DEFAULT_CALIBRATION_PATH,
+                        help=f'测量结果缓存文件 (默认: {DEFAULT_CALIBRATION_PATH})')
+    parser.add_argument('--timeout', type=int, default=DEFAULT_TIMEOUT,
+                        help=f'单个后端的测量时间上限，秒 (默认: {DEFAULT_TIMEOUT})')
+    parser.add_argument('--min-rms', type=float, default=DEFAULT_GATE.min_rms,
+                        help=f'最低RMS音量 (默认: {DEFAULT_GATE.min_rms})')
+    parser.add_argument('--max-clipping', type=float, default=DEFAULT_GATE.max_clipping,
+                        help=f'最大削波采样比例 (默认: {DEFAULT_GATE.max_clipping})')
+    parser.add_argument('--min-seconds-per-char', type=float, default=DEFAULT_GATE.min_seconds_per_char,
+                        help=f'每个字符的最短时长，秒 (默认: {DEFAULT_GATE.min_seconds_per_char})')
+    parser.add_argument('--max-seconds-per-char', type=float, default=DEFAULT_GATE.max_seconds_per_char,
+                        help=f'每个字符的最长时长，秒 (默认: {DEFAULT_GATE.max_seconds_per_char})')
+    parser.add_argument('--max-failure-ratio', type=float, default=DEFAULT_GATE.max_failure_ratio,
+                        help=f'允许不合格样本的比例 (默认: {DEFAULT_GATE.max_failure_ratio})')
+    parser.add_argument('--show', action='store_true', help='只显示缓存的测量结果')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    languages = list(BACKEND_CANDIDATES) if args.language == 'all' else [args.language]
+
+    if args.show:
+        calibration = load_calibration(args.cache)
+        _, digest = machine_fingerprint()
+        if not calibration:
+            print(f"没有测量结果: {args.cache}")
+            return
+        if calibration.get('fingerprint') != digest:
+            print("注意: 缓存的测量结果来自不同的机器或软件版本，生成脚本不会使用")
+        for language in languages:
+            entry = calibration.get('languages', {}).get(language)
+            if entry:
+                print(f"\n测量时间: {entry['calibrated_at']}")
+                print_results(language, entry['backend'], entry['results'])
+        return
+
+    gate = QualityGate(args.min_rms, args.max_clipping, args.min_seconds_per_char,
+                       args.max_seconds_per_char, args.max_failure_ratio)
+    with metrics_session('tts_calibrate', args.metrics, args.profile):
+        choices = calibrate(languages, args.deck, args.words, gate, args.timeout, args.cache)
+
+    print(f"\n测量结果已保存到: {args.cache}")
+    for language, chosen in choices.items():
+        print(f"  {language}: {chosen or '无合格后端'}")
+
+
+if __name__ == "__main__":
+    main()
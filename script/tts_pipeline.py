@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+TTS生产者/消费者流水线
+合成线程只负责调用模型，把原始采样放入有界队列；
+写入线程池负责编码WAV、原子写入、读取文件信息和输出日志，
+模型不必等待磁盘I/O，内存占用上限为 队列深度 × 单条音频大小
+"""
+
+import io
+import os
+import queue
+import threading
+import time
+import wave
+from collections import namedtuple
+
+from pipeline_metrics import get_metrics
+
+DEFAULT_QUEUE_DEPTH = 8
+DEFAULT_WRITERS = 2
+# 使用tts_server.py时并发发出的请求数，服务端会把它们聚成一批
+DEFAULT_REMOTE_WORKERS = 4
+
+SynthesisJob = namedtuple('SynthesisJob', ['text', 'output_path', 'speaker', 'language'])
+SynthesisJob.__new__.__defaults__ = (None, None)
+
+_DONE = object()
+
+
+def encode_pcm16(samples):
+    """float采样 [-1, 1] 转为16位小端PCM字节"""
+    # numpy随TTS一起安装；只用tts命令的环境不需要它
+    import numpy as np
+
+    pcm = np.clip(np.asarray(samples, dtype=np.float32), -1.0, 1.0)
+    return np.rint(pcm * 32767).astype('<i2').tobytes()
+
+
+def wav_bytes(pcm, sample_rate, channels=1):
+    """16位PCM数据封装为内存中的WAV文件"""
+    buffer = io.BytesIO()
+    with wave.open(buffer, 'wb') as f:
+        f.setnchannels(channels)
+        f.setsampwidth(2)
+        f.setframerate(sample_rate)
+        f.writeframes(pcm)
+    return buffer.getvalue()
+
+
+def write_wav_atomic(path, pcm, sample_rate, channels=1):
+    """先写临时文件再替换，中断时不会留下半个WAV文件；临时文件名唯一，多个写入线程/进程写同一路径时互不干扰"""
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.{os.urandom(4).hex()}.tmp"
+    try:
+        with wave.open(tmp_path, 'wb') as f:
+            f.setnchannels(channels)
+            f.setsampwidth(2)
+            f.setframerate(sample_rate)
+            f.writeframes(pcm)
+        os.replace(tmp_path, path)
+    except BaseException:
+        # 磁盘已满、编码出错或被中断时删除临时文件，唯一的文件名不会被下一次写入覆盖，否则会一直留在语音目录里
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class TTSPipeline:
+    """
+    synthesis_workers个合成线程(各自持有backend_factory()创建的模型实例)
+    + writers个写入线程，中间是深度为queue_depth的有界队列
+    """
+
+    def __init__(self, backend_factory, synthesis_workers=1, writers=DEFAULT_WRITERS,
+                 queue_depth=DEFAULT_QUEUE_DEPTH, log=print):
+        self.backend_factory = backend_factory
+        self.synthesis_workers = synthesis_workers
+        self.writers = writers
+        self.queue_depth = queue_depth
+        self.log = log
+
+    def run(self, jobs):
+        """
+        执行全部任务，返回与jobs顺序一致的结果列表：
+        {'output_path', 'ok', 'size', 'duration_ms', 'error'}
+        """
+        metrics = get_metrics()
+        jobs = list(jobs)
+        results = [None] * len(jobs)
+        buffers = queue.Queue(maxsize=self.queue_depth)
+        pending = iter(enumerate(jobs))
+        pending_lock = threading.Lock()
+        busy = []
+        load_errors = []
+
+        def next_job():
+            with pending_lock:
+                return next(pending, None)
+
+        def synthesize():
+            try:
+                backend = self.backend_factory()
+            except Exception as e:
+                # 剩余任务由其他合成线程处理；全部线程都失败时在run()末尾标记
+                load_errors.append(str(e))
+                return
+
+            busy_time = 0.0
+            while (item := next_job()) is not None:
+                index, job = item
+                start = time.perf_counter()
+                try:
+                    samples, sample_rate = backend.synthesize(job.text, job.speaker, job.language)
+                    error = None
+                except Exception as e:
+                    samples, sample_rate, error = None, 0, str(e)
+                elapsed = time.perf_counter() - start
+                busy_time += elapsed
+                metrics.observe('synthesis', elapsed)
+
+                # 队列满时在这里阻塞，等待时间即模型空闲时间
+                start = time.perf_counter()
+                buffers.put((index, job, samples, sample_rate, error))
+                metrics.observe('queue_wait', time.perf_counter() - start)
+            busy.append(busy_time)
+
+        def write():
+            while (item := buffers.get()) is not _DONE:
+                index, job, samples, sample_rate, error = item
+                result = {'output_path': job.output_path, 'ok': False, 'size': 0, 'duration_ms': 0, 'error': error}
+                if error is None:
+                    try:
+                        with metrics.timed('write'):
+                            pcm = encode_pcm16(samples)
+                            write_wav_atomic(job.output_path, pcm, sample_rate)
+                        result.update(ok=True, size=os.path.getsize(job.output_path),
+                                      duration_ms=round(len(pcm) // 2 * 1000 / sample_rate))
+                    except Exception as e:
+                        result['error'] = str(e)
+
+                results[index] = result
+                if result['ok']:
+                    metrics.add_items('synthesis')
+                    self.log(f"✓ [{index + 1}/{len(jobs)}] {job.text} -> {job.output_path} "
+                             f"({result['size']:,} bytes, {result['duration_ms'] / 1000:.2f}秒)")
+                else:
+                    metrics.incr('synthesis_failed')
+                    self.log(f"✗ [{index + 1}/{len(jobs)}] {job.text}: {result['error']}")
+
+        start = time.perf_counter()
+        writer_threads = [threading.Thread(target=write, name=f"tts-writer-{i}", daemon=True)
+                          for i in range(self.writers)]
+        synthesis_threads = [threading.Thread(target=synthesize, name=f"tts-synthesis-{i}", daemon=True)
+                             for i in range(self.synthesis_workers)]
+        for thread in writer_threads + synthesis_threads:
+            thread.start()
+        for thread in synthesis_threads:
+            thread.join()
+        for _ in writer_threads:
+            buffers.put(_DONE)
+        for thread in writer_threads:
+            thread.join()
+
+        wall = time.perf_counter() - start
+        for index, job in enumerate(jobs):
+            if results[index] is None:
+                results[index] = {'output_path': job.output_path, 'ok': False, 'size': 0, 'duration_ms': 0,
+                                  'error': f"模型加载失败: {'; '.join(load_errors)}"}
+                metrics.incr('synthesis_failed')
+        if busy and wall > 0:
+            utilization = sum(busy) / (wall * len(busy))
+            self.log(f"模型利用率: {utilization:.1%} (墙钟 {wall:.1f}秒)")
+        return results
+
+
+def run_tts_jobs(backend_factory, jobs, synthesis_workers=1, writers=DEFAULT_WRITERS,
+                 queue_depth=DEFAULT_QUEUE_DEPTH):
+    """执行任务并返回 (成功数, 失败的结果列表)"""
+    results = TTSPipeline(backend_factory, synthesis_workers, writers, queue_depth).run(jobs)
+    failed = [result for result in results if not result['ok']]
+    return len(results) - len(failed), failed
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+本地TTS合成服务
+常驻进程加载一次VITS/XTTS模型，通过HTTP提供 synthesize(text, speaker, language)：
+- 结果按 (模型, 说话人, 语言, 文本) 的sha256存入磁盘缓存，重复请求直接返回，内存中另有小型LRU
+- 同时到达的相同请求合并为一次合成(coalescing)
+- 短时间内到达的请求聚成一批(micro-batching)交给模型线程，
+  后端实现了synthesize_batch()时一次推理处理整批
+
+接口:
+    POST /synthesize   {"text": ..., "speaker": ..., "language": ...} -> audio/wav
+    GET  /synthesize?text=...&speaker=...&language=...                -> audio/wav (便于浏览器试听)
+    GET  /health                                                       -> 统计信息JSON
+"""
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+from tts_backends import vits_backend, xtts_backend
+from tts_pipeline import encode_pcm16, wav_bytes
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 5002
+DEFAULT_CACHE_DIR = os.path.join('.cache', 'tts_server')
+DEFAULT_BATCH_WINDOW = 0.02
+DEFAULT_MAX_BATCH = 8
+MEMORY_CACHE_ITEMS = 256
+
+BACKENDS = {
+    'vits': (lambda: vits_backend('p273')),
+    'xtts': (lambda: xtts_backend('1', 'zh-cn')),
+}
+
+
+def audio_cache_key(model, speaker, language, text):
+    """缓存键：(模型, 说话人, 语言, 文本) 的sha256，distributed_tts.py写入的存储使用同一个键"""
+    identity = '\0'.join([model, speaker or '', language or '', text])
+    return hashlib.sha256(identity.encode('utf-8')).hexdigest()
+
+
+class AudioCache:
+    """内容寻址的WAV缓存：磁盘上 <目录>/<键前两位>/<键>.wav，内存中保留最近使用的若干条"""
+
+    def __init__(self, cache_dir, memory_items=MEMORY_CACHE_ITEMS):
+        self.cache_dir = cache_dir
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], f"{key}.wav")
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        self._remember(key, data)
+        return data
+
+    def has(self, key):
+        return key in self._memory or os.path.exists(self._path(key))
+
+    def put(self, key, data):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 目录可能是多台机器共享的挂载，临时文件名不能只靠线程号区分
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.{os.urandom(4).hex()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        self._remember(key, data)
+
+    def _remember(self, key, data):
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+
+class SynthesisService:
+    """持有一个模型实例的合成服务，线程安全"""
+
+    def __init__(self, backend, cache_dir=DEFAULT_CACHE_DIR, batch_window=DEFAULT_BATCH_WINDOW,
+                 max_batch=DEFAULT_MAX_BATCH):
+        self.backend = backend
+        self.cache = AudioCache(cache_dir)
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._requests = queue.Queue()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._stats = {'requests': 0, 'cache_hits': 0, 'coalesced': 0, 'synthesized': 0, 'batches': 0, 'errors': 0}
+        self._worker = threading.Thread(target=self._run, name='tts-model', daemon=True)
+        self._worker.start()
+
+    def cache_key(self, text, speaker, language):
+        return audio_cache_key(self.backend.name, speaker, language, text)
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats, inflight=len(self._inflight), queued=self._requests.qsize())
+
+    def _count(self, name, value=1):
+        with self._lock:
+            self._stats[name] += value
+
+    def synthesize(self, text, speaker=None, language=None):
+        """返回 (WAV字节, 来源)，来源为 hit / coalesced / miss"""
+        metrics = get_metrics()
+        # 未指定时使用后端的默认值，显式传入默认说话人的请求也能命中同一条缓存
+        speaker = speaker or getattr(self.backend, 'speaker', None)
+        language = language or getattr(self.backend, 'language', None)
+        key = self.cache_key(text, speaker, language)
+        self._count('requests')
+
+        data = self.cache.get(key)
+        metrics.cache_result('tts_audio', data is not None)
+        if data is not None:
+            self._count('cache_hits')
+            return data, 'hit'
+
+        with self._lock:
+            future = self._inflight.get(key)
+            source = 'coalesced' if future is not None else 'miss'
+            if future is None:
+                # 上面的查询和加锁之间，同一文本的合成可能刚好完成：结果先写入缓存再移出_inflight，
+                # 持锁再查一次缓存就不会重复合成
+                data = self.cache.get(key)
+                if data is not None:
+                    self._stats['cache_hits'] += 1
+                    return data, 'hit'
+                future = self._inflight[key] = Future()
+                self._requests.put((key, text, speaker, language, future))
+            else:
+                self._stats['coalesced'] += 1
+        return future.result(), source
+
+    def _next_batch(self):
+        """阻塞等待第一个请求，然后在batch_window内继续收集，最多max_batch个"""
+        batch = [self._requests.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _synthesize_batch(self, batch):
+        """后端支持批量推理时整批合成，否则在已加载的模型上依次合成"""
+        requests = [(text, speaker, language) for _, text, speaker, language, _ in batch]
+        if hasattr(self.backend, 'synthesize_batch'):
+            try:
+                return list(self.backend.synthesize_batch(requests))
+            except Exception as e:
+                return [e] * len(batch)
+
+        results = []
+        for text, speaker, language in requests:
+            try:
+                results.append(self.backend.synthesize(text, speaker, language))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    def _run(self):
+        metrics = get_metrics()
+        while True:
+            batch = self._next_batch()
+            self._count('batches')
+            metrics.incr('tts_batched_requests', len(batch))
+
+            with metrics.timed('tts_batch'):
+                results = self._synthesize_batch(batch)
+
+            for (key, _, _, _, future), result in zip(batch, results):
+                try:
+                    if isinstance(result, Exception):
+                        raise result
+                    samples, sample_rate = result
+                    data = wav_bytes(encode_pcm16(samples), sample_rate)
+                    self.cache.put(key, data)
+                    self._count('synthesized')
+                    future.set_result(data)
+                except Exception as e:
+                    self._count('errors')
+                    future.set_exception(e)
+                finally:
+                    with self._lock:
+                        self._inflight.pop(key, None)
+
+
+class TTSRequestHandler(BaseHTTPRequestHandler):
+    """HTTP接口，service在创建服务器时注入"""
+    service = None
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, payload):
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode('utf-8'), 'application/json; charset=utf-8')
+
+    def _synthesize(self, params):
+        text = params.get('text')
+        if not isinstance(text, str) or not text.strip():
+            self._send_json(400, {'error': 'text应为非空字符串'})
+            return
+        text = text.strip()
+        for name in ('speaker', 'language'):
+            if not isinstance(params.get(name), (str, type(None))):
+                self._send_json(400, {'error': f"{name}应为字符串"})
+                return
+        start = time.perf_counter()
+        try:
+            data, source = self.service.synthesize(text, params.get('speaker'), params.get('language'))
+        except Exception as e:
+            self._send_json(500, {'error': str(e)})
+            return
+        elapsed = time.perf_counter() - start
+        get_metrics().observe(f"tts_request_{source}", elapsed)
+        self._send(200, data, 'audio/wav', {
+            'X-Cache': source,
+            'Server-Timing': f"synthesize;dur={elapsed * 1000:.1f}",
+        })
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == '/health':
+            self._send_json(200, {'backend': self.service.backend.name, **self.service.stats()})
+        elif url.path == '/synthesize':
+            self._synthesize({name: values[0] for name, values in parse_qs(url.query).items()})
+        else:
+            self._send_json(404, {'error': '未知路径'})
+
+    def do_POST(self):
+        if urlparse(self.path).path != '/synthesize':
+            self._send_json(404, {'error': '未知路径'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            params = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': '请求体不是有效的JSON'})
+            return
+        if not isinstance(params, dict):
+            self._send_json(400, {'error': '请求体应为JSON对象'})
+            return
+        self._synthesize(params)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def create_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """创建绑定到service的HTTP服务器"""
+    handler = type('BoundTTSRequestHandler', (TTSRequestHandler,), {'service': service})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='本地TTS合成服务')
+    parser.add_argument('--model', choices=sorted(BACKENDS), default='vits', help='加载的模型 (默认: vits)')
+    parser.add_argument('--host', type=str, default=DEFAULT_HOST, help=f'监听地址 (默认: {DEFAULT_HOST})')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'监听端口 (默认: {DEFAULT_PORT})')
+    parser.add_argument('--cache-dir', type=str, default=DEFAULT_CACHE_DIR,
+                        help=f'音频缓存目录 (默认: {DEFAULT_CACHE_DIR})')
+    parser.add_argument('--batch-window', type=float, default=DEFAULT_BATCH_WINDOW,
+                        help=f'聚合请求的等待时间，秒 (默认: {DEFAULT_BATCH_WINDOW})')
+    parser.add_argument('--max-batch', type=int, default=DEFAULT_MAX_BATCH,
+                        help=f'每批最多请求数 (默认: {DEFAULT_MAX_BATCH})')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    with metrics_session('tts_server', args.metrics, args.profile):
+        backend = BACKENDS[args.model]()
+        print(f"正在加载模型: {backend.name}")
+        backend.load()
+
+        service = SynthesisService(backend, args.cache_dir, args.batch_window, args.max_batch)
+        server = create_server(service, args.host, args.port)
+        print(f"TTS服务已启动: http://{args.host}:{args.port}")
+        print(f"  试听: http://{args.host}:{args.port}/synthesize?text=hello")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n正在停止服务...")
+        finally:
+            server.server_close()
+            print(f"统计: {service.stats()}")
+
+
+if __name__ == "__main__":
+    main()
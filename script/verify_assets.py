@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+资源完整性校验
+并行检查categories.json引用的每个图片和语音文件：是否存在、大小、PNG/WAV文件头是否有效，
+并计算sha256，写出带校验和的资源清单asset_manifest.json；
+有缺失或损坏的文件时以退出码1结束，CI可据此阻止发布
+"""
+
+import hashlib
+import io
+import json
+import os
+import struct
+import sys
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from deck_model import DeckValidationError, load_deck
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+from wav_info import VOICE_ROOT, WavFormatError, parse_wav_header
+
+IMAGE_ROOT = os.path.join('resource', 'all')
+MANIFEST_PATH = 'asset_manifest.json'
+MANIFEST_VERSION = 1
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+AssetCheck = namedtuple('AssetCheck', ['kind', 'path', 'size', 'sha256', 'meta', 'error'])
+
+
+def png_dimensions(data, path=''):
+    """校验PNG签名和IHDR块，返回 (宽, 高)"""
+    if len(data) < 24 or data[:8] != PNG_SIGNATURE or data[12:16] != b'IHDR':
+        raise ValueError(f"不是有效的PNG文件: {path}")
+    width, height = struct.unpack('>II', data[16:24])
+    if width == 0 or height == 0:
+        raise ValueError(f"PNG尺寸为0: {path}")
+    return width, height
+
+
+def check_asset(kind, path):
+    """读取文件一次，同时完成文件头校验和sha256计算"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return AssetCheck(kind, path, 0, None, None, "文件不存在")
+    except OSError as e:
+        return AssetCheck(kind, path, 0, None, None, str(e))
+
+    if not data:
+        return AssetCheck(kind, path, 0, None, None, "文件为空")
+
+    try:
+        if kind == 'image':
+            width, height = png_dimensions(data, path)
+            meta = {'width': width, 'height': height}
+        else:
+            info = parse_wav_header(io.BytesIO(data), len(data), path)
+            if info.data_size == 0:
+                raise WavFormatError(f"没有音频数据: {path}")
+            meta = {'duration_ms': info.duration_ms, 'sample_rate': info.sample_rate}
+    except (ValueError, struct.error) as e:
+        return AssetCheck(kind, path, len(data), None, None, str(e))
+
+    # hashlib在计算大块数据时会释放GIL，多个线程可以并行计算
+    return AssetCheck(kind, path, len(data), hashlib.sha256(data).hexdigest(), meta, None)
+
+
+def collect_assets(deck, image_root=IMAGE_ROOT, voice_root=VOICE_ROOT):
+    """
+    列出卡组引用的全部资源，返回 {路径: (类型, [引用的卡片id, ...])}
+    多张卡片可能共用同一个语音文件，同一路径只检查一次
+    """
+    assets = {}
+    for _, card in deck.cards():
+        references = [('image', os.path.join(image_root, card.filename))]
+        for language in ('en', 'cn'):
+            references.append((f"voice_{language}", os.path.join(voice_root, language, card.voice.get(language))))
+        for key, language, filename in card.voice.variants():
+            references.append((f"voice_{key}", os.path.join(voice_root, language, filename)))
+        for kind, path in references:
+            assets.setdefault(path, (kind, []))[1].append(card.id)
+    return assets
+
+
+def verify_assets(deck, image_root=IMAGE_ROOT, voice_root=VOICE_ROOT, workers=None):
+    """并行检查全部资源，返回 (按路径排序的检查结果, {路径: 引用的卡片id列表})"""
+    metrics = get_metrics()
+    assets = collect_assets(deck, image_root, voice_root)
+    paths = sorted(assets)
+
+    with metrics.stage('verify', items=len(paths)):
+        with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4)) as executor:
+            results = list(executor.map(lambda path: check_asset(assets[path][0], path), paths))
+
+    problems = [result for result in results if result.error]
+    metrics.incr('asset_problems', len(problems))
+    metrics.incr('asset_bytes', sum(result.size for result in results))
+    return results, {path: cards for path, (_, cards) in assets.items()}
+
+
+def build_manifest(results, deck_path, root='.'):
+    """资源清单：路径相对于root，键有序，相同输入产生相同的文件"""
+    with open(deck_path, 'rb') as f:
+        deck_sha256 = hashlib.sha256(f.read()).hexdigest()
+
+    assets = {}
+    for result in results:
+        if result.error:
+            continue
+        entry = {'kind': result.kind, 'size': result.size, 'sha256': result.sha256}
+        entry.update(result.meta)
+        assets[os.path.relpath(result.path, root).replace(os.sep, '/')] = entry
+
+    return {
+        'version': MANIFEST_VERSION,
+        'deck': {'path': os.path.basename(deck_path), 'sha256': deck_sha256},
+        'total_assets': len(assets),
+        'total_bytes': sum(entry['size'] for entry in assets.values()),
+        'assets': dict(sorted(assets.items())),
+    }
+
+
+def write_manifest(manifest, path):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='校验卡组引用的图片和语音文件')
+    parser.add_argument('--deck', type=str, default='categories.json', help='卡组文件 (默认: categories.json)')
+    parser.add_argument('--image-root', type=str, default=IMAGE_ROOT, help=f'图片目录 (默认: {IMAGE_ROOT})')
+    parser.add_argument('--voice-root', type=str, default=VOICE_ROOT, help=f'语音根目录 (默认: {VOICE_ROOT})')
+    parser.add_argument('--manifest', type=str, default=MANIFEST_PATH,
+                        help=f'资源清单输出路径 (默认: {MANIFEST_PATH})')
+    parser.add_argument('--no-manifest', action='store_true', help='只校验，不写资源清单')
+    parser.add_argument('--workers', type=int, help='并行线程数')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    print("资源完整性校验")
+    print("=" * 50)
+
+    with metrics_session('verify_assets', args.metrics, args.profile):
+        try:
+            deck = load_deck(args.deck)
+        except DeckValidationError as e:
+            print(f"✗ {args.deck} 结构不合法:")
+            for error in e.errors[:20]:
+                print(f"  - {error}")
+            sys.exit(1)
+
+        results, references = verify_assets(deck, args.image_root, args.voice_root, args.workers)
+        problems = [result for result in results if result.error]
+
+        if not args.no_manifest:
+            manifest = build_manifest(results, args.deck)
+            write_manifest(manifest, args.manifest)
+            print(f"资源清单已保存到: {args.manifest} ({manifest['total_assets']} 个文件, "
+                  f"{manifest['total_bytes'] / 1024 / 1024:.1f} MB)")
+
+    print(f"检查了 {len(results)} 个文件 ({deck.card_count} 张卡片)")
+    if not problems:
+        print("✓ 所有资源完整")
+        return
+
+    print(f"✗ {len(problems)} 个文件缺失或损坏:")
+    for result in problems[:50]:
+        cards = references[result.path]
+        suffix = f" (另有 {len(cards) - 1} 张卡片引用)" if len(cards) > 1 else ""
+        print(f"  - [{result.kind}] {result.path}: {result.error} <- {cards[0]}{suffix}")
+    if len(problems) > 50:
+        print(f"  ... 还有 {len(problems) - 50} 个")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
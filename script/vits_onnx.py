@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+VITS的ONNX Runtime推理后端
+把tts_models/en/vctk/vits的生成器导出为ONNX，可选动态int8量化，在没有GPU的构建机上用ONNX Runtime推理；
+文本前端(清洗+音素化)仍使用Coqui的TTSTokenizer，并接入音素缓存
+
+另外提供对比工具：在同一批单词上比较PyTorch与ONNX(fp32/int8)的实时率(RTF)和输出音频的差异
+
+用法:
+    python3 vits_onnx.py --export                 # 导出 models/vits_vctk.onnx
+    python3 vits_onnx.py --export --quantize      # 同时导出 models/vits_vctk.int8.onnx
+    python3 vits_onnx.py --compare --words 50     # 对比各后端
+"""
+
+import json
+import os
+import random
+import time
+
+from phoneme_cache import DEFAULT_CACHE_PATH as DEFAULT_PHONEME_CACHE, PhonemeCache
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+from tts_backends import VITS_MODEL, CoquiBackend, vits_backend
+
+DEFAULT_MODEL_PATH = os.path.join('models', 'vits_vctk.onnx')
+
+
+def quantized_path(model_path):
+    base, ext = os.path.splitext(model_path)
+    return f"{base}.int8{ext}"
+
+
+def sidecar_path(model_path):
+    """记录采样率、说话人编号和推理参数的附属文件"""
+    return f"{os.path.splitext(model_path)[0]}.json"
+
+
+def export_vits_onnx(model_path=DEFAULT_MODEL_PATH, quantize=False):
+    """导出ONNX模型(及可选的int8量化版本)，返回导出的文件列表"""
+    metrics = get_metrics()
+    os.makedirs(os.path.dirname(model_path) or '.', exist_ok=True)
+
+    with metrics.stage('load_torch_model', items=1):
+        tts = CoquiBackend(VITS_MODEL).load()
+        model = tts.synthesizer.tts_model
+
+    with metrics.stage('export', items=1):
+        model.export_onnx(output_path=model_path, verbose=False)
+
+    from TTS.utils.manage import ModelManager
+    _, config_path, _ = ModelManager().download_model(VITS_MODEL)
+    sidecar = {
+        'model': VITS_MODEL,
+        'config_path': config_path,
+        'sample_rate': tts.synthesizer.output_sample_rate,
+        'speakers': dict(model.speaker_manager.name_to_id) if model.speaker_manager else {},
+        'scales': [model.inference_noise_scale, model.length_scale, model.inference_noise_scale_dp],
+    }
+    exported = [model_path]
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        with metrics.stage('quantize', items=1):
+            quantize_dynamic(model_path, quantized_path(model_path), weight_type=QuantType.QInt8)
+        exported.append(quantized_path(model_path))
+
+    for path in exported:
+        with open(sidecar_path(path), 'w', encoding='utf-8') as f:
+            json.dump(sidecar, f, ensure_ascii=False, indent=2)
+
+    for path in exported:
+        print(f"✓ 已导出: {path} ({os.path.getsize(path) / 1024 / 1024:.1f} MB)")
+    return exported
+
+
+class OnnxVitsBackend:
+    """
+    ONNX Runtime上的VITS推理，接口与CoquiBackend相同
+    synthesize() 返回 (float采样数组, 采样率)
+    """
+
+    def __init__(self, model_path=DEFAULT_MODEL_PATH, speaker='p273', threads=None,
+                 phoneme_cache_path=DEFAULT_PHONEME_CACHE):
+        self.model_path = model_path
+        self.speaker = speaker
+        self.language = None
+        self.threads = threads
+        self.phoneme_cache_path = phoneme_cache_path
+        self._session = None
+        self._tokenizer = None
+        self._sidecar = None
+
+    @property
+    def name(self):
+        return f"onnx:{os.path.basename(self.model_path)}"
+
+    def load(self):
+        if self._session is None:
+            import onnxruntime as ort
+            from TTS.tts.configs.vits_config import VitsConfig
+            from TTS.tts.utils.text.tokenizer import TTSTokenizer
+
+            with open(sidecar_path(self.model_path), 'r', encoding='utf-8') as f:
+                self._sidecar = json.load(f)
+
+            config = VitsConfig()
+            config.load_json(self._sidecar['config_path'])
+            self._tokenizer, _ = TTSTokenizer.init_from_config(config)
+            if self.phoneme_cache_path:
+                PhonemeCache(self.phoneme_cache_path).install_tokenizer(self._tokenizer)
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if self.threads:
+                options.intra_op_num_threads = self.threads
+            self._session = ort.InferenceSession(self.model_path, options, providers=['CPUExecutionProvider'])
+            self._input_names = {node.name for node in self._session.get_inputs()}
+        return self._session
+
+    @property
+    def sample_rate(self):
+        self.load()
+        return self._sidecar['sample_rate']
+
+    def synthesize(self, text, speaker=None, language=None):
+        import numpy as np
+
+        session = self.load()
+        ids = np.array([self._tokenizer.text_to_ids(text)], dtype=np.int64)
+        inputs = {
+            'input': ids,
+            'input_lengths': np.array([ids.shape[1]], dtype=np.int64),
+            'scales': np.array(self._sidecar['scales'], dtype=np.float32),
+        }
+        if 'sid' in self._input_names:
+            speakers = self._sidecar['speakers']
+            speaker = speaker or self.speaker
+            if speaker not in speakers:
+                raise ValueError(f"模型中没有说话人 {speaker}，可用: {', '.join(sorted(speakers)[:10])} 等{len(speakers)}个")
+            inputs['sid'] = np.array([speakers[speaker]], dtype=np.int64)
+        audio = session.run(['output'], inputs)[0]
+        return audio.reshape(-1), self._sidecar['sample_rate']
+
+
+def spectral_similarity(a, b, frame=1024, hop=256):
+    """两段音频对数幅度谱的余弦相似度；VITS的采样带随机噪声，逐点比较没有意义"""
+    import numpy as np
+
+    def spectrum(x):
+        x = np.asarray(x, dtype=np.float32)
+        if len(x) < frame:
+            x = np.pad(x, (0, frame - len(x)))
+        frames = np.lib.stride_tricks.sliding_window_view(x, frame)[::hop] * np.hanning(frame)
+        return np.log1p(np.abs(np.fft.rfft(frames, axis=1)))
+
+    sa, sb = spectrum(a), spectrum(b)
+    n = min(len(sa), len(sb))
+    va, vb = sa[:n].ravel(), sb[:n].ravel()
+    return float(va @ vb / (np.linalg.norm(va) * np.linalg.norm(vb) + 1e-12))
+
+
+def compare_backends(words, backends, warm_all=False):
+    """
+    backends为 {名称: 后端}，第一个作为参考
+    warm_all: 后端共用音素缓存时为True，计时前先把全部单词合成一遍，
+    否则先运行的后端要承担音素化的开销，后运行的直接命中缓存
+    返回 {名称: {'rtf', 'seconds', 'audio_seconds', 'duration_diff', 'similarity'}}
+    """
+    reference_name = next(iter(backends))
+    outputs = {}
+    report = {}
+    for name, backend in backends.items():
+        backend.load()
+        for word in (words if warm_all else words[:1]):  # 预热，不计时
+            backend.synthesize(word)
+        total = 0.0
+        audio_seconds = 0.0
+        outputs[name] = []
+        for word in words:
+            start = time.perf_counter()
+            samples, sample_rate = backend.synthesize(word)
+            total += time.perf_counter() - start
+            audio_seconds += len(samples) / sample_rate
+            outputs[name].append(samples)
+        report[name] = {'seconds': total, 'audio_seconds': audio_seconds, 'rtf': total / max(audio_seconds, 1e-9)}
+
+    for name in backends:
+        pairs = list(zip(outputs[reference_name], outputs[name]))
+        report[name]['duration_diff'] = sum(abs(len(a) - len(b)) / max(len(a), 1) for a, b in pairs) / len(pairs)
+        report[name]['similarity'] = sum(spectral_similarity(a, b) for a, b in pairs) / len(pairs)
+    return report
+
+
+def sample_words(deck_path, count, seed=0):
+    from deck_model import load_deck
+
+    words = sorted({card.word.en for _, card in load_deck(deck_path).cards()})
+    return random.Random(seed).sample(words, min(count, len(words)))
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='VITS ONNX Runtime后端：导出、量化与对比')
+    parser.add_argument('--export', action='store_true', help='导出ONNX模型')
+    parser.add_argument('--quantize', action='store_true', help='同时导出动态int8量化模型')
+    parser.add_argument('--model', type=str, default=DEFAULT_MODEL_PATH, help=f'ONNX模型路径 (默认: {DEFAULT_MODEL_PATH})')
+    parser.add_argument('--compare', action='store_true', help='对比PyTorch与ONNX后端的速度和输出')
+    parser.add_argument('--deck', type=str, default='categories.json', help='取样单词的卡组文件')
+    parser.add_argument('--words', type=int, default=30, help='对比使用的单词数 (默认: 30)')
+    parser.add_argument('--threads', type=int, help='ONNX Runtime线程数 (默认: 全部核心)')
+    parser.add_argument('--no-phoneme-cache', action='store_true', help='对比时两边都不使用音素缓存')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    if not (args.export or args.compare):
+        parser.print_help()
+        return
+
+    with metrics_session('vits_onnx', args.metrics, args.profile):
+        if args.export:
+            export_vits_onnx(args.model, args.quantize)
+
+        if args.compare:
+            # 两边使用相同的音素缓存设置，RTF差异只来自推理本身
+            phoneme_cache = None if args.no_phoneme_cache else DEFAULT_PHONEME_CACHE
+            backends = {'torch': vits_backend('p273', phoneme_cache_path=phoneme_cache)}
+            for path in (args.model, quantized_path(args.model)):
+                if os.path.exists(path):
+                    backends[os.path.basename(path)] = OnnxVitsBackend(path, threads=args.threads,
+                                                                       phoneme_cache_path=phoneme_cache)
+            words = sample_words(args.deck, args.words)
+            report = compare_backends(words, backends, warm_all=phoneme_cache is not None)
+
+            baseline = report['torch']['rtf']
+            print(f"\n{len(words)} 个单词，参考后端: torch")
+            print(f"{'后端':<24}{'RTF':>8}{'加速':>8}{'时长差异':>10}{'频谱相似度':>12}")
+            for name, entry in report.items():
+                print(f"{name:<24}{entry['rtf']:>8.3f}{baseline / entry['rtf']:>7.1f}x"
+                      f"{entry['duration_diff']:>10.1%}{entry['similarity']:>12.3f}")
+
+
+if __name__ == "__main__":
+    main()
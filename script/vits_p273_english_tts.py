@@ -8,8 +8,14 @@ import subprocess
 import os
 import sys
 import json
+import time
 from pathlib import Path
 
+from deck_model import DeckValidationError, load_deck
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+from tts_backends import ENGINES, RemoteBackend, create_backend, resolve_engine
+from tts_pipeline import DEFAULT_QUEUE_DEPTH, DEFAULT_REMOTE_WORKERS, DEFAULT_WRITERS, SynthesisJob, run_tts_jobs
+
 def check_tts_available():
     """检查tts命令是否可用"""
     try:
@@ -27,28 +33,16 @@ def create_output_directory():
 def parse_categories_json():
     """解析categories.json文件，提取英文单词和对应的文件名"""
     try:
-        with open('categories.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        deck = load_deck('categories.json')
 
         items = []
-        categories = data.get('categories', [])
-
-        for category in categories:
-            category_name = category.get('name', {}).get('en', 'Unknown')
-            images = category.get('images', [])
-
-            for image in images:
-                word_en = image.get('word', {}).get('en', '')
-                voice_filename_en = image.get('voice_filename', {}).get('en', '')
-                filename = image.get('filename', '')
-
-                if word_en and voice_filename_en:
-                    items.append({
-                        'word_en': word_en,
-                        'voice_filename_en': voice_filename_en,
-                        'filename': filename,
-                        'category': category_name
-                    })
+        for category, card in deck.cards():
+            items.append({
+                'word_en': card.word.en,
+                'voice_filename_en': card.voice.en,
+                'filename': card.filename,
+                'category': (category.name or {}).get('en', 'Unknown')
+            })
 
         return items
 
@@ -58,6 +52,9 @@ def parse_categories_json():
     except json.JSONDecodeError as e:
         print(f"错误: categories.json格式错误: {e}")
         return []
+    except DeckValidationError as e:
+        print(f"错误: categories.json结构不合法: {e}")
+        return []
     except Exception as e:
         print(f"错误: 解析categories.json时出错: {e}")
         return []
@@ -74,7 +71,9 @@ def generate_vits_audio(text, output_path, speaker_id="p273"):
 
     try:
         print(f"正在生成音频: '{text}' -> {output_path}")
+        start_time = time.perf_counter()
         result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+        get_metrics().observe('synthesis', time.perf_counter() - start_time)
 
         if result.returncode == 0:
             print(f"✓ 成功生成: {output_path}")
@@ -90,10 +89,22 @@ def generate_vits_audio(text, output_path, speaker_id="p273"):
         print(f"✗ 生成出错: {text} - {str(e)}")
         return False
 
-def batch_generate_english_audio():
-    """批量生成英文音频文件"""
+def batch_generate_english_audio(engine='auto', writers=DEFAULT_WRITERS, queue_depth=DEFAULT_QUEUE_DEPTH,
+                                 server=None, onnx_model=None, fork_workers=0, calibrate=False):
+    """
+    批量生成英文音频文件；指定server时使用tts_server.py中已加载的模型，
+    指定onnx_model时使用vits_onnx.py导出的ONNX模型在CPU上推理，
+    指定fork_workers时模型只加载一次，由多个fork出的进程共享权重并行合成；
+    engine为auto时使用tts_calibrate.py在本机测得的最快合格后端，calibrate为True时重新测量
+    """
+    calibrated = None
+    if engine == 'auto' and not (server or onnx_model or fork_workers):
+        from tts_calibrate import calibrated_backend
+        calibrated = calibrated_backend('en', recalibrate=calibrate)
+    backend_name = calibrated or 'vits'
+    engine = 'api' if server or onnx_model or fork_workers or calibrated else resolve_engine(engine)
     # 检查tts命令是否可用
-    if not check_tts_available():
+    if engine == 'cli' and not check_tts_available():
         print("错误: 找不到tts命令。请确保已安装Coqui TTS库并且tts命令在PATH中。")
         print("安装方法: pip install TTS")
         sys.exit(1)
@@ -102,8 +113,12 @@ def batch_generate_english_audio():
     output_dir = create_output_directory()
     print(f"输出目录: {output_dir.absolute()}")
 
+    metrics = get_metrics()
+
     # 解析categories.json
-    items = parse_categories_json()
+    with metrics.stage('parse'):
+        items = parse_categories_json()
+    metrics.add_items('parse', len(items))
     if not items:
         print("错误: 没有找到有效的音频生成项目")
         sys.exit(1)
@@ -118,28 +133,66 @@ def batch_generate_english_audio():
     print("开始使用VITS p273生成英文音频...")
     print("=" * 80)
 
-    # 批量生成音频
-    for i, item in enumerate(items, 1):
-        word_en = item['word_en']
-        voice_filename_en = item['voice_filename_en']
-        category = item['category']
-
-        print(f"\n[{i}/{len(items)}] 处理: {word_en} (分类: {category})")
-
-        # 输出文件路径
-        output_path = output_dir / voice_filename_en
-
-        # 检查文件是否已存在
-        if output_path.exists():
-            print(f"跳过已存在的文件: {voice_filename_en}")
-            skipped_count += 1
+    # 跳过已存在的文件；多张卡片共用同一个语音文件时只生成一次
+    pending, planned = [], set()
+    for item in items:
+        if item['voice_filename_en'] in planned:
             continue
+        planned.add(item['voice_filename_en'])
+        if (output_dir / item['voice_filename_en']).exists():
+            metrics.cache_result('existing_audio', True)
+            skipped_count += 1
+        else:
+            metrics.cache_result('existing_audio', False)
+            pending.append(item)
+    print(f"跳过已存在的文件: {skipped_count} 个，待生成: {len(pending)} 个")
 
-        # 生成音频
-        if generate_vits_audio(word_en, str(output_path), "p273"):
-            success_count += 1
+    # 批量生成音频
+    with metrics.stage('synthesis'):
+        if engine == 'api':
+            # 模型只加载一次，合成和写文件在不同线程中流水进行
+            fork_server = None
+            if server:
+                print(f"合成方式: TTS服务 {server} (写入线程: {writers}, 队列深度: {queue_depth})")
+                backend_factory, synthesis_workers = (lambda: RemoteBackend(server, 'p273')), DEFAULT_REMOTE_WORKERS
+            elif onnx_model:
+                from vits_onnx import OnnxVitsBackend
+                print(f"合成方式: ONNX Runtime {onnx_model} (写入线程: {writers}, 队列深度: {queue_depth})")
+                backend_factory, synthesis_workers = (lambda: OnnxVitsBackend(onnx_model, 'p273')), 1
+            elif fork_workers:
+                from fork_server import ForkServer
+                print(f"合成方式: Fork-server {fork_workers} 个合成进程 (写入线程: {writers}, 队列深度: {queue_depth})")
+                fork_server = ForkServer(lambda: create_backend('vits', 'en'), fork_workers).start()
+                backend_factory, synthesis_workers = fork_server.worker_backend, fork_workers
+            else:
+                print(f"合成方式: TTS Python API {backend_name} (写入线程: {writers}, 队列深度: {queue_depth})")
+                backend_factory, synthesis_workers = (lambda: create_backend(backend_name, 'en')), 1
+            jobs = [SynthesisJob(item['word_en'], str(output_dir / item['voice_filename_en']))
+                    for item in pending]
+            try:
+                success_count, failed = run_tts_jobs(backend_factory, jobs, synthesis_workers,
+                                                     writers=writers, queue_depth=queue_depth)
+                if fork_server:
+                    fork_server.print_memory_report()
+            finally:
+                if fork_server:
+                    fork_server.stop()
+            failed_count = len(failed)
         else:
-            failed_count += 1
+            print("合成方式: tts命令")
+            for i, item in enumerate(pending, 1):
+                word_en = item['word_en']
+                category = item['category']
+
+                print(f"\n[{i}/{len(pending)}] 处理: {word_en} (分类: {category})")
+
+                # 生成音频
+                if generate_vits_audio(word_en, str(output_dir / item['voice_filename_en']), "p273"):
+                    success_count += 1
+                    metrics.add_items('synthesis')
+                else:
+                    failed_count += 1
+                    metrics.incr('synthesis_failed')
 
     # 输出总结
     print("\n" + "=" * 80)
@@ -177,6 +230,24 @@ def batch_generate_english_audio():
 
 def main():
     """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='VITS p273 英文TTS生成器')
+    parser.add_argument('--engine', choices=ENGINES, default='auto',
+                        help='合成方式: api为进程内流水线，cli为逐个调用tts命令 (默认: auto)')
+    parser.add_argument('--writers', type=int, default=DEFAULT_WRITERS,
+                        help=f'写文件线程数 (默认: {DEFAULT_WRITERS})')
+    parser.add_argument('--queue-depth', type=int, default=DEFAULT_QUEUE_DEPTH,
+                        help=f'合成结果队列深度，限制内存中的音频条数 (默认: {DEFAULT_QUEUE_DEPTH})')
+    parser.add_argument('--server', type=str, help='使用tts_server.py服务合成，例如 http://127.0.0.1:5002')
+    parser.add_argument('--onnx-model', type=str, help='使用vits_onnx.py导出的ONNX模型，例如 models/vits_vctk.int8.onnx')
+    parser.add_argument('--fork-workers', type=int, default=0,
+                        help='fork出的合成进程数，进程间以写时复制共享模型权重 (默认: 0，不使用)')
+    parser.add_argument('--calibrate', action='store_true',
+                        help='重新测量各TTS后端在本机上的速度和质量，--engine auto时使用最快的合格后端')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
     print("VITS p273 英文TTS生成器")
     print("=" * 50)
     print("模型: VITS (tts_models/en/vctk/vits)")
@@ -184,7 +255,9 @@ def main():
     print("目标语言: 英文")
     print("数据源: categories.json")
 
-    batch_generate_english_audio()
+    with metrics_session('vits_p273_english_tts', args.metrics, args.profile):
+        batch_generate_english_audio(args.engine, args.writers, args.queue_depth, args.server,
+                                     args.onnx_model, args.fork_workers, args.calibrate)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,515 @@
+#!/usr/bin/env python3
+"""
+卡组监视模式
+内容编辑把新的PNG放进图片目录、或者手工修改categories.json之后，不必再依次手动运行各个脚本：
+本脚本常驻运行，用inotify(通过ctypes调用，非Linux系统退回到定时扫描)监视图片目录和卡组文件，
+一批修改静止 --debounce 秒后，只对受影响的卡片执行分类、翻译、拼音和语音合成，然后更新派生输出：
+- 新图片: get_category()分类，normalize_filenames()生成英文单词和语音文件名，translate_to_chinese()翻译
+- 卡组中英文或中文被修改的卡片: 重新合成对应语言的语音；卡组已有拼音/时长字段时一并更新
+- 图片被删除: 默认只提示，--prune时从卡组中删除对应卡片
+- 已存在的派生输出(搜索索引、干扰项、预缓存清单)整体重建，每一项都先写临时文件再替换
+
+TTS模型在第一次需要时加载，之后一直留在内存中，修改一个单词只需合成这一个单词
+"""
+
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import select
+import struct
+import sys
+import time
+
+from deck_model import Category, Card, DeckValidationError, VoiceFiles, Word, load_deck, save_deck
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+from verify_assets import IMAGE_ROOT
+from wav_info import LANGUAGES, VOICE_ROOT, WavFormatError, read_wav_info
+
+DEFAULT_DEBOUNCE = 0.5
+DEFAULT_POLL_INTERVAL = 1.0
+IMAGE_EXTENSION = '.png'
+# 派生输出: 名称 -> 输出路径，默认只重建已经存在的输出
+OUTPUTS = {
+    'search_index': 'search_index',
+    'distractors': 'distractors',
+    'precache': 'precache-manifest.json',
+}
+
+# <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """监视若干目录中文件的写入完成、移入移出和删除；队列溢出时报告需要全部重新扫描"""
+
+    def __init__(self, directories):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1失败')
+        self.directories = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"无法监视 {directory}")
+            self.directories[wd] = directory
+
+    @property
+    def name(self):
+        return 'inotify'
+
+    def wait(self, timeout):
+        """等待最多timeout秒(None为一直等待)，返回 (变化的路径集合, 是否溢出)"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return set(), False
+        paths, overflow = set(), False
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+                offset += EVENT_HEADER.size
+                name = data[offset:offset + length].rstrip(b'\0')
+                offset += length
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                elif wd in self.directories and name:
+                    paths.add(os.path.join(self.directories[wd], os.fsdecode(name)))
+        return paths, overflow
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """没有inotify时按固定间隔比较目录中文件的修改时间和大小"""
+
+    def __init__(self, directories, interval=DEFAULT_POLL_INTERVAL):
+        self.directories = list(directories)
+        self.interval = interval
+        self._snapshot = self._scan()
+
+    @property
+    def name(self):
+        return f"定时扫描 (每 {self.interval} 秒)"
+
+    def _scan(self):
+        snapshot = {}
+        for directory in self.directories:
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                snapshot[entry.path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def wait(self, timeout):
+        time.sleep(self.interval if timeout is None else min(timeout, self.interval))
+        snapshot = self._scan()
+        paths = {path for path in snapshot.keys() | self._snapshot.keys()
+                 if snapshot.get(path) != self._snapshot.get(path)}
+        self._snapshot = snapshot
+        return paths, False
+
+    def close(self):
+        pass
+
+
+def create_watcher(directories, poll_interval=DEFAULT_POLL_INTERVAL, polling=False):
+    """优先使用inotify，不可用时(非Linux、监视数量达到上限等)退回到定时扫描"""
+    if not polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directories)
+        except (OSError, AttributeError) as e:
+            print(f"注意: 无法使用inotify ({e})，改为定时扫描")
+    return PollingWatcher(directories, poll_interval)
+
+
+def file_digest(path):
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def card_snapshot(deck):
+    """{卡片id: (英文, 中文)}，用于找出手工修改过的卡片"""
+    return {card.id: (card.word.en, card.word.cn) for _, card in deck.cards()}
+
+
+def needs_translation(card):
+    """中文为空或与英文相同(新加的卡片还没有翻译)；"T恤" 这类人工确认过的中英混合翻译不动"""
+    return not card.word.cn or card.word.cn == card.word.en
+
+
+def update_statistics(deck):
+    """卡组带有统计信息时更新卡片数和分类数"""
+    if not isinstance(deck.statistics, dict):
+        return
+    total = deck.card_count
+    others = sum(len(category.cards) for category in deck.categories if category.id == 'others')
+    values = {'total_images': total, 'total_categories': len(deck.categories),
+              'categorized_images': total - others, 'uncategorized_images': others}
+    for key, value in values.items():
+        if key in deck.statistics:
+            deck.statistics[key] = value
+
+
+def new_card(filename):
+    """为新图片创建卡片并返回 (分类id, 分类名称, 卡片)"""
+    from generate_categories import CATEGORIES, get_category
+    from transform_categories import normalize_filenames, translate_to_chinese
+
+    category_id = get_category(filename)
+    info = CATEGORIES.get(category_id)
+    name = {'en': info['en'], 'zh': info['zh']} if info else {'en': 'Others', 'zh': '其他'}
+    (english,), (voice,) = normalize_filenames([filename])
+    chinese = translate_to_chinese(english, category_id)
+    return category_id, name, Card(filename, Word(chinese, english), VoiceFiles(voice['cn'], voice['en']))
+
+
+def insert_card(deck, category_id, name, card):
+    """按文件名顺序插入卡片，分类不存在时新建(放在"其他"之前)"""
+    category = next((category for category in deck.categories if category.id == category_id), None)
+    if category is None:
+        category = Category(category_id, name, [])
+        others = [i for i, existing in enumerate(deck.categories) if existing.id == 'others']
+        deck.categories.insert(others[0] if others else len(deck.categories), category)
+    position = next((i for i, existing in enumerate(category.cards) if existing.filename > card.filename),
+                    len(category.cards))
+    category.cards.insert(position, card)
+
+
+class DeckWatcher:
+    """保存上一次处理后的卡组状态，每批文件变化只处理受影响的卡片"""
+
+    def __init__(self, deck_path, image_root=IMAGE_ROOT, voice_root=VOICE_ROOT, outputs=None, prune=False,
+                 tts=True, writers=2):
+        self.deck_path = deck_path
+        self.image_root = image_root
+        self.voice_root = voice_root
+        self.outputs = outputs
+        self.prune = prune
+        self.tts = tts
+        self.writers = writers
+        self._backends = {}
+        self._converter = None
+        self._precache = None
+        self._deck_digest = None
+        self._snapshot = {}
+
+    # ---- TTS ----
+
+    def backend(self, language):
+        """每种语言的模型只加载一次；没有安装TTS时返回None"""
+        if language not in self._backends:
+            from tts_backends import coqui_available, create_backend
+            if not coqui_available():
+                print("注意: 未安装TTS，跳过语音合成")
+                self._backends[language] = None
+            else:
+                from tts_calibrate import calibrated_backend
+                name = calibrated_backend(language) or ('vits' if language == 'en' else 'xtts')
+                self._backends[language] = create_backend(name, language)
+        return self._backends[language]
+
+    def synthesize(self, requests):
+        """requests: {语言: {输出路径: 文本}}，返回成功合成的路径集合"""
+        from tts_pipeline import SynthesisJob, run_tts_jobs
+
+        written = set()
+        for language, paths in requests.items():
+            backend = self.backend(language) if paths else None
+            if backend is None:
+                continue
+            os.makedirs(os.path.join(self.voice_root, language), exist_ok=True)
+            jobs = [SynthesisJob(text, path) for path, text in sorted(paths.items())]
+            _, failed = run_tts_jobs(lambda: backend, jobs, 1, writers=self.writers)
+            failed_paths = {result['output_path'] for result in failed}
+            for result in failed:
+                print(f"  ✗ {result['output_path']}: {result.get('error')}")
+            written.update(path for path in paths if path not in failed_paths)
+        return written
+
+    # ---- 卡组 ----
+
+    def load(self):
+        """读取卡组；编辑器正在保存或JSON暂时不合法时返回None，等待下一次修改"""
+        try:
+            deck = load_deck(self.deck_path)
+        except (json.JSONDecodeError, DeckValidationError) as e:
+            print(f"⚠️  {self.deck_path} 暂时无法解析，等待下一次修改: {str(e)[:200]}")
+            return None
+        return deck
+
+    def save(self, deck):
+        save_deck(deck, self.deck_path)
+        self._deck_digest = file_digest(self.deck_path)
+
+    def is_relevant(self, path):
+        """卡组文件本身或图片目录中的图片；同一目录中的其他输出(例如预压缩文件)不触发处理"""
+        path = os.path.abspath(path)
+        if path == os.path.abspath(self.deck_path):
+            return True
+        name = os.path.basename(path)
+        return (os.path.dirname(path) == os.path.abspath(self.image_root) and name.endswith(IMAGE_EXTENSION)
+                and not name.startswith('.'))
+
+    def voice_path(self, card, language):
+        return os.path.join(self.voice_root, language, card.voice.get(language))
+
+    def process(self, changed_paths, full_scan=False):
+        """
+        处理一批变化，返回受影响的卡片数；full_scan时(启动、inotify溢出)检查全部图片和语音文件
+        """
+        metrics = get_metrics()
+        start = time.perf_counter()
+        changed_paths = {os.path.abspath(path) for path in changed_paths if self.is_relevant(path)}
+        deck_changed = full_scan or os.path.abspath(self.deck_path) in changed_paths
+        if deck_changed and not full_scan and file_digest(self.deck_path) == self._deck_digest:
+            # 本脚本自己写出的卡组
+            deck_changed = False
+        image_names = {os.path.basename(path) for path in changed_paths if path != os.path.abspath(self.deck_path)}
+        if full_scan:
+            image_names = {name for name in os.listdir(self.image_root)
+                           if name.endswith(IMAGE_EXTENSION) and not name.startswith('.')}
+        if not deck_changed and not image_names:
+            return 0
+        if not full_scan:
+            print(f"\n检测到 {len(changed_paths)} 个文件变化")
+
+        deck = self.load()
+        if deck is None:
+            return 0
+        if full_scan:
+            # 目录列表里没有已删除的图片，卡组引用的文件名也要检查，才能发现停止监视期间删除的图片
+            image_names |= {card.filename for _, card in deck.cards()}
+        modified = False
+        affected = set()
+        audio = {language: {} for language in LANGUAGES}
+
+        with metrics.stage('diff'):
+            by_filename = {card.filename: (category, card) for category, card in deck.cards()}
+            # 新图片和被删除的图片
+            for name in sorted(image_names):
+                exists = os.path.exists(os.path.join(self.image_root, name))
+                if exists and name not in by_filename:
+                    category_id, category_name, card = new_card(name)
+                    insert_card(deck, category_id, category_name, card)
+                    by_filename[name] = (None, card)
+                    print(f"  + {name}: {card.word.en} / {card.word.cn} ({category_id})")
+                    affected.add(card.id)
+                    modified = True
+                elif not exists and name in by_filename:
+                    category, card = by_filename.pop(name)
+                    if self.prune:
+                        category.cards.remove(card)
+                        print(f"  - {name}: 已从卡组中删除")
+                        modified = True
+                    else:
+                        print(f"  ⚠️  {name} 已被删除，卡组仍然引用它 (使用 --prune 自动删除卡片)")
+                elif exists and not full_scan:
+                    # 替换了图片内容：卡片不变，派生输出(预缓存清单)需要更新
+                    affected.add(by_filename[name][1].id)
+
+            # 手工修改的卡片和缺少语音的卡片
+            for category, card in deck.cards():
+                previous = self._snapshot.get(card.id)
+                edited = bool(self._snapshot) and previous != (card.word.en, card.word.cn)
+                # 只翻译这一批中新加或修改过的卡片，卡组中原有的未翻译卡片留给translate.py处理
+                if edited and needs_translation(card) and card.id not in affected:
+                    from transform_categories import translate_to_chinese
+                    translation = translate_to_chinese(card.word.en, category.id)
+                    if translation != card.word.cn:
+                        card.word.cn = translation
+                        modified = True
+                for language, text in (('en', card.word.en), ('cn', card.word.cn)):
+                    path = self.voice_path(card, language)
+                    text_changed = previous is not None and previous[0 if language == 'en' else 1] != text
+                    # 不合成语音时，缺少语音文件的卡片每一批都会出现，不算受影响
+                    if text and (text_changed or (self.tts and not os.path.exists(path))):
+                        audio[language][path] = text
+                        affected.add(card.id)
+                if edited:
+                    affected.add(card.id)
+
+        cards = [card for _, card in deck.cards() if card.id in affected]
+        if any(card.word.pinyin is not None for _, card in deck.cards()):
+            modified |= self.annotate_pinyin(cards)
+
+        if self.tts and any(audio.values()):
+            count = sum(len(paths) for paths in audio.values())
+            with metrics.stage('synthesis', items=count):
+                written = self.synthesize(audio)
+            print(f"  合成了 {len(written)}/{count} 个语音文件")
+            if any(card.voice_duration_ms is not None for _, card in deck.cards()):
+                modified |= self.update_durations(cards)
+
+        if modified:
+            update_statistics(deck)
+            with metrics.stage('write', items=1):
+                self.save(deck)
+        else:
+            self._deck_digest = file_digest(self.deck_path)
+        self._snapshot = card_snapshot(deck)
+
+        if affected or modified:
+            self.rebuild_outputs(deck)
+        metrics.add_items('cards', len(affected))
+        print(f"✓ 更新完成: {len(affected)} 张卡片受影响，用时 {time.perf_counter() - start:.2f} 秒")
+        return len(affected)
+
+    def annotate_pinyin(self, cards):
+        """卡组已经标注过拼音时，为受影响的卡片重新标注"""
+        try:
+            from annotate_pinyin import PinyinConverter
+        except ImportError:
+            print("注意: 未安装pypinyin，新卡片没有拼音")
+            return False
+        if self._converter is None:
+            self._converter = PinyinConverter()
+        changed = False
+        for card in cards:
+            if card.word.cn:
+                pinyin, tones = self._converter.convert(card.word.cn)
+                if (pinyin, tones) != (card.word.pinyin, card.word.tones):
+                    card.word.pinyin, card.word.tones = pinyin, tones
+                    changed = True
+        return changed
+
+    def update_durations(self, cards):
+        """卡组已有语音时长时，为受影响的卡片重新读取"""
+        changed = False
+        for card in cards:
+            durations = dict(card.voice_duration_ms or {})
+            for language in LANGUAGES:
+                try:
+                    durations[language] = read_wav_info(self.voice_path(card, language)).duration_ms
+                except (OSError, WavFormatError):
+                    continue
+            if durations != (card.voice_duration_ms or {}):
+                card.voice_duration_ms = durations
+                changed = True
+        return changed
+
+    # ---- 派生输出 ----
+
+    def rebuild_outputs(self, deck):
+        """重建选定的派生输出；单项失败只打印错误，不影响其他输出和后续监视"""
+        metrics = get_metrics()
+        names = self.outputs if self.outputs is not None else [name for name, path in OUTPUTS.items()
+                                                                 if os.path.exists(path)]
+        for name in names:
+            try:
+                with metrics.stage(f"output_{name}"):
+                    if name == 'search_index':
+                        from build_search_index import build_search_index
+                        build_search_index(self.deck_path, OUTPUTS[name])
+                    elif name == 'distractors':
+                        from build_distractors import DEFAULT_TOP_K, build_distractors, write_distractors
+                        shards, weights = build_distractors(deck, DEFAULT_TOP_K)
+                        write_distractors(shards, weights, DEFAULT_TOP_K, OUTPUTS[name])
+                    elif name == 'precache':
+                        self.rebuild_precache(deck)
+            except (ImportError, OSError, ValueError) as e:
+                print(f"  ✗ 重建 {name} 失败: {e}")
+
+    def rebuild_precache(self, deck):
+        from precache_manifest import DEFAULT_SHARD_DIRS, build_precache_manifest, load_manifest, write_manifest
+
+        path = OUTPUTS['precache']
+        shard_dirs = [directory for directory in DEFAULT_SHARD_DIRS if os.path.isdir(directory)]
+        # 清单有缺失资源时不写出，用内存中上一次的结果沿用预压缩文件，避免每一批都重新压缩全部分片
+        previous = self._precache if self._precache is not None else load_manifest(path)
+        manifest, problems = build_precache_manifest(deck, [self.deck_path], shard_dirs, previous,
+                                                     self.image_root, self.voice_root)
+        self._precache = manifest
+        if problems:
+            print(f"  ⚠️  {len(problems)} 个资源缺失或损坏，预缓存清单未更新 (例如 {problems[0].path})")
+            return
+        write_manifest(manifest, path)
+
+
+def watch(deck_watcher, watcher, debounce=DEFAULT_DEBOUNCE):
+    """事件循环：收集变化，静止debounce秒后交给deck_watcher处理；Ctrl+C退出"""
+    pending, overflow, deadline = set(), False, None
+    while True:
+        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+        paths, overflowed = watcher.wait(timeout)
+        paths = {path for path in paths if deck_watcher.is_relevant(path)}
+        if paths or overflowed:
+            pending |= paths
+            overflow |= overflowed
+            deadline = time.monotonic() + debounce
+            continue
+        if deadline is not None and time.monotonic() >= deadline:
+            if overflow:
+                print("\n事件队列溢出，重新扫描全部文件")
+            deck_watcher.process(pending, full_scan=overflow)
+            pending, overflow, deadline = set(), False, None
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='监视图片目录和卡组文件，自动更新受影响的卡片和派生输出')
+    parser.add_argument('--deck', type=str, default='categories.json', help='卡组文件 (默认: categories.json)')
+    parser.add_argument('--image-root', type=str, default=IMAGE_ROOT, help=f'图片目录 (默认: {IMAGE_ROOT})')
+    parser.add_argument('--voice-root', type=str, default=VOICE_ROOT, help=f'语音根目录 (默认: {VOICE_ROOT})')
+    parser.add_argument('--outputs', type=str, nargs='*', choices=sorted(OUTPUTS),
+                        help='需要重建的派生输出 (默认: 已经存在的输出)')
+    parser.add_argument('--debounce', type=float, default=DEFAULT_DEBOUNCE,
+                        help=f'最后一次变化后等待的秒数 (默认: {DEFAULT_DEBOUNCE})')
+    parser.add_argument('--poll', action='store_true', help='不使用inotify，定时扫描')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help=f'定时扫描的间隔秒数 (默认: {DEFAULT_POLL_INTERVAL})')
+    parser.add_argument('--prune', action='store_true', help='图片被删除时从卡组中删除对应卡片')
+    parser.add_argument('--no-tts', action='store_true', help='不合成语音，只更新卡组和派生输出')
+    parser.add_argument('--once', action='store_true', help='只做一次启动检查(补齐新图片和缺少的语音)后退出')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    deck_watcher = DeckWatcher(args.deck, args.image_root, args.voice_root, args.outputs, args.prune,
+                               not args.no_tts)
+    with metrics_session('watch_deck', args.metrics, args.profile):
+        print("启动检查...")
+        deck_watcher.process(set(), full_scan=True)
+        if args.once:
+            return
+
+        deck_dir = os.path.dirname(os.path.abspath(args.deck))
+        watcher = create_watcher(sorted({os.path.abspath(args.image_root), deck_dir}),
+                                 args.poll_interval, args.poll)
+        print(f"正在监视 {args.image_root} 和 {args.deck} ({watcher.name})，按Ctrl+C退出")
+        try:
+            watch(deck_watcher, watcher, args.debounce)
+        except KeyboardInterrupt:
+            print("\n停止监视")
+        finally:
+            watcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+WAV文件头解析
+只读取RIFF/WAVE文件开头的fmt和data块头，得到时长、采样率和声道数，不解码音频，
+用于替代逐个文件调用ffprobe；并可并行扫描语音目录，把时长写入categories.json
+"""
+
+import os
+import struct
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from deck_model import load_deck, save_deck
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+VOICE_ROOT = os.path.join('resource', 'voice')
+LANGUAGES = ('en', 'cn')
+
+WavInfo = namedtuple('WavInfo', [
+    'sample_rate', 'channels', 'bits_per_sample', 'format_tag',
+    'block_align', 'data_offset', 'data_size', 'duration_ms',
+])
+
+
+class WavFormatError(ValueError):
+    """文件不是可识别的WAV文件"""
+
+
+def read_wav_info(path):
+    """解析WAV文件头，返回WavInfo；格式不正确时抛出WavFormatError"""
+    with open(path, 'rb') as f:
+        return parse_wav_header(f, os.fstat(f.fileno()).st_size, path)
+
+
+def parse_wav_header(f, file_size, path=''):
+    """从已打开的二进制文件对象(文件或BytesIO)开头解析WAV文件头"""
+    header = f.read(12)
+    if len(header) < 12 or header[0:4] != b'RIFF' or header[8:12] != b'WAVE':
+        raise WavFormatError(f"不是RIFF/WAVE文件: {path}")
+
+    fmt = None
+    while True:
+        chunk_header = f.read(8)
+        if len(chunk_header) < 8:
+            raise WavFormatError(f"缺少{'data' if fmt else 'fmt'}块: {path}")
+        chunk_id, chunk_size = struct.unpack('<4sI', chunk_header)
+
+        if chunk_id == b'fmt ':
+            if chunk_size < 16:
+                raise WavFormatError(f"fmt块过短: {path}")
+            body = f.read(chunk_size + (chunk_size & 1))
+            if len(body) < 16:
+                raise WavFormatError(f"fmt块被截断: {path}")
+            format_tag, channels, sample_rate, _, block_align, bits = struct.unpack('<HHIIHH', body[:16])
+            if format_tag == WAVE_FORMAT_EXTENSIBLE and len(body) >= 26:
+                # 子格式GUID的前两个字节就是实际的格式编号
+                format_tag = struct.unpack('<H', body[24:26])[0]
+            fmt = (format_tag, channels, sample_rate, block_align, bits)
+        elif chunk_id == b'data':
+            if fmt is None:
+                raise WavFormatError(f"data块出现在fmt块之前: {path}")
+            data_offset = f.tell()
+            # 流式写入的文件可能没有回填长度
+            if chunk_size == 0xFFFFFFFF or data_offset + chunk_size > file_size:
+                chunk_size = file_size - data_offset
+            format_tag, channels, sample_rate, block_align, bits = fmt
+            if sample_rate == 0 or block_align == 0:
+                raise WavFormatError(f"采样率或块对齐为0: {path}")
+            frames = chunk_size // block_align
+            return WavInfo(sample_rate, channels, bits, format_tag, block_align,
+                           data_offset, chunk_size, round(frames * 1000 / sample_rate))
+        else:
+            f.seek(chunk_size + (chunk_size & 1), os.SEEK_CUR)
+
+
+def scan_wav_files(paths, workers=None):
+    """并行读取多个WAV文件头，返回 {路径: WavInfo或异常}"""
+    def read(path):
+        try:
+            return path, read_wav_info(path)
+        except (OSError, WavFormatError) as e:
+            return path, e
+
+    with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4)) as executor:
+        return dict(executor.map(read, paths))
+
+
+def annotate_durations(deck, voice_root=VOICE_ROOT, workers=None):
+    """
+    为每张卡片写入voice_duration_ms: {"cn": 毫秒, "en": 毫秒}，
+    语音文件缺失或损坏的语言删除之前写入的时长；返回 (写入的时长数, 问题文件列表)
+    """
+    entries = []
+    for _, card in deck.cards():
+        for language in LANGUAGES:
+            entries.append((card, language, os.path.join(voice_root, language, card.voice.get(language))))
+
+    results = scan_wav_files(sorted({path for _, _, path in entries}), workers)
+
+    written = 0
+    problems = []
+    for card, language, path in entries:
+        info = results[path]
+        if isinstance(info, Exception):
+            problems.append((path, info))
+            if card.voice_duration_ms and language in card.voice_duration_ms:
+                del card.voice_duration_ms[language]
+                card.voice_duration_ms = card.voice_duration_ms or None
+            continue
+        if card.voice_duration_ms is None:
+            card.voice_duration_ms = {}
+        card.voice_duration_ms[language] = info.duration_ms
+        written += 1
+    return written, problems
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='读取语音文件时长并写入categories.json')
+    parser.add_argument('--deck', type=str, default='categories.json', help='卡组文件 (默认: categories.json)')
+    parser.add_argument('--voice-root', type=str, default=VOICE_ROOT, help=f'语音根目录 (默认: {VOICE_ROOT})')
+    parser.add_argument('--workers', type=int, help='并行线程数')
+    parser.add_argument('--file', type=str, nargs='+', help='只打印指定WAV文件的信息')
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+
+    if args.file:
+        for path, info in scan_wav_files(args.file, args.workers).items():
+            if isinstance(info, Exception):
+                print(f"✗ {path}: {info}")
+            else:
+                print(f"{path}: {info.duration_ms} ms, {info.sample_rate} Hz, "
+                      f"{info.channels} 声道, {info.bits_per_sample} bit")
+        return
+
+    with metrics_session('wav_info', args.metrics, args.profile):
+        metrics = get_metrics()
+
+        with metrics.stage('load', items=1):
+            deck = load_deck(args.deck)
+
+        with metrics.stage('scan'):
+            written, problems = annotate_durations(deck, args.voice_root, args.workers)
+        metrics.add_items('scan', written + len(problems))
+
+        with metrics.stage('write', items=1):
+            save_deck(deck, args.deck)
+
+    print(f"写入了 {written} 个语音时长")
+    if problems:
+        print(f"⚠️  {len(problems)} 个语音文件缺失或无法解析:")
+        for path, error in problems[:20]:
+            print(f"  - {path}: {error}")
+        if len(problems) > 20:
+            print(f"  ... 还有 {len(problems) - 20} 个")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,705 @@
+#!/usr/bin/env python3
+"""
+可插拔的租约式工作队列
+协调器把任务拆成工作单元放入队列，各台机器上的worker领取单元(获得租约)、处理、提交结果：
+- 租约到期前没有提交或续约的单元重新变为可领取(worker崩溃、断网)，超过最大尝试次数后记为失败
+- 续约、提交和失败都要带上领取时得到的令牌，租约过期后被别人接手的旧worker无法覆盖结果
+
+后端:
+    sqlite:<路径>               同一台机器上的多个进程 (默认 sqlite:.cache/work_queue.sqlite)
+    redis://[:密码@]主机:端口/库  Redis或任何兼容RESP协议的服务，多台机器共用；
+                                 租约时间以服务端TIME为准，不受各台机器时钟偏差影响
+
+没有Redis时可以用 --serve 启动内置的RESP替身服务(只实现队列用到的命令，数据只保存在内存中)
+
+用法:
+    python3 work_queue.py --serve --host 0.0.0.0 --port 6379
+    python3 work_queue.py --queue redis://127.0.0.1:6379/0 --name tts --status
+    python3 work_queue.py --queue sqlite:.cache/work_queue.sqlite --name tts --clear
+"""
+
+import json
+import os
+import socket
+import socketserver
+import sqlite3
+import threading
+import time
+import uuid
+from collections import namedtuple
+from contextlib import contextmanager
+from urllib.parse import unquote, urlparse
+
+DEFAULT_QUEUE = 'sqlite:' + os.path.join('.cache', 'work_queue.sqlite')
+DEFAULT_LEASE_SECONDS = 120
+DEFAULT_MAX_ATTEMPTS = 3
+DEFAULT_REDIS_PORT = 6379
+
+Lease = namedtuple('Lease', ['unit_id', 'payload', 'token', 'attempt'])
+# pending包含租约已经过期、等待重新领取的单元
+QueueStatus = namedtuple('QueueStatus', ['pending', 'leased', 'done', 'failed'])
+
+
+def expired_error(attempts):
+    return f"租约过期 (已尝试 {attempts} 次)"
+
+
+class SQLiteQueue:
+    """
+    SQLite后端，WAL模式，每个线程使用自己的连接；
+    领取在BEGIN IMMEDIATE事务中完成，多个进程同时领取不会拿到同一个单元
+    """
+
+    def __init__(self, path, name, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        with self._transaction() as db:
+            db.execute("""
+                CREATE TABLE IF NOT EXISTS units (
+                    queue TEXT NOT NULL,
+                    unit_id TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    available_at REAL NOT NULL,
+                    token TEXT,
+                    worker TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    PRIMARY KEY (queue, unit_id)
+                ) WITHOUT ROWID
+            """)
+            db.execute("CREATE INDEX IF NOT EXISTS units_available ON units (queue, state, available_at)")
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        """写事务：BEGIN IMMEDIATE一开始就取得写锁，读到的可领取单元在提交前不会被其他进程改动"""
+        db = self._connection()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def submit(self, units):
+        """units: [(单元id, 可JSON序列化的内容)]，已存在的同名单元重置为待处理"""
+        now = time.time()
+        with self._transaction() as db:
+            db.executemany("""
+                INSERT INTO units (queue, unit_id, payload, state, available_at) VALUES (?, ?, ?, 'queued', ?)
+                ON CONFLICT (queue, unit_id) DO UPDATE SET
+                    payload = excluded.payload, state = 'queued', available_at = excluded.available_at,
+                    token = NULL, worker = NULL, attempts = 0, result = NULL, error = NULL
+            """, [(self.name, unit_id, json.dumps(payload, ensure_ascii=False), now) for unit_id, payload in units])
+        return len(units)
+
+    def claim(self, worker):
+        """领取一个可处理的单元，返回Lease；没有时返回None"""
+        with self._transaction() as db:
+            while True:
+                now = time.time()
+                row = db.execute("""
+                    SELECT unit_id, payload, attempts, error FROM units
+                    WHERE queue = ? AND state = 'queued' AND available_at <= ?
+                    ORDER BY available_at, unit_id LIMIT 1
+                """, (self.name, now)).fetchone()
+                if row is None:
+                    return None
+                unit_id, payload, attempts, error = row
+                if attempts >= self.max_attempts:
+                    db.execute("UPDATE units SET state = 'failed', token = NULL, error = ? WHERE queue = ? AND unit_id = ?",
+                               (error or expired_error(attempts), self.name, unit_id))
+                    continue
+                token = uuid.uuid4().hex
+                db.execute("""
+                    UPDATE units SET available_at = ?, token = ?, worker = ?, attempts = attempts + 1
+                    WHERE queue = ? AND unit_id = ?
+                """, (now + self.lease_seconds, token, worker, self.name, unit_id))
+                return Lease(unit_id, json.loads(payload), token, attempts + 1)
+
+    def _update_leased(self, lease, assignments, values):
+        with self._transaction() as db:
+            cursor = db.execute(f"""
+                UPDATE units SET {assignments}
+                WHERE queue = ? AND unit_id = ? AND token = ? AND state = 'queued'
+            """, (*values, self.name, lease.unit_id, lease.token))
+            return cursor.rowcount == 1
+
+    def extend(self, lease):
+        """续约；租约已经丢失(过期后被别人领取)时返回False"""
+        return self._update_leased(lease, 'available_at = ?', (time.time() + self.lease_seconds,))
+
+    def complete(self, lease, result=None):
+        return self._update_leased(lease, "state = 'done', token = NULL, result = ?",
+                                   (json.dumps(result, ensure_ascii=False),))
+
+    def fail(self, lease, error, retry_delay=0.0):
+        """处理失败：未达到最大尝试次数时延迟retry_delay秒后重新可领取，否则记为失败"""
+        if lease.attempt >= self.max_attempts:
+            return self._update_leased(lease, "state = 'failed', token = NULL, error = ?", (error,))
+        return self._update_leased(lease, 'available_at = ?, token = NULL, error = ?',
+                                   (time.time() + retry_delay, error))
+
+    def release(self, lease):
+        """放弃租约(worker退出)，单元立即可被领取，不计入尝试次数"""
+        return self._update_leased(lease, 'available_at = ?, token = NULL, attempts = attempts - 1', (time.time(),))
+
+    def status(self):
+        counts = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        rows = self._connection().execute("""
+            SELECT CASE WHEN state != 'queued' THEN state
+                        WHEN token IS NOT NULL AND available_at > ? THEN 'leased' ELSE 'pending' END, COUNT(*)
+            FROM units WHERE queue = ? GROUP BY 1
+        """, (time.time(), self.name))
+        counts.update(dict(rows))
+        return QueueStatus(**counts)
+
+    def results(self):
+        rows = self._connection().execute("SELECT unit_id, result FROM units WHERE queue = ? AND state = 'done'",
+                                          (self.name,))
+        return {unit_id: json.loads(result) for unit_id, result in rows}
+
+    def failures(self):
+        rows = self._connection().execute("SELECT unit_id, error FROM units WHERE queue = ? AND state = 'failed'",
+                                          (self.name,))
+        return dict(rows)
+
+    def clear(self):
+        with self._transaction() as db:
+            db.execute("DELETE FROM units WHERE queue = ?", (self.name,))
+
+
+# ---- Redis (RESP) ----
+
+class RespError(Exception):
+    """服务端返回的错误回复"""
+
+
+class SimpleString(str):
+    """RESP简单字符串回复 (+OK)，与批量字符串区分"""
+
+
+def encode_command(args):
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        if isinstance(arg, bytes):
+            data = arg
+        elif isinstance(arg, float):
+            data = repr(arg).encode()
+        else:
+            data = str(arg).encode('utf-8')
+        parts.append(b'$%d\r\n%s\r\n' % (len(data), data))
+    return b''.join(parts)
+
+
+def read_reply(reader):
+    """读取一个回复；数组中的错误作为RespError对象返回，保持与服务端的回复对齐"""
+    line = reader.readline()
+    if not line.endswith(b'\r\n'):
+        raise ConnectionError('连接已关闭')
+    prefix, rest = line[:1], line[1:-2]
+    if prefix == b'+':
+        return SimpleString(rest.decode('utf-8'))
+    if prefix == b'-':
+        return RespError(rest.decode('utf-8'))
+    if prefix == b':':
+        return int(rest)
+    if prefix == b'$':
+        length = int(rest)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        if len(data) != length + 2:
+            raise ConnectionError('连接已关闭')
+        return data[:-2]
+    if prefix == b'*':
+        count = int(rest)
+        return None if count < 0 else [read_reply(reader) for _ in range(count)]
+    raise RespError(f"无法解析的回复: {line[:50]!r}")
+
+
+class RespConnection:
+    """最小的RESP2客户端：一条连接，命令可以成批发送(MULTI/EXEC事务)"""
+
+    def __init__(self, host, port=DEFAULT_REDIS_PORT, db=0, password=None, timeout=30):
+        self._socket = socket.create_connection((host, port), timeout)
+        self._socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = self._socket.makefile('rb')
+        if password:
+            self.execute('AUTH', password)
+        if db:
+            self.execute('SELECT', db)
+
+    def execute(self, *args):
+        return self.pipeline([args])[0]
+
+    def pipeline(self, commands):
+        """一次发送多条命令，按顺序返回回复；任何一条出错时抛出RespError"""
+        self._socket.sendall(b''.join(encode_command(args) for args in commands))
+        replies = [read_reply(self._reader) for _ in commands]
+        for reply in replies:
+            if isinstance(reply, RespError):
+                raise reply
+        return replies
+
+    def transaction(self, commands):
+        """MULTI/EXEC执行commands，返回各命令的回复；WATCH的键被修改时返回None"""
+        replies = self.pipeline([('MULTI',), *commands, ('EXEC',)])
+        return replies[-1]
+
+    def close(self):
+        self._reader.close()
+        self._socket.close()
+
+
+class RedisQueue:
+    """
+    Redis后端，所有键以 work_queue:<名称> 开头：
+      units 单元内容(hash)  schedule 未完成单元 -> 可领取时间(zset)  token:<id> 当前租约令牌
+      attempts / errors / workers 各单元的尝试次数、最近错误、领取者(hash)  results / failed 结果和失败原因(hash)
+    领取和提交用WATCH + MULTI/EXEC做乐观并发控制，冲突时重试
+    """
+
+    def __init__(self, url, name, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or '127.0.0.1', parsed.port or DEFAULT_REDIS_PORT)
+        self.db = int(parsed.path.strip('/') or 0)
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.name = name
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.prefix = f"work_queue:{name}"
+        self._local = threading.local()
+
+    def _key(self, name):
+        return f"{self.prefix}:{name}"
+
+    def _token_key(self, unit_id):
+        return f"{self.prefix}:token:{unit_id}"
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = RespConnection(*self.address, db=self.db, password=self.password)
+            self._local.db = db
+        return db
+
+    def _now(self, db):
+        seconds, microseconds = db.execute('TIME')
+        return int(seconds) + int(microseconds) / 1e6
+
+    def submit(self, units):
+        db = self._connection()
+        now = self._now(db)
+        commands = []
+        for unit_id, payload in units:
+            commands += [
+                ('HSET', self._key('units'), unit_id, json.dumps(payload, ensure_ascii=False)),
+                ('ZADD', self._key('schedule'), now, unit_id),
+                ('DEL', self._token_key(unit_id)),
+            ]
+            commands += [('HDEL', self._key(name), unit_id) for name in ('attempts', 'errors', 'workers', 'results', 'failed')]
+        db.transaction(commands)
+        return len(units)
+
+    def claim(self, worker):
+        db = self._connection()
+        schedule = self._key('schedule')
+        while True:
+            db.execute('WATCH', schedule)
+            now = self._now(db)
+            ids = db.execute('ZRANGEBYSCORE', schedule, '-inf', now, 'LIMIT', 0, 1)
+            if not ids:
+                db.execute('UNWATCH')
+                return None
+            unit_id = ids[0].decode('utf-8')
+            attempts = int(db.execute('HGET', self._key('attempts'), unit_id) or 0)
+            if attempts >= self.max_attempts:
+                error = db.execute('HGET', self._key('errors'), unit_id)
+                db.transaction([
+                    ('ZREM', schedule, unit_id),
+                    ('DEL', self._token_key(unit_id)),
+                    ('HSET', self._key('failed'), unit_id,
+                     error.decode('utf-8') if error else expired_error(attempts)),
+                ])
+                continue
+            payload = db.execute('HGET', self._key('units'), unit_id)
+            token = uuid.uuid4().hex
+            replies = db.transaction([
+                ('ZADD', schedule, now + self.lease_seconds, unit_id),
+                ('SET', self._token_key(unit_id), token),
+                ('HINCRBY', self._key('attempts'), unit_id, 1),
+                ('HSET', self._key('workers'), unit_id, worker),
+            ])
+            if replies is not None:
+                return Lease(unit_id, json.loads(payload), token, attempts + 1)
+            # 其他worker同时领取或提交，重试
+
+    def _update_leased(self, lease, commands):
+        """令牌仍然属于这个租约时执行commands(接收当前时间，返回命令列表)"""
+        db = self._connection()
+        token_key = self._token_key(lease.unit_id)
+        while True:
+            db.execute('WATCH', token_key)
+            if db.execute('GET', token_key) != lease.token.encode():
+                db.execute('UNWATCH')
+                return False
+            if db.transaction(commands(self._now(db))) is not None:
+                return True
+
+    def extend(self, lease):
+        return self._update_leased(lease, lambda now: [
+            ('ZADD', self._key('schedule'), 'XX', now + self.lease_seconds, lease.unit_id)])
+
+    def complete(self, lease, result=None):
+        return self._update_leased(lease, lambda now: [
+            ('ZREM', self._key('schedule'), lease.unit_id),
+            ('DEL', self._token_key(lease.unit_id)),
+            ('HSET', self._key('results'), lease.unit_id, json.dumps(result, ensure_ascii=False)),
+        ])
+
+    def fail(self, lease, error, retry_delay=0.0):
+        if lease.attempt >= self.max_attempts:
+            return self._update_leased(lease, lambda now: [
+                ('ZREM', self._key('schedule'), lease.unit_id),
+                ('DEL', self._token_key(lease.unit_id)),
+                ('HSET', self._key('failed'), lease.unit_id, error),
+            ])
+        return self._update_leased(lease, lambda now: [
+            ('ZADD', self._key('schedule'), 'XX', now + retry_delay, lease.unit_id),
+            ('DEL', self._token_key(lease.unit_id)),
+            ('HSET', self._key('errors'), lease.unit_id, error),
+        ])
+
+    def release(self, lease):
+        return self._update_leased(lease, lambda now: [
+            ('ZADD', self._key('schedule'), 'XX', now, lease.unit_id),
+            ('DEL', self._token_key(lease.unit_id)),
+            ('HINCRBY', self._key('attempts'), lease.unit_id, -1),
+        ])
+
+    def status(self):
+        db = self._connection()
+        now = self._now(db)
+        queued, pending, done, failed = db.pipeline([
+            ('ZCARD', self._key('schedule')),
+            ('ZCOUNT', self._key('schedule'), '-inf', now),
+            ('HLEN', self._key('results')),
+            ('HLEN', self._key('failed')),
+        ])
+        return QueueStatus(pending, queued - pending, done, failed)
+
+    def _hash(self, name):
+        values = self._connection().execute('HGETALL', self._key(name))
+        return {values[i].decode('utf-8'): values[i + 1].decode('utf-8') for i in range(0, len(values), 2)}
+
+    def results(self):
+        return {unit_id: json.loads(result) for unit_id, result in self._hash('results').items()}
+
+    def failures(self):
+        return self._hash('failed')
+
+    def clear(self):
+        db = self._connection()
+        unit_ids = [unit_id.decode('utf-8') for unit_id in db.execute('HKEYS', self._key('units'))]
+        keys = [self._key(name) for name in ('units', 'schedule', 'attempts', 'errors', 'workers', 'results', 'failed')]
+        db.execute('DEL', *keys, *[self._token_key(unit_id) for unit_id in unit_ids])
+
+
+def open_queue(spec, name, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """按 sqlite:<路径> 或 redis://... 创建队列"""
+    if spec.startswith('sqlite:'):
+        return SQLiteQueue(spec[len('sqlite:'):], name, lease_seconds, max_attempts)
+    if spec.startswith('redis://'):
+        return RedisQueue(spec, name, lease_seconds, max_attempts)
+    raise ValueError(f"未知的队列地址: {spec} (应为 sqlite:<路径> 或 redis://主机:端口/库)")
+
+
+# ---- RESP替身服务 ----
+
+class RespStandIn:
+    """
+    内存中的Redis替身，只实现队列用到的字符串/hash/有序集合命令和WATCH/MULTI/EXEC；
+    全部命令在一把锁下串行执行，每个键带有版本号用于WATCH
+    """
+
+    def __init__(self):
+        self.data = {}
+        self.versions = {}
+        self.lock = threading.Lock()
+
+    def _touch(self, key):
+        self.versions[key] = self.versions.get(key, 0) + 1
+
+    def _get(self, key, kind):
+        value = self.data.get(key)
+        if value is not None and not isinstance(value, kind):
+            raise RespError('WRONGTYPE Operation against a key holding the wrong kind of value')
+        return value
+
+    def _container(self, key, kind):
+        value = self._get(key, kind)
+        if value is None:
+            value = self.data[key] = kind()
+        return value
+
+    def _cleanup(self, key):
+        if key in self.data and not self.data[key]:
+            del self.data[key]
+
+    def execute(self, name, args):
+        """执行一条命令(调用方持有锁)，返回回复对象"""
+        handler = getattr(self, f"cmd_{name.lower()}", None)
+        if handler is None:
+            return RespError(f"ERR unknown command '{name}'")
+        try:
+            return handler(*args)
+        except TypeError:
+            return RespError(f"ERR wrong number of arguments for '{name.lower()}' command")
+        except (RespError, ValueError) as e:
+            return e if isinstance(e, RespError) else RespError('ERR value is not a valid float or integer')
+
+    def cmd_ping(self, *args):
+        return args[0] if args else SimpleString('PONG')
+
+    def cmd_select(self, db):
+        return SimpleString('OK')
+
+    def cmd_auth(self, *args):
+        return SimpleString('OK')
+
+    def cmd_time(self):
+        now = time.time()
+        return [str(int(now)).encode(), str(int(now % 1 * 1e6)).encode()]
+
+    def cmd_get(self, key):
+        return self._get(key, bytes)
+
+    def cmd_set(self, key, value):
+        self.data[key] = value
+        self._touch(key)
+        return SimpleString('OK')
+
+    def cmd_del(self, *keys):
+        deleted = 0
+        for key in keys:
+            if self.data.pop(key, None) is not None:
+                self._touch(key)
+                deleted += 1
+        return deleted
+
+    def cmd_hget(self, key, field):
+        return (self._get(key, dict) or {}).get(field)
+
+    def cmd_hset(self, key, *pairs):
+        if not pairs or len(pairs) % 2:
+            raise TypeError
+        value = self._container(key, dict)
+        added = sum(1 for field in pairs[::2] if field not in value)
+        value.update(zip(pairs[::2], pairs[1::2]))
+        self._touch(key)
+        return added
+
+    def cmd_hdel(self, key, *fields):
+        value = self._get(key, dict) or {}
+        deleted = sum(1 for field in fields if value.pop(field, None) is not None)
+        if deleted:
+            self._cleanup(key)
+            self._touch(key)
+        return deleted
+
+    def cmd_hincrby(self, key, field, increment):
+        value = self._container(key, dict)
+        number = int(value.get(field, b'0')) + int(increment)
+        value[field] = str(number).encode()
+        self._touch(key)
+        return number
+
+    def cmd_hlen(self, key):
+        return len(self._get(key, dict) or {})
+
+    def cmd_hkeys(self, key):
+        return list(self._get(key, dict) or {})
+
+    def cmd_hgetall(self, key):
+        return [item for pair in (self._get(key, dict) or {}).items() for item in pair]
+
+    def cmd_zadd(self, key, *args):
+        flags = set()
+        while args and args[0].upper() in (b'XX', b'NX'):
+            flags.add(args[0].upper())
+            args = args[1:]
+        if not args or len(args) % 2:
+            raise TypeError
+        value = self._container(key, dict)
+        added = 0
+        for score, member in zip(args[::2], args[1::2]):
+            exists = member in value
+            if (b'XX' in flags and not exists) or (b'NX' in flags and exists):
+                continue
+            added += not exists
+            value[member] = float(score)
+        self._cleanup(key)
+        self._touch(key)
+        return added
+
+    def cmd_zrem(self, key, *members):
+        value = self._get(key, dict) or {}
+        removed = sum(1 for member in members if value.pop(member, None) is not None)
+        if removed:
+            self._cleanup(key)
+            self._touch(key)
+        return removed
+
+    def cmd_zcard(self, key):
+        return len(self._get(key, dict) or {})
+
+    def cmd_zcount(self, key, low, high):
+        low, high = float(low), float(high)
+        return sum(1 for score in (self._get(key, dict) or {}).values() if low <= score <= high)
+
+    def cmd_zrangebyscore(self, key, low, high, *options):
+        low, high = float(low), float(high)
+        members = sorted(((score, member) for member, score in (self._get(key, dict) or {}).items()
+                          if low <= score <= high))
+        options = [option.upper() if isinstance(option, bytes) else option for option in options]
+        if b'LIMIT' in options:
+            index = options.index(b'LIMIT')
+            offset, count = int(options[index + 1]), int(options[index + 2])
+            members = members[offset:offset + count] if count >= 0 else members[offset:]
+        if b'WITHSCORES' in options:
+            return [item for score, member in members for item in (member, repr(score).encode())]
+        return [member for _, member in members]
+
+
+class RespRequestHandler(socketserver.StreamRequestHandler):
+    """一条客户端连接：解析命令数组，维护该连接的WATCH和MULTI状态"""
+    store = None
+    # 回复很小，不关闭Nagle时会和客户端的延迟确认叠加成每条命令约40毫秒
+    disable_nagle_algorithm = True
+
+    def handle(self):
+        watched, queued = {}, None
+        while True:
+            try:
+                command = read_reply(self.rfile)
+            except (ConnectionError, ValueError, OSError):
+                return
+            if not isinstance(command, list) or not command:
+                return
+            name, args = command[0].decode().upper(), command[1:]
+            store = self.store
+            with store.lock:
+                if name == 'MULTI':
+                    queued, reply = [], SimpleString('OK')
+                elif name == 'DISCARD':
+                    queued, watched, reply = None, {}, SimpleString('OK')
+                elif name == 'EXEC':
+                    if queued is None:
+                        reply = RespError('ERR EXEC without MULTI')
+                    elif any(store.versions.get(key, 0) != version for key, version in watched.items()):
+                        reply = None
+                    else:
+                        reply = [store.execute(queued_name, queued_args) for queued_name, queued_args in queued]
+                    queued, watched = None, {}
+                elif queued is not None:
+                    queued.append((name, args))
+                    reply = SimpleString('QUEUED')
+                elif name == 'WATCH':
+                    watched.update({key: store.versions.get(key, 0) for key in args})
+                    reply = SimpleString('OK')
+                elif name == 'UNWATCH':
+                    watched, reply = {}, SimpleString('OK')
+                else:
+                    reply = store.execute(name, args)
+            try:
+                self.wfile.write(encode_reply(reply))
+            except OSError:
+                return
+
+
+def encode_reply(reply):
+    if reply is None:
+        return b'$-1\r\n'
+    if isinstance(reply, RespError):
+        return f"-{reply}\r\n".encode()
+    if isinstance(reply, SimpleString):
+        return f"+{reply}\r\n".encode()
+    if isinstance(reply, int):
+        return f":{reply}\r\n".encode()
+    if isinstance(reply, list):
+        return f"*{len(reply)}\r\n".encode() + b''.join(encode_reply(item) for item in reply)
+    data = reply if isinstance(reply, bytes) else str(reply).encode('utf-8')
+    return b'$%d\r\n%s\r\n' % (len(data), data)
+
+
+def create_stand_in(host='127.0.0.1', port=DEFAULT_REDIS_PORT):
+    """创建RESP替身服务器(ThreadingTCPServer)，serve_forever()开始服务"""
+    handler = type('BoundRespRequestHandler', (RespRequestHandler,), {'store': RespStandIn()})
+    server_class = type('RespServer', (socketserver.ThreadingTCPServer,),
+                        {'daemon_threads': True, 'allow_reuse_address': True})
+    return server_class((host, port), handler)
+
+
+def print_status(queue):
+    status = queue.status()
+    total = sum(status)
+    print(f"队列 {queue.name}: 共 {total} 个单元，等待 {status.pending}，处理中 {status.leased}，"
+          f"完成 {status.done}，失败 {status.failed}")
+    for unit_id, error in sorted(queue.failures().items()):
+        print(f"  ✗ {unit_id}: {error}")
+
+
+def main():
+    """主函数"""
+    import argparse
+
+    parser = argparse.ArgumentParser(description='租约式工作队列：查看/清空队列，或启动内置的Redis替身服务')
+    parser.add_argument('--queue', type=str, default=DEFAULT_QUEUE, help=f'队列地址 (默认: {DEFAULT_QUEUE})')
+    parser.add_argument('--name', type=str, default='tts', help='队列名称 (默认: tts)')
+    parser.add_argument('--status', action='store_true', help='显示队列状态和失败的单元')
+    parser.add_argument('--clear', action='store_true', help='删除队列中的全部单元')
+    parser.add_argument('--serve', action='store_true', help='启动内存中的RESP(Redis兼容)替身服务')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='替身服务监听地址 (默认: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=DEFAULT_REDIS_PORT,
+                        help=f'替身服务监听端口 (默认: {DEFAULT_REDIS_PORT})')
+    args = parser.parse_args()
+
+    if args.serve:
+        server = create_stand_in(args.host, args.port)
+        print(f"RESP替身服务已启动: redis://{args.host}:{args.port}/0 (数据只保存在内存中)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print("\n正在停止服务...")
+        finally:
+            server.server_close()
+        return
+
+    queue = open_queue(args.queue, args.name)
+    if args.clear:
+        queue.clear()
+        print(f"已清空队列 {args.name}")
+    else:
+        print_status(queue)
+
+
+if __name__ == "__main__":
+    main()
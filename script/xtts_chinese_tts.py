@@ -11,6 +11,11 @@ import json
 import time
 from pathlib import Path
 
+from pipeline_metrics import add_metrics_arguments, get_metrics, metrics_session
+from tts_backends import ENGINES, RemoteBackend, create_backend, resolve_engine
+from tts_pipeline import DEFAULT_QUEUE_DEPTH, DEFAULT_REMOTE_WORKERS, DEFAULT_WRITERS, SynthesisJob, run_tts_jobs
+from wav_info import WavFormatError, read_wav_info
+
 def check_xtts_available():
     """检查XTTS模型是否可用"""
     print("检查XTTS模型可用性...")
@@ -132,6 +137,7 @@ def generate_chinese_audio(text, speaker_id, output_path, language='zh-cn'):
         end_time = time.time()
 
         generation_time = end_time - start_time
+        get_metrics().observe('synthesis', generation_time)
 
         if result.returncode == 0:
             print(f"✓ 成功生成: {output_path}")
@@ -142,18 +148,12 @@ def generate_chinese_audio(text, speaker_id, output_path, language='zh-cn'):
                 file_size = os.path.getsize(output_path)
                 print(f"  文件大小: {file_size:,} bytes ({file_size/1024/1024:.1f} MB)")
 
-                # 尝试获取音频时长
+                # 直接读取WAV文件头获取时长，不再启动ffprobe进程
                 try:
-                    duration_cmd = ['ffprobe', '-v', 'error', '-show_entries',
-                                   'format=duration', output_path]
-                    duration_result = subprocess.run(duration_cmd, capture_output=True, text=True, timeout=10)
-                    if duration_result.returncode == 0:
-                        for line in duration_result.stdout.split('\n'):
-                            if 'Duration:' in line:
-                                print(f"  音频时长: {line.strip()}")
-                                break
-                except:
-                    pass
+                    info = read_wav_info(output_path)
+                    print(f"  音频时长: {info.duration_ms / 1000:.2f} 秒 ({info.sample_rate} Hz, {info.channels} 声道)")
+                except (OSError, WavFormatError) as e:
+                    print(f"  无法读取音频时长: {e}")
 
             return True
         else:
@@ -167,8 +167,19 @@ def generate_chinese_audio(text, speaker_id, output_path, language='zh-cn'):
         print(f"✗ 生成出错 (说话人: {speaker_id}): {str(e)}")
         return False
 
-def batch_generate_chinese_audio():
-    """批量生成中文音频样本"""
+def safe_output_filename(text, prefix):
+    """由文本生成安全的文件名"""
+    safe_text = text.replace(" ", "_").replace("。", "").replace("，", "").replace("！", "")
+    safe_text = safe_text.replace("？", "").replace("：", "").replace("；", "")[:20]
+    return f"xtts_chinese_{prefix}_{safe_text}.wav"
+
+def batch_generate_chinese_audio(engine='auto', speaker='1', writers=DEFAULT_WRITERS,
+                                 queue_depth=DEFAULT_QUEUE_DEPTH, server=None, fork_workers=0, calibrate=False):
+    """
+    批量生成中文音频样本；指定server时使用tts_server.py中已加载的模型，
+    指定fork_workers时模型只加载一次，由多个fork出的进程共享权重并行合成；
+    engine为auto时使用tts_calibrate.py在本机测得的最快合格后端，calibrate为True时重新测量
+    """
     # 中文测试文本
     chinese_texts = [
         "你好，这是XTTS中文语音测试。",
@@ -191,23 +202,33 @@ def batch_generate_chinese_audio():
         "欢迎来到中国！"
     ]
 
-    # 等待XTTS下载完成
-    if not check_xtts_available():
-        print("XTTS模型正在下载中，请稍后再试...")
-        if not wait_for_xtts_download():
-            print("XTTS模型下载失败，无法继续。")
-            return
-
-    # 获取说话人列表
-    speakers = get_xtts_speakers()
-    if not speakers:
-        print("无法获取说话人列表，使用默认说话人ID")
-        speakers = ['1']
-
-    print(f"可用说话人: {', '.join(speakers)}")
-
-    # 选择说话人（如果用户指定的话）
-    speaker_to_use = speakers[0] if speakers else '1'
+    calibrated = None
+    if engine == 'auto' and not (server or fork_workers):
+        from tts_calibrate import calibrated_backend
+        calibrated = calibrated_backend('cn', recalibrate=calibrate)
+    backend_name = calibrated or 'xtts'
+    engine = 'api' if server or fork_workers or calibrated else resolve_engine(engine)
+    if engine == 'cli':
+        # 等待XTTS下载完成
+        if not check_xtts_available():
+            print("XTTS模型正在下载中，请稍后再试...")
+            if not wait_for_xtts_download():
+                print("XTTS模型下载失败，无法继续。")
+                return
+
+        # 获取说话人列表
+        speakers = get_xtts_speakers()
+        if not speakers:
+            print("无法获取说话人列表，使用默认说话人ID")
+            speakers = ['1']
+
+        print(f"可用说话人: {', '.join(speakers)}")
+
+        # 选择说话人（如果用户指定的话）
+        speaker_to_use = speakers[0] if speakers else '1'
+    else:
+        # 说话人由模型内置的列表解析
+        speaker_to_use = speaker
     print(f"使用说话人: {speaker_to_use}")
 
     # 创建输出目录
@@ -224,24 +245,51 @@ def batch_generate_chinese_audio():
     failed_files = []
 
     # 批量生成
-    for i, text in enumerate(chinese_texts, 1):
-        print(f"[{i}/{len(chinese_texts)}] 处理文本: '{text}'")
+    metrics = get_metrics()
+    with metrics.stage('synthesis'):
+        if engine == 'api':
+            # 模型只加载一次，合成和写文件在不同线程中流水进行
+            fork_server = None
+            if server:
+                print(f"合成方式: TTS服务 {server} (写入线程: {writers}, 队列深度: {queue_depth})")
+                backend_factory, synthesis_workers = (lambda: RemoteBackend(server)), DEFAULT_REMOTE_WORKERS
+            elif fork_workers:
+                from fork_server import ForkServer
+                print(f"合成方式: Fork-server {fork_workers} 个合成进程 (写入线程: {writers}, 队列深度: {queue_depth})")
+                fork_server = ForkServer(lambda: create_backend('xtts', 'cn', speaker_to_use), fork_workers).start()
+                backend_factory, synthesis_workers = fork_server.worker_backend, fork_workers
+            else:
+                print(f"合成方式: TTS Python API {backend_name} (写入线程: {writers}, 队列深度: {queue_depth})")
+                backend_factory, synthesis_workers = (lambda: create_backend(backend_name, 'cn', speaker_to_use)), 1
+            jobs = [SynthesisJob(text, str(output_dir / safe_output_filename(text, i)), speaker_to_use, 'zh-cn')
+                    for i, text in enumerate(chinese_texts, 1)]
+            try:
+                success_count, failed = run_tts_jobs(backend_factory, jobs, synthesis_workers,
+                                                     writers=writers, queue_depth=queue_depth)
+                if fork_server:
+                    fork_server.print_memory_report()
+            finally:
+                if fork_server:
+                    fork_server.stop()
+            failed_files = [os.path.basename(result['output_path']) for result in failed]
+        else:
+            for i, text in enumerate(chinese_texts, 1):
+                print(f"[{i}/{len(chinese_texts)}] 处理文本: '{text}'")
 
-        # 创建安全的文件名
-        safe_text = text.replace(" ", "_").replace("。", "").replace("，", "").replace("！", "")
-        safe_text = safe_text.replace("？", "").replace("：", "").replace("；", "")[:20]
-        output_filename = f"xtts_chinese_{i}_{safe_text}.wav"
-        output_path = output_dir / output_filename
+                output_filename = safe_output_filename(text, i)
+                output_path = output_dir / output_filename
 
-        if generate_chinese_audio(text, speaker_to_use, str(output_path)):
-            success_count += 1
-        else:
-            failed_files.append(output_filename)
+                if generate_chinese_audio(text, speaker_to_use, str(output_path)):
+                    success_count += 1
+                    metrics.add_items('synthesis')
+                else:
+                    failed_files.append(output_filename)
+                    metrics.incr('synthesis_failed')
 
-        print("")  # 空行分隔
+                print("")  # 空行分隔
 
-        # 避免过热，稍作等待
-        time.sleep(2)
+                # 避免过热，稍作等待
+                time.sleep(2)
 
     # 输出总结
     print("=" * 60)
@@ -254,9 +302,7 @@ def batch_generate_chinese_audio():
 
         # 列出成功生成的文件
         for i, text in enumerate(chinese_texts, 1):
-            safe_text = text.replace(" ", "_").replace("。", "").replace("，", "").replace("！", "")
-            safe_text = safe_text.replace("？", "").replace("：", "").replace("；", "")[:20]
-            filename = f"xtts_chinese_{i}_{safe_text}.wav"
+            filename = safe_output_filename(text, i)
             full_path = output_dir / filename
 
             if os.path.exists(full_path):
@@ -277,7 +323,7 @@ def batch_generate_chinese_audio():
     print(f"\n使用建议:")
     print("1. 播放生成的音频文件，听一下XTTS的中文发音效果")
     print("2. XTTS的中文质量非常高，非常适合你的闪卡项目")
-    "3. 可以调整说话人ID获得不同的声音效果")
+    print("3. 可以调整说话人ID获得不同的声音效果")
     print("4. 适合用于教学和语言学习应用")
 
 def single_generate_chinese(text, speaker_id='1', language='zh-cn'):
@@ -294,10 +340,7 @@ def single_generate_chinese(text, speaker_id='1', language='zh-cn'):
     output_dir.mkdir(exist_ok=True)
 
     # 创建安全的文件名
-    safe_text = text.replace(" ", "_").replace("。", "").replace("，", "").replace("！", "")
-    safe_text = safe_text.replace("？", "").replace("：", "").replace("；", "")[:20]
-    timestamp = int(time.time())
-    output_filename = f"xtts_chinese_{timestamp}_{safe_text}.wav"
+    output_filename = safe_output_filename(text, int(time.time()))
     output_path = output_dir / output_filename
 
     print(f"正在生成中文音频: '{text}' (说话人: {speaker_id})")
@@ -319,6 +362,18 @@ def main():
     parser.add_argument('--language', type=str, default='zh-cn', help='语言代码 (默认: zh-cn)')
     parser.add_argument('--batch', action='store_true', help='批量生成测试音频')
     parser.add_argument('--output', type=str, help='输出文件路径')
+    parser.add_argument('--engine', choices=ENGINES, default='auto',
+                        help='批量模式的合成方式: api为进程内流水线，cli为逐个调用tts命令 (默认: auto)')
+    parser.add_argument('--writers', type=int, default=DEFAULT_WRITERS,
+                        help=f'写文件线程数 (默认: {DEFAULT_WRITERS})')
+    parser.add_argument('--queue-depth', type=int, default=DEFAULT_QUEUE_DEPTH,
+                        help=f'合成结果队列深度，限制内存中的音频条数 (默认: {DEFAULT_QUEUE_DEPTH})')
+    parser.add_argument('--server', type=str, help='批量模式使用tts_server.py服务合成，例如 http://127.0.0.1:5002')
+    parser.add_argument('--fork-workers', type=int, default=0,
+                        help='批量模式fork出的合成进程数，进程间以写时复制共享模型权重 (默认: 0，不使用)')
+    parser.add_argument('--calibrate', action='store_true',
+                        help='批量模式重新测量各TTS后端在本机上的速度和质量，--engine auto时使用最快的合格后端')
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
 
@@ -329,11 +384,14 @@ def main():
 
     if args.batch:
         # 批量生成模式
-        batch_generate_chinese_audio()
+        with metrics_session('xtts_chinese_tts', args.metrics, args.profile):
+            batch_generate_chinese_audio(args.engine, args.speaker, args.writers, args.queue_depth, args.server,
+                                         args.fork_workers, args.calibrate)
     elif args.text:
         # 单个生成模式
         output_path = args.output or None
-        result = single_generate_chinese(args.text, args.speaker, args.language)
+        with metrics_session('xtts_chinese_tts', args.metrics, args.profile):
+            result = single_generate_chinese(args.text, args.speaker, args.language)
         if result:
             print(f"音频已生成: {result}")
     else:
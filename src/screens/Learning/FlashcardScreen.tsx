@@ -121,19 +121,25 @@ const getWordsByCategory = (categoryId: string): Word[] => {
     return [];
   }
 
-  return category.images.map((imageData, index) => ({
-    id: `${categoryId}_${index}`,
-    filename: imageData.filename || `${categoryId}_${index}.png`,
-    word: {
-      en: imageData.word?.en || 'Unknown',
-      zh: imageData.word?.cn || '未知'
-    },
-    voiceFilename: {
-      en: imageData.voice_filename?.en || `${categoryId}_${index}_en.wav`,
-      zh: imageData.voice_filename?.cn || `${categoryId}_${index}_cn.wav`
-    },
-    category: categoryId
-  }));
+  return category.images.map((imageData, index) => {
+    // 拼音和声调由annotate_pinyin.py写入，未标注的卡组中没有这两个字段
+    const word: { en?: string; cn?: string; pinyin?: string; tones?: number[] } | undefined = imageData.word;
+    return {
+      id: `${categoryId}_${index}`,
+      filename: imageData.filename || `${categoryId}_${index}.png`,
+      word: {
+        en: word?.en || 'Unknown',
+        zh: word?.cn || '未知',
+        pinyin: word?.pinyin,
+        tones: word?.tones
+      },
+      voiceFilename: {
+        en: imageData.voice_filename?.en || `${categoryId}_${index}_en.wav`,
+        zh: imageData.voice_filename?.cn || `${categoryId}_${index}_cn.wav`
+      },
+      category: categoryId
+    };
+  });
 };
 
 export const FlashcardScreen: React.FC = () => {
@@ -26,6 +26,8 @@ export interface Word {
   word: {
     en: string;
     zh: string;
+    pinyin?: string;
+    tones?: number[];
   };
   voiceFilename: {
     en: string;
@@ -2,6 +2,9 @@ import { defineConfig } from 'vite';
 import react from '@vitejs/plugin-react';
 import { resolve } from 'path';
 
+// 设置 ASSET_SERVER=http://127.0.0.1:8080 时，/images 和 /audio 代理到 script/asset_server.py
+const assetServer = process.env.ASSET_SERVER;
+
 export default defineConfig({
   plugins: [react()],
   resolve: {
@@ -35,6 +38,7 @@ export default defineConfig({
   server: {
     port: 3000,
     open: true,
+    proxy: assetServer ? { '/images': assetServer, '/audio': assetServer } : undefined,
   },
   optimizeDeps: {
     include: [